@@ -2,6 +2,9 @@ from telegram import Update
 from telegram.ext import CallbackContext
 
 from LLMs.orchestration import other_message_pro, handle_goal_classification
+from LLMs.telemetry import llm_telemetry
+from telegram_helpers.delete_message import add_delete_button
+from utils.environment_vars import ENV_VARS
 from leftovers.commands import logger
 
 
@@ -16,3 +19,28 @@ async def smarter_command(update: Update, context: CallbackContext):
     """
     logger.warning("triggered /smarter")
     await handle_goal_classification(update, context, smarter=True)
+
+
+async def llmstats_command(update: Update, context: CallbackContext):
+    """
+    Latency and token spend per chain, from the LLM call telemetry. Approved users only.
+    /llmstats          — last 24 hours
+    /llmstats <hours>  — custom window
+    """
+    if update.effective_user.id not in ENV_VARS.APPROVED_USER_IDS:
+        await update.message.reply_text("🚫 This command is restricted.")
+        return
+    try:
+        hours = float(context.args[0]) if context.args else 24
+        if hours <= 0:
+            raise ValueError
+    except ValueError:
+        await update.message.reply_text("Usage: /llmstats [hours]\nExample: /llmstats 168")
+        return
+    try:
+        await llm_telemetry.flush()
+        sent = await update.message.reply_text(await llm_telemetry.report(hours))
+        await add_delete_button(update, context, sent.message_id)
+    except Exception as e:
+        logger.error(f"Error in llmstats_command: {e}")
+        await update.message.reply_text(f"Couldn't build the LLM stats: {e}")
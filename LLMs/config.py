@@ -23,33 +23,11 @@ from LLMs.structured_output_schemas import (
     CompactSchedule,
     CompactPlanning,
 )
-from LLMs.prompts_templates import (
-    dummy_template,
-    initial_classification_template,
-    goal_classification_template,
-    goal_valuation_template,
-    recurring_goal_valuation_template,
-    recurring_goal_split_template,
-    translation_template,
-    translations_template,
-    goal_setting_analysis_template,
-    language_correction_template,
-    translation_template,
-    recurring_schedule_template,
-    one_time_schedule_template,
-    language_check_template,
-    find_goal_id_template,
-    prepare_goal_changes_template,
-    diary_header_template,
-    reminder_setting_template,
-    other_template,
-    wassup_flow_template,
-    compact_one_time_template,
-    compact_recurring_template,
-    grandpa_quote_template,
-)
 
-from langchain_openai import ChatOpenAI
+import asyncio
+import importlib
+import time
+from LLMs.router import DEFAULT_LATENCY_BUDGET
 from utils.environment_vars import ENV_VARS
 import logging
 
@@ -64,208 +42,318 @@ LOW = 0.2
 MID = 0.7
 HIGH = 1.2
 
-llms = {
-    "smart": ChatOpenAI(model_name="gpt-5.2", temperature=1),
-    "mini": ChatOpenAI(model_name="gpt-5-mini", temperature=1),
-    "gpt4o_high_temp": ChatOpenAI(model_name="gpt-5.2", temperature=1),
-    "mini_high_temp": ChatOpenAI(model_name="gpt-5-mini", temperature=1),
-    "o3-mini": ChatOpenAI(model_name="o3-mini", temperature=1),
-    "smartest": ChatOpenAI(model_name="gpt-5.2-pro", temperature=1),
+# LLM clients are only constructed when first used (see LazyLLMs); these are their ChatOpenAI arguments
+LLM_SPECS = {
+    "smart": dict(model_name="gpt-5.2", temperature=1, stream_usage=True),   # token counts for streamed agent turns
+    "mini": dict(model_name="gpt-5-mini", temperature=1),
+    "gpt4o_high_temp": dict(model_name="gpt-5.2", temperature=1),
+    "mini_high_temp": dict(model_name="gpt-5-mini", temperature=1),
+    "o3-mini": dict(model_name="o3-mini", temperature=1),
+    "smartest": dict(model_name="gpt-5.2-pro", temperature=1),
 }
 
 # OpenRouter: model-switching without code changes (configure preset at openrouter.ai)
 if ENV_VARS.OPENROUTER_API_KEY:
-    llms["openrouter_fast"] = ChatOpenAI(
+    LLM_SPECS["openrouter_fast"] = dict(
         model_name="@preset/manon-fast",
         base_url="https://openrouter.ai/api/v1",
         api_key=ENV_VARS.OPENROUTER_API_KEY,
         temperature=1,
     )
-    llms["openrouter_smart"] = ChatOpenAI(
+    LLM_SPECS["openrouter_smart"] = dict(
         model_name="@preset/manon-smart",
         base_url="https://openrouter.ai/api/v1",
         api_key=ENV_VARS.OPENROUTER_API_KEY,
         temperature=1,
+        stream_usage=True,
     )
-    logger.info(f"✅ OpenRouter LLMs created: {[k for k in llms if k.startswith('openrouter_')]}")
+    logger.info(f"✅ OpenRouter LLMs configured: {[k for k in LLM_SPECS if k.startswith('openrouter_')]}")
 else:
     logger.warning("⚠️ OPENROUTER_API_KEY not set — OpenRouter LLMs not created")
 
+
+class LazyLLMs(dict):
+    """
+    The `llms` mapping: a ChatOpenAI client is constructed on first access and then reused. Importing langchain_openai
+    and building the clients costs a noticeable part of startup, and most of them aren't needed until a message arrives.
+    """
+
+    def __init__(self, specs):
+        super().__init__()
+        self.specs = specs
+
+    def __missing__(self, name):
+        if name not in self.specs:
+            raise KeyError(name)
+        from langchain_openai import ChatOpenAI
+        llm = ChatOpenAI(**self.specs[name])
+        self[name] = llm
+        return llm
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    def __contains__(self, name):
+        return dict.__contains__(self, name) or name in self.specs
+
+
+llms = LazyLLMs(LLM_SPECS)
+
+# Response cache (LLMs/response_cache.py): opt in per chain with "cache_ttl" (seconds), for chains whose output only
+# depends on their formatted prompt. A prompt with the current time in it never repeats, so such a chain also needs
+# "cache_key_vars": {variable: normalizer} to key on e.g. only the date instead (the LLM still gets the full prompt).
+CACHE_DAY = 24 * 60 * 60
+CACHE_LONG = 30 * 24 * 60 * 60
+
+
+def date_only(now: str) -> str:
+    """'2025-03-14 09:26:53' -> '2025-03-14', for cache_key_vars"""
+    return now[:10]
+
+# Router (LLMs/router.py): "latency_budget" (seconds) is how long a chain may take across all its routes, hedges
+# included, before it's given up on. Defaults to DEFAULT_LATENCY_BUDGET.
+FAST_BUDGET = 20
+
 # Centralized Chain Configuration
 chain_configs = {
     "dummy_chain_name": {
-        "template": dummy_template,
+        "template": "dummy_template",
         "schema": DummyClass,
-        "llm": llms["mini"],  # or llms["gpt4o"], llms["mini_high_temp"] etc.
+        "llm": "mini",  # or "smart", "mini_high_temp" etc.
     },
     "initial_classification": {
-        "template": initial_classification_template,
+        "template": "initial_classification_template",
         "schema": InitialClassification,
-        "llm": llms["mini"], 
+        "llm": "mini", 
+        "latency_budget": FAST_BUDGET,
     },
     "goal_classification": {
-        "template": goal_classification_template,
+        "template": "goal_classification_template",
         "schema": GoalClassification,
-        "llm": llms["mini"],
+        "llm": "mini",
+        "latency_budget": FAST_BUDGET,
     },
     "goal_classification_smart": {
-        "template": goal_classification_template,
+        "template": "goal_classification_template",
         "schema": GoalClassification,
-        "llm": llms["smart"],
+        "llm": "smart",
     },
     "goal_setting_analysis": {
-        "template": goal_setting_analysis_template,
+        "template": "goal_setting_analysis_template",
         "schema": SetGoalAnalysis,
-        "llm": llms["mini"],
+        "llm": "mini",
     },
     "goal_setting_analysis_smart": {
-        "template": goal_setting_analysis_template,
+        "template": "goal_setting_analysis_template",
         "schema": SetGoalAnalysis,
-        "llm": llms["smart"],
+        "llm": "smart",
     },
     "goal_valuation": {
-        "template": goal_valuation_template,
+        "template": "goal_valuation_template",
         "schema": GoalAssessment,
-        "llm": llms["mini"],  # or llms["gpt4o"], llms["mini_high_temp"] etc.
+        "llm": "mini",  # or "smart", "mini_high_temp" etc.
     },
     "goal_valuation_smart": {
-        "template": goal_valuation_template,
+        "template": "goal_valuation_template",
         "schema": GoalAssessment,
-        "llm": llms["smart"],
+        "llm": "smart",
     },
     "recurring_goal_valuation": {
-        "template": recurring_goal_valuation_template,
+        "template": "recurring_goal_valuation_template",
         "schema": GoalInstanceAssessment,
-        "llm": llms["mini"],  # or llms["gpt4o"], llms["mini_high_temp"] etc.
+        "llm": "mini",  # or "smart", "mini_high_temp" etc.
     },
     "recurring_goal_valuation_smart": {
-        "template": recurring_goal_valuation_template,
+        "template": "recurring_goal_valuation_template",
         "schema": GoalInstanceAssessment,
-        "llm": llms["smart"],  # or llms["gpt4o"], llms["mini_high_temp"] etc.
+        "llm": "smart",  # or "mini", "mini_high_temp" etc.
     },
      "schedule_goal": {
-        "template": one_time_schedule_template,
+        "template": "one_time_schedule_template",
         "schema": Schedule,
-        "llm": llms["mini"],
+        "llm": "mini",
     },
      "schedule_goal_smart": {
-        "template": one_time_schedule_template,
+        "template": "one_time_schedule_template",
         "schema": Schedule,
-        "llm": llms["smart"],
+        "llm": "smart",
     },
      "schedule_goals": {
-        "template": recurring_schedule_template,
+        "template": "recurring_schedule_template",
         "schema": Planning,
-        "llm": llms["mini"],
+        "llm": "mini",
     },
      "schedule_goals_smart": {
-        "template": recurring_schedule_template,
+        "template": "recurring_schedule_template",
         "schema": Planning,
-        "llm": llms["smart"],
+        "llm": "smart",
     },
     "language_correction": {
-        "template": language_correction_template,
+        "template": "language_correction_template",
         "schema": LanguageCorrection,
-        "llm": llms["smart"],
+        "llm": "smart",
     },
     "translations": {
-        "template": translations_template,
+        "template": "translations_template",
         "schema": Translations,
-        "llm": llms["smart"],
+        "llm": "smart",
+        "cache_ttl": CACHE_LONG,
     },
     "translation": {
-        "template": translation_template,
+        "template": "translation_template",
         "schema": Translation,
-        "llm": llms["smart"],
+        "llm": "smart",
+        "cache_ttl": CACHE_LONG,
     },
     "language_check": {
-        "template": language_check_template,
+        "template": "language_check_template",
         "schema": LanguageCheck,
-        "llm": llms["mini"],
+        "llm": "mini",
+        "cache_ttl": CACHE_LONG,
     },
     "find_goal_id": {
-        "template": find_goal_id_template,
+        "template": "find_goal_id_template",
         "schema": GoalID,
-        "llm": llms["mini"],
+        "llm": "mini",
     },
     "prepare_goal_changes": {
-        "template": prepare_goal_changes_template,
+        "template": "prepare_goal_changes_template",
         "schema": UpdatedGoalData,
-        "llm": llms["smart"],
+        "llm": "smart",
     },
     "diary_header": {
-        "template": diary_header_template,
+        "template": "diary_header_template",
         "schema": DiaryHeader,
-        "llm": llms["smart"],
+        "llm": "smart",
+        "cache_ttl": CACHE_DAY,
+        "cache_key_vars": {"now": date_only},    # relative dates ("next friday") only depend on the day
     },
     "reminder_setting": {
-        "template": reminder_setting_template,
+        "template": "reminder_setting_template",
         "schema": Reminder,
-        "llm": llms["mini"],
+        "llm": "mini",
     },
     "other": {
-        "template": other_template,
+        "template": "other_template",
         "schema": Response,
-        "llm": llms["gpt4o_high_temp"],
+        "llm": "gpt4o_high_temp",
     },
     "other_plus": {
-        "template": other_template,
+        "template": "other_template",
         "schema": Response,
-        "llm": llms["smartest"],
+        "llm": "smartest",
     },
     "wassup_flow_1": {
-        "template": wassup_flow_template,
+        "template": "wassup_flow_template",
         "schema": WassupSchema,
-        "llm": llms["mini"]
+        "llm": "mini"
     },
     # Compact pipeline: combined valuation + scheduling in one call
     # Uses OpenRouter preset when available, falls back to OpenAI mini/smart
     "compact_schedule": {
-        "template": compact_one_time_template,
+        "template": "compact_one_time_template",
         "schema": CompactSchedule,
-        "llm": llms.get("openrouter_fast", llms["mini"]),
+        "llm": "openrouter_fast",
     },
     "compact_schedule_smart": {
-        "template": compact_one_time_template,
+        "template": "compact_one_time_template",
         "schema": CompactSchedule,
-        "llm": llms["smart"],
+        "llm": "smart",
     },
     "compact_planning": {
-        "template": compact_recurring_template,
+        "template": "compact_recurring_template",
         "schema": CompactPlanning,
-        "llm": llms.get("openrouter_fast", llms["mini"]),
+        "llm": "openrouter_fast",
     },
     "compact_planning_smart": {
-        "template": compact_recurring_template,
+        "template": "compact_recurring_template",
         "schema": CompactPlanning,
-        "llm": llms["smart"],
+        "llm": "smart",
     },
     "grandpa_quote": {
-        "template": grandpa_quote_template,
+        "template": "grandpa_quote_template",
         "schema": Response,
-        "llm": llms.get("openrouter_smart", llms["smart"]),
+        "llm": "openrouter_smart",
     },
 
 }
 
-# Diagnostic: log which LLM the grandpa_quote chain resolved to
-_gq_llm = chain_configs["grandpa_quote"]["llm"]
-logger.info(f"🔍 grandpa_quote LLM resolved to: model={_gq_llm.model_name}, base_url={getattr(_gq_llm, 'openai_api_base', 'default')}")
+# Equivalent providers for LLMs/router.py: a chain on one of these gets the other as hedge/fallback route
+FALLBACK_LLMS = {
+    "openrouter_fast": "mini",
+    "mini": "openrouter_fast",
+    "openrouter_smart": "smart",
+    "smart": "openrouter_smart",
+}
+
+
+def _route(provider, schema):
+    llm = llms[provider]
+    return {
+        "provider": provider,
+        "chain": llm.with_structured_output(schema) if schema is not None else llm,
+        "model": getattr(llm, "model_name", None),
+        "base_url": getattr(llm, "openai_api_base", None),
+    }
 
 
 # Function to create chains
 def create_chain(config):
-    chain = {
-        "template": config["template"],
+    """
+    Build a chain from its chain_configs entry. "llm" names an llms key; when that LLM isn't configured (no OpenRouter
+    key) its FALLBACK_LLMS counterpart is used instead. Templates are looked up by name in LLMs/prompts_templates.py.
+    """
+    providers = [name for name in (config["llm"], FALLBACK_LLMS.get(config["llm"])) if name in llms]
+    if not providers:
+        raise KeyError(f"LLM '{config['llm']}' is not configured")
+    routes = [_route(provider, config.get("schema")) for provider in providers]
+
+    return {
+        "template": getattr(importlib.import_module("LLMs.prompts_templates"), config["template"]),
+        "schema": config.get("schema"),
+        "model": routes[0]["model"],
+        "base_url": routes[0]["base_url"],
+        "cache_ttl": config.get("cache_ttl"),
+        "cache_key_vars": config.get("cache_key_vars", {}),
+        "latency_budget": config.get("latency_budget", DEFAULT_LATENCY_BUDGET),
+        "routes": routes,
+        "chain": routes[0]["chain"],
     }
 
-    if "schema" in config and config["schema"] is not None:
-        chain["chain"] = config["llm"].with_structured_output(config["schema"])
-    else:
-        chain["chain"] = config["llm"].ainvoke
 
-    return chain
+class LazyChains(dict):
+    """The `chains` mapping: each chain is built on first use (or by warm_up_chains) and then cached."""
+
+    def __missing__(self, name):
+        if name not in chain_configs:
+            raise KeyError(name)
+        chain = create_chain(chain_configs[name])
+        self[name] = chain
+        logger.info(f"🔧 Chain '{name}' built: model={chain['model']}, base_url={chain['base_url'] or 'default'}, "
+                    f"routes={[route['provider'] for route in chain['routes']]}")
+        return chain
+
+    def get(self, name, default=None):
+        return self[name] if name in chain_configs else default
+
+
+chains = LazyChains()
+
+# Build all chains in the background shortly after startup, so the first messages don't pay for it
+WARM_UP_CHAINS = True
+WARM_UP_DELAY = 5   # seconds after setup, so polling is up first
+
+
+def _build_all_chains():
+    for name in chain_configs:
+        try:
+            chains[name]
+        except Exception as e:
+            logger.error(f"Couldn't build chain '{name}': {e}")
 
 
-# Generate Chains Dynamically
-chains = {name: create_chain(config) for name, config in chain_configs.items()}
\ No newline at end of file
+async def warm_up_chains(delay: float = WARM_UP_DELAY):
+    await asyncio.sleep(delay)
+    started = time.perf_counter()
+    await asyncio.to_thread(_build_all_chains)
+    logger.info(f"🔥 Warmed up {len(chains)} chains in {time.perf_counter() - started:.2f} s")
@@ -1,26 +1,30 @@
 ﻿# LLMs/orchestration.py
 from datetime import datetime, timedelta
 from httpx import Response
-from openai import OpenAI
 
 from telegram_helpers.get_user_message import get_user_message
 from utils.environment_vars import ENV_VARS
 from utils.helpers import BERLIN_TZ
 from telegram_helpers.emoji_reactions import safe_set_reaction
 from telegram_helpers.delete_message import delete_message, add_delete_button
+from telegram_helpers.message_streamer import TelegramMessageStreamer
 from utils.session_avatar import PA
 from features.goals.goals import send_goal_proposal, handle_goal_completion
 from features.goals.helpers import add_user_context_to_goals
-import logging, asyncio
+import logging, asyncio, time
 from utils.db import (
     fetch_goal_data,
-    fetch_long_term_goals,
-    fetch_active_goals_summary,
     create_limbo_goal,
     complete_limbo_goal,
     record_reminder,
 )
 from LLMs.config import chains, shared_state
+from LLMs.request_context import get_request_context
+from LLMs.speculation import Speculation
+from LLMs.preclassifier import preclassify, record_example
+from LLMs.response_cache import llm_response_cache
+from LLMs.telemetry import UsageCallback, llm_telemetry
+from LLMs.router import llm_router
 from LLMs.structured_output_schemas import (
     DummyClass,
     InitialClassification,
@@ -46,9 +50,29 @@ from LLMs.structured_output_schemas import (
 # Toggle between old (3-call) and new (2-call) compact goal pipeline
 COMPACT_PIPELINE = True
 
+# Speculative routing: start goal_classification (and optionally goal_setting_analysis) together with
+# initial_classification instead of after it. Whatever routing turns out not to need is cancelled.
+SPECULATIVE_CLASSIFICATION = True
+SPECULATE_GOAL_SETTING_ANALYSIS = False     # costs a wasted call for every non-'Set' goal message
+
+# Show the agent's final answer while it's being generated, by editing a placeholder message
+STREAM_AGENT_RESPONSES = True
+
+# /pro requests (gpt-5.2-pro) can take minutes; give up after this many seconds
+PRO_TIMEOUT_SECONDS = 300
+PRO_MODEL = "gpt-5.2-pro"
+
 logger = logging.getLogger(__name__)
 
-client_EC = OpenAI(api_key=ENV_VARS.EC_OPENAI_API_KEY)
+client_EC = None    # AsyncOpenAI client for /pro, created on first use by pro_client()
+
+
+def pro_client():
+    global client_EC
+    if client_EC is None:
+        from openai import AsyncOpenAI
+        client_EC = AsyncOpenAI(api_key=ENV_VARS.EC_OPENAI_API_KEY, timeout=PRO_TIMEOUT_SECONDS, max_retries=1)
+    return client_EC
 
 
 #########################################################################
@@ -76,59 +100,28 @@ def split_message(text: str, max_len: int = TG_MAX) -> list[str]:
 
 
 async def get_input_variables(update, context, source_text=None, target_language="English", goal_data=None):
-    now = datetime.now(tz=BERLIN_TZ)
-    weekday = now.strftime("%A")  # Full weekday name
-    tomorrow = (now + timedelta(days=1))
-    # Calculate the next Wednesday
-    days_until_wednesday = (2 - now.weekday() + 7) % 7  # 2 is Wednesday (0=Monday, 6=Sunday)
-    if days_until_wednesday == 0:  # If today is Wednesday, move to next week
-        days_until_wednesday = 7
-    next_wednesday = now + timedelta(days=days_until_wednesday)
-    # Set time to 12:00:00 for next Wednesday
-    next_wednesday_at_noon = next_wednesday.replace(hour=12, minute=0, second=0)
-
-    next_year = now.replace(year=now.year + 1)
-    user_id = update.effective_user.id
-    chat_id = update.effective_chat.id
-    first_name = update.effective_user.first_name
-    bot_name = update.get_bot().username
-    default_deadline_time = "22:22"
-    default_reminder_time = "11:11"
-    long_term_goals = await fetch_long_term_goals(chat_id, user_id)
-    user_message = source_text if source_text else get_user_message(update, context)
-    response_text = update.message.reply_to_message.text if update.message.reply_to_message else None
-    goal_data = goal_data if goal_data else "No goal_data passed as argument"
-
-    # Ensure proper formatting for the template
-    now_formatted = f"{now.date()}T18:01:00{now.strftime('%z')}"
-    tomorrow_formatted = f"{tomorrow.date()}T18:01:00{tomorrow.strftime('%z')}"
-    next_wednesday_formatted = next_wednesday_at_noon.strftime("%Y-%m-%dT%H:%M:%S%z")
-    
+    """Prompt variables for a chain, built once per update and shared across the pipeline (see LLMs/request_context.py)"""
+    request_context = get_request_context(update, context)
+    return await request_context.input_variables(source_text, target_language, goal_data)
+
+
+def cache_key_messages(chain, input_variables, messages):
+    """The prompt the response cache keys on: with the chain's cache_key_vars normalized (e.g. the time to the date)"""
+    normalizers = chain.get("cache_key_vars")
+    if not normalizers:
+        return messages
+    key_variables = {name: normalizers[name](value) if name in normalizers else value for name, value in input_variables.items()}
+    return chain["template"].format_prompt(**key_variables).to_messages()
+
 
-    if response_text:
-        user_message = f"{user_message}\n\n(As a reply to message: {response_text})"
-        
-    return {
-        "first_name": first_name,
-        "bot_name": bot_name,
-        "user_message": user_message,
-        "now": now.strftime("%Y-%m-%d %H:%M:%S"),  # Include current datetime as string
-        "weekday": weekday,
-        "user_id": user_id,
-        "chat_id": chat_id,
-        "default_deadline_time": default_deadline_time,
-        "default_reminder_time": default_reminder_time,
-        "long_term_goals": long_term_goals,
-        "response_text": response_text,
-        "target_language": target_language,
-        "tomorrow": tomorrow,
-        "tomorrow_formatted": tomorrow_formatted,
-        "now_formatted": now_formatted,
-        "next_wednesday": next_wednesday_formatted,
-        "next_year": next_year,
-        "goal_data": goal_data,
-        "PA": PA,
-    }
+def record_unused_calls(chain_name, chain, usages, reason):
+    """Telemetry for calls whose answer wasn't used (a hedge that lost, a route that failed), on their own model's row"""
+    routes = {route["provider"]: route for route in chain["routes"]}
+    for provider, usage in usages.items():
+        if usage.prompt_tokens is not None or usage.retries:
+            route = routes[provider]
+            llm_telemetry.record(chain_name, route["model"], route["base_url"], prompt_tokens=usage.prompt_tokens,
+                                 completion_tokens=usage.completion_tokens, retries=usage.retries, error=reason)
 
 
 async def run_chain(chain_name, input_variables: dict):
@@ -143,25 +136,54 @@ async def run_chain(chain_name, input_variables: dict):
     Returns:
         The result of invoking the chain's LLM with the formatted prompt.
     """
+    started = None
+    usages = {}     # provider -> UsageCallback of its call, when a call was hedged or fell back there are several
+    chain = None
     try:
         # Resolve the chain by its name
         chain = chains.get(chain_name)
         if not chain:
             raise KeyError(f"Chain '{chain_name}' not found in the chains dictionary.")
 
-        # Diagnostic: log the underlying LLM for this chain
-        bound_llm = getattr(chain["chain"], 'first', None) or getattr(chain["chain"], 'bound', None)
-        if bound_llm:
-            logger.info(f"🔍 run_chain('{chain_name}'): model={getattr(bound_llm, 'model_name', '?')}, base_url={getattr(bound_llm, 'openai_api_base', 'default')}")
-        else:
-            logger.info(f"🔍 run_chain('{chain_name}'): could not inspect LLM (chain type: {type(chain['chain']).__name__})")
+        logger.info(f"🔍 run_chain('{chain_name}'): model={chain.get('model') or '?'}, base_url={chain.get('base_url') or 'default'}")
 
         # Generate the prompt using the chain's template
         prompt_value = chain["template"].format_prompt(**input_variables)
 
+        messages = prompt_value.to_messages()
+
+        # Opt-in response cache for chains whose output only depends on the prompt
+        cache_key = None
+        if chain.get("cache_ttl") and chain.get("schema") is not None:
+            cache_key = llm_response_cache.make_key(chain_name, cache_key_messages(chain, input_variables, messages),
+                                                    chain["schema"], chain.get("model"))
+            cached = await llm_response_cache.get(chain_name, cache_key, chain["schema"])
+            if cached is not None:
+                logger.info(f"🗃️ Chain '{chain_name}' served from cache: {cached}")
+                llm_telemetry.record(chain_name, chain.get("model"), chain.get("base_url"), latency_ms=0, cache_hit=True)
+                return cached
+
         # Invoke the LLM with the formatted prompt
-        result = await chain["chain"].ainvoke(prompt_value.to_messages())
-        
+        # (routed between equivalent providers with hedging and fallback, see LLMs/router.py)
+        def route_config(route):
+            usages[route["provider"]] = UsageCallback()
+            return {"callbacks": [usages[route["provider"]]]}
+
+        started = time.perf_counter()
+        result, route = await llm_router.invoke(
+            chain_name, chain["routes"], messages, config=route_config, latency_budget=chain["latency_budget"]
+        )
+        llm_seconds = time.perf_counter() - started
+        usage = usages.pop(route["provider"])
+        llm_telemetry.record(
+            chain_name, route["model"], route["base_url"], latency_ms=llm_seconds * 1000,
+            prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens, retries=usage.retries,
+        )
+        record_unused_calls(chain_name, chain, usages, "not used (hedged or fell back)")
+
+        if cache_key:
+            await llm_response_cache.put(chain_name, cache_key, result, chain["cache_ttl"], llm_seconds)
+
         # Log and return the result
         logger.info(f"Chain '{chain_name}' executed successfully: {result}")
         return result
@@ -171,12 +193,33 @@ async def run_chain(chain_name, input_variables: dict):
         raise ValueError(f"Invalid chain structure: missing {e}")
 
     except Exception as e:
+        if started is not None:
+            llm_telemetry.record(
+                chain_name, chain.get("model"), chain.get("base_url"), latency_ms=(time.perf_counter() - started) * 1000, error=e,
+            )
+            record_unused_calls(chain_name, chain, usages, e)     # tokens and retries, per route that was tried
         logger.error(f"Error running chain: {e}")
         raise RuntimeError(f"Failed to execute chain: {e}")
 
 
 
 # pipelines orchestration < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < < <
+async def run_chain_or_take_speculative(update, context, chain_name, input_variables: dict):
+    """Use the speculative result of `chain_name` for this update if there is one, otherwise run the chain now."""
+    speculation = get_request_context(update, context).speculation
+    result = await speculation.take(chain_name) if speculation else None
+    return result if result is not None else await run_chain(chain_name, input_variables)
+
+
+def discard_speculative(update, context, *chain_names):
+    """Cancel speculative chains that routing didn't need (all of them if no names are given)."""
+    speculation = get_request_context(update, context).speculation
+    if speculation and chain_names:
+        speculation.discard(*chain_names)
+    elif speculation:
+        speculation.cancel_remaining()
+
+
 async def dummy_call(update, context):
     try:
         input_vars = await get_input_variables(update, context)
@@ -203,7 +246,19 @@ async def start_initial_classification(update, context, override_text=None):
     try:
         # Extract input variables
         input_vars = await get_input_variables(update, context)
-        initial_classification = await run_chain("initial_classification", input_vars)        
+        user_message = get_user_message(update, context)
+        preclassified = preclassify(user_message) if not update.message.reply_to_message else None   # replies need the LLM's context
+        if SPECULATIVE_CLASSIFICATION and not preclassified:
+            speculation = Speculation()
+            speculation.start("goal_classification", run_chain("goal_classification", input_vars))
+            if SPECULATE_GOAL_SETTING_ANALYSIS:
+                speculation.start("goal_setting_analysis", run_chain("goal_setting_analysis", input_vars))
+            get_request_context(update, context).speculation = speculation
+        if preclassified:
+            initial_classification = preclassified.result
+        else:
+            initial_classification = await run_chain("initial_classification", input_vars)
+            record_example(user_message, InitialClassification.model_validate(initial_classification))
         
         if shared_state["transparant_mode"]:
             debug_message = await update.message.reply_text(f"Initial Classification Result: \n{initial_classification}")
@@ -215,6 +270,8 @@ async def start_initial_classification(update, context, override_text=None):
     except Exception as e:
         await update.message.reply_text(f"Error in start_initial_classification():\n {e}")
         logger.error(f"\n\n🚨 Error in start_initial_classification(): {e}\n\n")
+    finally:
+        discard_speculative(update, context)
     
 
 async def process_classification_result(update, context, initial_classification):
@@ -229,6 +286,9 @@ async def process_classification_result(update, context, initial_classification)
 
         # log_emoji_details(later_reaction, "gpt-4o-mini")
 
+        if language != "English" and language != "Dutch" or parsed_result.classification != "Goals":
+            discard_speculative(update, context)
+
         if language != "English" and language != "Dutch":
             preset_reaction = "💯"
             await safe_set_reaction(context.bot, chat_id=chat_id, message_id=message_id, reaction=preset_reaction)
@@ -270,7 +330,7 @@ async def handle_goal_classification(update, context, smarter=False):
         if smarter:
             goal_classification = await run_chain("goal_classification_smart", input_vars)  
         else:
-            goal_classification = await run_chain("goal_classification", input_vars)   
+            goal_classification = await run_chain_or_take_speculative(update, context, "goal_classification", input_vars)
         
         parsed_goal_classification = GoalClassification.model_validate(goal_classification)
 
@@ -281,10 +341,13 @@ async def handle_goal_classification(update, context, smarter=False):
 
 
         goal_result = parsed_goal_classification.classification
+        if goal_result != "Set":
+            discard_speculative(update, context, "goal_setting_analysis")
 
         if goal_result == "Set":
             goal_id = await create_limbo_goal(update, context)
             if goal_id is None:
+                discard_speculative(update, context, "goal_setting_analysis")
                 await update.message.reply_text(f"Cannot proceed with goal setting. Are you already registered? {PA}\n\n/start")
                 return
             # Initialize a dictionary for the goal in user context
@@ -310,7 +373,7 @@ async def handle_goal_classification(update, context, smarter=False):
 async def goal_setting_analysis(update, context, goal_id, smarter=False):
     try:
         input_vars = await get_input_variables(update, context)
-        goal_setting_analysis = await run_chain("goal_setting_analysis", input_vars)
+        goal_setting_analysis = await run_chain_or_take_speculative(update, context, "goal_setting_analysis", input_vars)
         parsed_goal_analysis = SetGoalAnalysis.model_validate(goal_setting_analysis)
         
         if shared_state["transparant_mode"]:
@@ -537,10 +600,7 @@ async def find_goal_id(update, context, type=None):
         input_vars = await get_input_variables(update, context)
 
         # Fetch active goals from DB so the LLM can match by description/deadline
-        user_id = update.effective_user.id
-        chat_id = update.effective_chat.id
-        active_goals = await fetch_active_goals_summary(user_id, chat_id)
-        input_vars["active_goals"] = active_goals
+        input_vars["active_goals"] = await get_request_context(update, context).active_goals_summary()
 
         output = await run_chain("find_goal_id", input_vars)
         
@@ -644,12 +704,22 @@ async def other_message(update, context):
 
         from features.agent.loop import run_agent_loop
 
-        final_response = await run_agent_loop(
-            user_message=user_message,
-            user_id=user_id,
-            chat_id=chat_id,
-            first_name=first_name,
-        )
+        streamer = TelegramMessageStreamer(update.message) if STREAM_AGENT_RESPONSES else None
+        if streamer:
+            await streamer.start()
+
+        try:
+            final_response = await run_agent_loop(
+                user_message=user_message,
+                user_id=user_id,
+                chat_id=chat_id,
+                first_name=first_name,
+                stream=streamer,
+            )
+        except Exception:
+            if streamer:
+                await streamer.finish(f"I wasn't able to come up with a response {PA}", parse_mode=None)
+            raise
 
         if shared_state["transparant_mode"]:
             debug_message = await update.message.reply_text(
@@ -658,6 +728,12 @@ async def other_message(update, context):
             await add_delete_button(update, context, debug_message.message_id)
             asyncio.create_task(delete_message(update, context, debug_message.message_id, 120))
 
+        if streamer:
+            await streamer.finish(final_response)
+            for message_id in streamer.message_ids:
+                await add_delete_button(update, context, message_id)
+            return
+
         chunks = split_message(final_response)
         for chunk in chunks:
             sent = await update.message.reply_text(chunk, parse_mode="Markdown")
@@ -668,7 +744,27 @@ async def other_message(update, context):
         logger.error(f"\n\n🚨 Error in other_message(): {e}\n\n")
         
 
+async def stream_pro_response(instructions, input, streamer):
+    """
+    Runs a /pro request on the async client, pushing the output text to `streamer` as it arrives.
+    Returns the completed Response object.
+    """
+    response = None
+    stream = await pro_client().responses.create(model=PRO_MODEL, instructions=instructions, input=input, stream=True)
+    async for event in stream:
+        if event.type == "response.output_text.delta":
+            streamer.push(event.delta)
+        elif event.type == "response.completed":
+            response = event.response
+        elif event.type in ("response.failed", "response.incomplete", "error"):
+            raise RuntimeError(f"Pro response ended with '{event.type}': {getattr(event, 'response', event)}")
+    if response is None:
+        raise RuntimeError("Pro response stream ended without a completed response")
+    return response
+
+
 async def other_message_pro(update, context):
+    from openai import APITimeoutError
     try:
         now = datetime.now(tz=BERLIN_TZ)
         weekday = now.strftime("%A") 
@@ -679,25 +775,33 @@ async def other_message_pro(update, context):
         if response_text:
             user_message = f"{user_message}\n\n(As a reply to message: {response_text})"
         
-        response = client_EC.responses.create(
-            model="gpt-5.2-pro",
-            instructions=f"""
+        streamer = TelegramMessageStreamer(update.message)
+        await streamer.start()
+        try:
+            response = await asyncio.wait_for(stream_pro_response(
+                instructions=f"""
                 It is currently: {weekday}, {now}. You are a virtual PA called Manon. A user in a Telegram group is sending you a message. It's your task to respond to it, be as glib and helpful as possible.
                 Don't mince words, don't be nuanced, just give your best attempt at the most accurate and helpful response. No intro, no outro, no disclaimers. The user already knows that you're a chatbot and they should not take your words for truth.
                 Always include a {PA} somewhere in your response. If you expect your response to be helpful to the user, also include a 🍌. If you think it's probavly medium-helpful, include a 🕳️. If you don't think it's helpful, include a 🍆.""",
-            input=f"User message:\n{user_message}",
-        )
+                input=f"User message:\n{user_message}",
+                streamer=streamer,
+            ), timeout=PRO_TIMEOUT_SECONDS)
+        except (APITimeoutError, asyncio.TimeoutError):
+            await streamer.finish(f"Pro model didn't answer within {PRO_TIMEOUT_SECONDS} s, try again later {PA}", parse_mode=None)
+            logger.error(f"🚨 other_message_pro() timed out after {PRO_TIMEOUT_SECONDS} s")
+            return
+        except Exception:
+            await streamer.finish(f"I wasn't able to come up with a response {PA}", parse_mode=None)
+            raise
 
         if shared_state["transparant_mode"]:
-            debug_message = await update.message.reply_text(f"other_message_result: \n{response}")
+            debug_message = await update.message.reply_text(f"other_message_result: \n{response}"[:TG_MAX])
             await add_delete_button(update, context, debug_message.message_id)
             asyncio.create_task(delete_message(update, context, debug_message.message_id, 120))
 
-        response_message = response.output_text
-        chunks = split_message(response_message)
-        for i, chunk in enumerate(chunks):
-            sent = await update.message.reply_text(chunk)
-            await add_delete_button(update, context, sent.message_id)
+        await streamer.finish(response.output_text, parse_mode=None)
+        for message_id in streamer.message_ids:
+            await add_delete_button(update, context, message_id)
         
     except Exception as e:
         await update.message.reply_text(f"Error in other_message_1():\n {e}")
@@ -0,0 +1,269 @@
+# LLMs/preclassifier.py
+"""
+In-process fast path in front of the initial_classification chain.
+
+Obvious messages ("remind me at 9 to...", "done with the laundry", "thanks!") don't need an LLM round-trip to be routed.
+The pre-classifier combines hand-written rules with a small naive Bayes model, trained on the InitialClassification
+results the LLM produced earlier (logged to PRECLASSIFIER_LOG_PATH). It returns the same InitialClassification object
+plus a confidence; below PRECLASSIFIER_THRESHOLD the caller should defer to the LLM.
+
+Nothing here blocks the event loop on a message: the log is read (its last MAX_TRAINING_EXAMPLES lines) and the model
+trained in a thread on first use, with only the rules until then, and after that every new LLM result is added to the
+model as it comes in (naive Bayes is just counts) and appended to the log in a thread.
+
+scripts/evaluate_preclassifier.py replays the log to report accuracy and the share of LLM calls avoided.
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+import re
+from collections import Counter, defaultdict, deque
+from dataclasses import dataclass
+from datetime import datetime
+
+from LLMs.structured_output_schemas import InitialClassification
+from utils.helpers import BERLIN_TZ
+
+logger = logging.getLogger(__name__)
+
+PRECLASSIFIER_ENABLED = True
+PRECLASSIFIER_THRESHOLD = 0.95          # minimum confidence to skip the LLM
+PRECLASSIFIER_LOG_PATH = os.path.join("log_files", "initial_classifications.jsonl")
+MIN_TRAINING_EXAMPLES = 200             # below this the model stays off and only the rules are used
+MAX_TRAINING_EXAMPLES = 20_000          # most recent logged examples read at startup
+
+
+@dataclass
+class PreClassification:
+    result: InitialClassification
+    confidence: float
+    source: str                 # "rule:<name>" or "model"
+
+
+# (name, language, classification, confidence, pattern). First match wins, so more specific rules go first.
+RULES = [
+    ("remind_en", "English", "Reminders", 0.97, r"^(please\s+)?remind me\b"),
+    ("remind_nl", "Dutch", "Reminders", 0.97, r"^(wil je me\s+|kun je me\s+)?herinner(en)? me\b|^herinner me\b"),
+    ("done_en", "English", "Goals", 0.96, r"^(i'?m\s+|i\s+am\s+)?(done|finished)\s+with\b|^i\s+(just\s+)?(finished|completed)\b"),
+    ("done_nl", "Dutch", "Goals", 0.96, r"^(ik\s+ben\s+)?klaar\s+met\b|^ik\s+heb\s+.+\s+(gedaan|afgemaakt)\b"),
+    # "I want to know..." is a question, so intentions stay just below the default threshold unless the log says otherwise
+    ("intent_en", "English", "Goals", 0.9, r"^(today|tomorrow|tonight|this week)?,?\s*i\s+(want|plan|intend|am going|'m going)\s+to\b"),
+    ("intent_nl", "Dutch", "Goals", 0.9, r"^(vandaag|morgen|vanavond|deze week)?,?\s*ik\s+(wil|ga|moet)\b"),
+    ("smalltalk_en", "English", "Other", 0.97, r"^(hi|hey|hello|yo|thanks|thank you|thx|good (morning|night|evening)|ok(ay)?|cool|nice|lol|haha)[\s!.?🙏❤️😘]*$"),
+    ("smalltalk_nl", "Dutch", "Other", 0.97, r"^(hoi|hallo|hee|dank je( wel)?|bedankt|dankjewel|goedemorgen|welterusten|top|prima|oké?)[\s!.?🙏❤️😘]*$"),
+]
+_COMPILED_RULES = [(name, language, label, confidence, re.compile(pattern, re.IGNORECASE))
+                   for name, language, label, confidence, pattern in RULES]
+
+_TOKEN_PATTERN = re.compile(r"[a-zà-ÿ']+|\d+|[^\w\s]", re.IGNORECASE)
+
+
+def tokenize(text: str) -> list:
+    words = [token.lower() for token in _TOKEN_PATTERN.findall(text or "")]
+    if any(char.isdigit() for char in text or ""):
+        words.append("<digit>")
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class NaiveBayes:
+    """Multinomial naive Bayes with Laplace smoothing over unigrams and bigrams."""
+
+    def __init__(self, alpha: float = 1.0):
+        self.alpha = alpha
+        self.class_counts = Counter()
+        self.token_counts = defaultdict(Counter)
+        self.token_totals = Counter()
+        self.vocabulary = set()
+
+    def fit(self, texts, labels):
+        for text, label in zip(texts, labels):
+            tokens = tokenize(text)
+            self.class_counts[label] += 1
+            self.token_counts[label].update(tokens)
+            self.token_totals[label] += len(tokens)
+            self.vocabulary.update(tokens)
+        return self
+
+    def predict_proba(self, text) -> dict:
+        tokens = [token for token in tokenize(text) if token in self.vocabulary]
+        total = sum(self.class_counts.values())
+        vocabulary_size = len(self.vocabulary)
+        log_scores = {}
+        for label, count in self.class_counts.items():
+            denominator = self.token_totals[label] + self.alpha * vocabulary_size
+            log_scores[label] = math.log(count / total) + sum(
+                math.log((self.token_counts[label][token] + self.alpha) / denominator) for token in tokens
+            )
+        top = max(log_scores.values())
+        exp_scores = {label: math.exp(score - top) for label, score in log_scores.items()}
+        norm = sum(exp_scores.values())
+        return {label: score / norm for label, score in exp_scores.items()}
+
+    def predict(self, text):
+        probabilities = self.predict_proba(text)
+        label = max(probabilities, key=probabilities.get)
+        return label, probabilities[label]
+
+
+class PreClassifier:
+    """Rules, checked against the model when there is one. classify() returns None when neither has anything to say."""
+
+    def __init__(self, use_rules: bool = True):
+        self.use_rules = use_rules
+        self._language_model = NaiveBayes()
+        self._classification_model = NaiveBayes()
+        self.trained_on = 0
+
+    # Below MIN_TRAINING_EXAMPLES the models are off (None)
+    @property
+    def language_model(self):
+        return self._language_model if self.trained_on >= MIN_TRAINING_EXAMPLES else None
+
+    @property
+    def classification_model(self):
+        return self._classification_model if self.trained_on >= MIN_TRAINING_EXAMPLES else None
+
+    def train(self, examples: list):
+        """examples: dicts with 'text', 'user_message_language' and 'classification' (as logged by record_example)."""
+        self._language_model, self._classification_model, self.trained_on = NaiveBayes(), NaiveBayes(), 0
+        return self.learn(examples)
+
+    def learn(self, examples: list):
+        """Add examples to what was trained so far, same as training on all of them at once."""
+        texts = [example["text"] for example in examples]
+        self._language_model.fit(texts, [example["user_message_language"] for example in examples])
+        self._classification_model.fit(texts, [example["classification"] for example in examples])
+        self.trained_on += len(examples)
+        return self
+
+    def _match_rule(self, text):
+        for name, language, label, confidence, pattern in _COMPILED_RULES:
+            if pattern.search(text):
+                return PreClassification(
+                    InitialClassification(user_message_language=language, classification=label), confidence, f"rule:{name}"
+                )
+        return None
+
+    def _predict_model(self, text):
+        if not self.classification_model:
+            return None
+        language, language_confidence = self.language_model.predict(text)
+        label, label_confidence = self.classification_model.predict(text)
+        return PreClassification(
+            InitialClassification(user_message_language=language, classification=label),
+            min(language_confidence, label_confidence),
+            "model",
+        )
+
+    def classify(self, text: str):
+        text = (text or "").strip()
+        if not text:
+            return None
+        rule = self._match_rule(text) if self.use_rules else None
+        model = self._predict_model(text)
+        if rule and model:
+            if model.result.classification == rule.result.classification:
+                return PreClassification(rule.result, max(rule.confidence, model.confidence), f"{rule.source}+model")
+            # The log disagrees with the rule: trust the rule only as far as the model is unsure
+            return PreClassification(rule.result, min(rule.confidence, 1 - model.confidence), rule.source)
+        return rule or model
+
+
+def load_examples(path: str = PRECLASSIFIER_LOG_PATH, limit: int = MAX_TRAINING_EXAMPLES) -> list:
+    """The last `limit` logged examples (all of them for limit=None). Blocking: use it off the event loop."""
+    if not os.path.exists(path):
+        return []
+    lines = deque(maxlen=limit)
+    with open(path, "r", encoding="utf-8") as log_file:
+        lines.extend(log_file)
+    examples = []
+    for line in lines:
+        try:
+            examples.append(json.loads(line))
+        except json.JSONDecodeError:
+            continue
+    return examples
+
+
+_preclassifier = None
+_loading = None             # task training the model from the log
+_pending_lines = []         # examples waiting to be appended to the log
+_writer = None
+
+
+def get_preclassifier() -> PreClassifier:
+    """
+    The shared pre-classifier. When first used it only has the rules, while the log is read and the model trained in a
+    thread; record_example() keeps it up to date after that.
+    """
+    global _preclassifier, _loading
+    if _preclassifier is None:
+        _preclassifier = PreClassifier()
+        try:
+            _loading = asyncio.get_running_loop().create_task(_load())
+        except RuntimeError:        # no event loop (scripts): train right away
+            _preclassifier.train(load_examples(PRECLASSIFIER_LOG_PATH))
+    return _preclassifier
+
+
+async def _load():
+    global _preclassifier
+    try:
+        # Examples recorded meanwhile count if they were written before the log was read
+        _preclassifier = await asyncio.to_thread(lambda: PreClassifier().train(load_examples(PRECLASSIFIER_LOG_PATH)))
+    except Exception as e:
+        logger.error(f"Couldn't train the pre-classifier, using only the rules: {e}")
+        return
+    logger.info(f"Pre-classifier trained on {_preclassifier.trained_on} logged classifications "
+                f"(model {'on' if _preclassifier.classification_model else 'off, rules only'})")
+
+
+def preclassify(text: str):
+    """A confident local InitialClassification for `text`, or None to defer to the LLM."""
+    if not PRECLASSIFIER_ENABLED:
+        return None
+    try:
+        prediction = get_preclassifier().classify(text)
+    except Exception as e:
+        logger.error(f"Pre-classifier failed, deferring to the LLM: {e}")
+        return None
+    if prediction and prediction.confidence >= PRECLASSIFIER_THRESHOLD:
+        logger.info(f"⚡ Pre-classified locally ({prediction.source}, {prediction.confidence:.2f}): {prediction.result}")
+        return prediction
+    return None
+
+
+def record_example(text: str, result: InitialClassification):
+    """Learn from an LLM classification, and append it to the training/evaluation log in the background."""
+    global _writer
+    if not text:
+        return
+    example = {
+        "time": datetime.now(tz=BERLIN_TZ).isoformat(),
+        "text": text,
+        "user_message_language": result.user_message_language,
+        "classification": result.classification,
+    }
+    if _preclassifier is not None:
+        _preclassifier.learn([example])
+    _pending_lines.append(json.dumps(example, ensure_ascii=False) + "\n")
+    if _writer is None or _writer.done():
+        _writer = asyncio.create_task(_write_pending())
+
+
+def _append_lines(lines):
+    os.makedirs(os.path.dirname(PRECLASSIFIER_LOG_PATH), exist_ok=True)
+    with open(PRECLASSIFIER_LOG_PATH, "a", encoding="utf-8") as log_file:
+        log_file.writelines(lines)
+
+
+async def _write_pending():
+    while _pending_lines:
+        lines = _pending_lines[:]
+        del _pending_lines[:]
+        try:
+            await asyncio.to_thread(_append_lines, lines)
+        except Exception as e:
+            logger.error(f"Couldn't log {len(lines)} initial classification examples: {e}")
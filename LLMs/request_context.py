@@ -0,0 +1,109 @@
+# LLMs/request_context.py
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from telegram_helpers.get_user_message import get_user_message
+from utils.helpers import BERLIN_TZ
+from utils.session_avatar import PA
+from utils.db import fetch_long_term_goals, fetch_active_goals_summary
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DEADLINE_TIME = "22:22"
+DEFAULT_REMINDER_TIME = "11:11"
+
+
+class RequestContext:
+    """
+    Everything the LLM chains want to know about one Telegram update, computed lazily and at most once.
+
+    One goal message passes through several chains (classification, goal analysis, planning...), and each of them used
+    to rebuild the same input variables from scratch, including a long-term goals lookup. The request context is
+    created on the first call for an update, stored on the PTB `context`, and shared by every step of the pipeline.
+    Concurrent callers of the same lookup share a single in-flight computation.
+    """
+
+    def __init__(self, update, context):
+        self.update = update
+        self.context = context
+        self.update_id = update.update_id
+        self.user_id = update.effective_user.id
+        self.chat_id = update.effective_chat.id
+        self.first_name = update.effective_user.first_name
+        self._computations = {}     # name -> asyncio.Task
+        self.speculation = None     # LLMs.speculation.Speculation, when chains were started ahead of routing
+
+    def _once(self, name, compute):
+        if name not in self._computations:
+            self._computations[name] = asyncio.ensure_future(compute())
+        return self._computations[name]
+
+    async def long_term_goals(self):
+        return await self._once("long_term_goals", lambda: fetch_long_term_goals(self.chat_id, self.user_id))
+
+    async def active_goals_summary(self):
+        return await self._once("active_goals", lambda: fetch_active_goals_summary(self.user_id, self.chat_id))
+
+    def _response_text(self):
+        message = self.update.message
+        return message.reply_to_message.text if message and message.reply_to_message else None
+
+    def _with_reply(self, user_message):
+        response_text = self._response_text()
+        if response_text:
+            return f"{user_message}\n\n(As a reply to message: {response_text})"
+        return user_message
+
+    async def _base_input_variables(self):
+        now = datetime.now(tz=BERLIN_TZ)
+        tomorrow = now + timedelta(days=1)
+        # Calculate the next Wednesday
+        days_until_wednesday = (2 - now.weekday() + 7) % 7  # 2 is Wednesday (0=Monday, 6=Sunday)
+        if days_until_wednesday == 0:  # If today is Wednesday, move to next week
+            days_until_wednesday = 7
+        # Set time to 12:00:00 for next Wednesday
+        next_wednesday_at_noon = (now + timedelta(days=days_until_wednesday)).replace(hour=12, minute=0, second=0)
+
+        return {
+            "first_name": self.first_name,
+            "bot_name": self.update.get_bot().username,
+            "user_message": self._with_reply(get_user_message(self.update, self.context)),
+            "now": now.strftime("%Y-%m-%d %H:%M:%S"),  # Include current datetime as string
+            "weekday": now.strftime("%A"),  # Full weekday name
+            "user_id": self.user_id,
+            "chat_id": self.chat_id,
+            "default_deadline_time": DEFAULT_DEADLINE_TIME,
+            "default_reminder_time": DEFAULT_REMINDER_TIME,
+            "long_term_goals": await self.long_term_goals(),
+            "response_text": self._response_text(),
+            "tomorrow": tomorrow,
+            # Ensure proper formatting for the template
+            "tomorrow_formatted": f"{tomorrow.date()}T18:01:00{tomorrow.strftime('%z')}",
+            "now_formatted": f"{now.date()}T18:01:00{now.strftime('%z')}",
+            "next_wednesday": next_wednesday_at_noon.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "next_year": now.replace(year=now.year + 1),
+            "PA": PA,
+        }
+
+    async def input_variables(self, source_text=None, target_language="English", goal_data=None):
+        """
+        The prompt variables for a chain. The per-update part is computed once; the per-call arguments are layered on
+        top of a fresh copy, so one chain can't leak its variables into the next.
+        """
+        input_vars = dict(await self._once("input_variables", self._base_input_variables))
+        if source_text:
+            input_vars["user_message"] = self._with_reply(source_text)
+        input_vars["target_language"] = target_language
+        input_vars["goal_data"] = goal_data if goal_data else "No goal_data passed as argument"
+        return input_vars
+
+
+def get_request_context(update, context) -> RequestContext:
+    """The RequestContext of this update, created on first use and kept on the PTB context for the rest of the pipeline."""
+    request_context = getattr(context, "request_context", None)
+    if request_context is None or request_context.update_id != update.update_id:
+        request_context = RequestContext(update, context)
+        if context is not None:
+            context.request_context = request_context
+    return request_context
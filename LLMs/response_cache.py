@@ -0,0 +1,147 @@
+# LLMs/response_cache.py
+"""
+Response cache for chains whose output only depends on their prompt (translations, language checks, ...).
+
+Opt-in per chain with a "cache_ttl" (seconds) in LLMs/config.py. Entries are keyed on the chain name, the model, the
+exact formatted messages and a hash of the output schema, so a changed prompt template or schema never serves a stale
+answer. Lookups go to an in-memory LRU first and then to the manon_llm_cache table, so entries survive restarts.
+"""
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict, defaultdict
+from functools import lru_cache
+
+from utils.db import Database
+
+logger = logging.getLogger(__name__)
+
+MEMORY_CACHE_SIZE = 512
+PRUNE_EVERY = 200       # writes between deletions of expired rows
+
+
+@lru_cache(maxsize=None)
+def schema_hash(schema) -> str:
+    if schema is None:
+        return ""
+    return hashlib.sha256(json.dumps(schema.model_json_schema(), sort_keys=True).encode()).hexdigest()
+
+
+class ChainCacheStats:
+    def __init__(self):
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.miss_seconds = 0.0     # total LLM time of the misses, to estimate what a hit saves
+
+    @property
+    def hits(self):
+        return self.memory_hits + self.db_hits
+
+    @property
+    def avg_miss_seconds(self):
+        return self.miss_seconds / self.misses if self.misses else 0.0
+
+
+class LLMResponseCache:
+
+    def __init__(self, max_entries: int = MEMORY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._memory = OrderedDict()    # key -> (expires_at (monotonic), payload)
+        self.stats = defaultdict(ChainCacheStats)
+        self._writes = 0
+
+    @staticmethod
+    def make_key(chain_name, messages, schema=None, model=None) -> str:
+        material = json.dumps({
+            "chain": chain_name,
+            "model": model,
+            "schema": schema_hash(schema),
+            "messages": [(message.type, message.content) for message in messages],
+        }, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    async def get(self, chain_name, key, schema):
+        """The cached response as a `schema` instance, or None."""
+        stats = self.stats[chain_name]
+        entry = self._memory.get(key)
+        if entry and entry[0] > time.monotonic():
+            self._memory.move_to_end(key)
+            stats.memory_hits += 1
+            return schema.model_validate(entry[1])
+        if entry:
+            del self._memory[key]
+
+        row = await self._fetch_row(key)
+        if row:
+            payload = json.loads(row["response"])
+            self._remember(key, payload, row["remaining_seconds"])
+            stats.db_hits += 1
+            return schema.model_validate(payload)
+
+        stats.misses += 1
+        return None
+
+    async def put(self, chain_name, key, response, ttl, llm_seconds=0.0):
+        self.stats[chain_name].miss_seconds += llm_seconds
+        payload = response.model_dump(mode="json") if hasattr(response, "model_dump") else response
+        self._remember(key, payload, ttl)
+        if Database._pool is None:
+            return
+        try:
+            async with Database.acquire() as conn:
+                await conn.execute("""
+                    INSERT INTO manon_llm_cache (cache_key, chain_name, response, expires_at)
+                    VALUES ($1, $2, $3::jsonb, NOW() + make_interval(secs => $4))
+                    ON CONFLICT (cache_key) DO UPDATE
+                    SET response = EXCLUDED.response, created_at = NOW(), expires_at = EXCLUDED.expires_at
+                """, key, chain_name, json.dumps(payload, ensure_ascii=False), float(ttl))
+                self._writes += 1
+                if self._writes % PRUNE_EVERY == 0:
+                    await conn.execute("DELETE FROM manon_llm_cache WHERE expires_at < NOW()")
+        except Exception as e:
+            logger.error(f"Couldn't store cached response for '{chain_name}': {e}")
+
+    async def _fetch_row(self, key):
+        if Database._pool is None:
+            return None
+        try:
+            async with Database.acquire() as conn:
+                return await conn.fetchrow(
+                    """
+                    SELECT response::text AS response, EXTRACT(EPOCH FROM expires_at - NOW())::float AS remaining_seconds
+                    FROM manon_llm_cache
+                    WHERE cache_key = $1 AND expires_at > NOW()
+                    """,
+                    key,
+                )
+        except Exception as e:
+            logger.error(f"Couldn't read cached LLM response: {e}")
+            return None
+
+    def _remember(self, key, payload, ttl):
+        self._memory[key] = (time.monotonic() + ttl, payload)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def summary(self) -> str:
+        if not self.stats:
+            return "No cached chains have run yet"
+        lines = ["🗃️ LLM response cache"]
+        total_saved = 0.0
+        for chain_name, stats in sorted(self.stats.items()):
+            lookups = stats.hits + stats.misses
+            saved = stats.hits * stats.avg_miss_seconds
+            total_saved += saved
+            lines.append(
+                f"• {chain_name}: {stats.hits}/{lookups} hits ({stats.hits / lookups:.0%}"
+                f", {stats.memory_hits} memory / {stats.db_hits} db), ~{saved:.1f} s saved"
+                if lookups else f"• {chain_name}: no lookups"
+            )
+        lines.append(f"In memory: {len(self._memory)} entries. Estimated total saved: {total_saved:.1f} s")
+        return "\n".join(lines)
+
+
+llm_response_cache = LLMResponseCache()
@@ -0,0 +1,236 @@
+# LLMs/router.py
+"""
+Latency-aware routing of chain calls between equivalent providers (OpenRouter presets and their OpenAI counterparts).
+
+Each chain gets a primary and, where LLMs.config.FALLBACK_LLMS has one, a secondary route. The router:
+  • sends to the fastest healthy route (rolling p50 per chain and provider, configured order until there's data),
+  • fires a hedged duplicate to the other route once the first exceeds its own rolling p90, and keeps whichever
+    answers first (the slower one is cancelled),
+  • falls back to the other route when a call fails,
+  • opens a circuit breaker on a provider after repeated failures (timeouts, connection errors, rate limits and 5xx,
+    see is_provider_error), and lets a single probe through after a cooldown,
+  • gives up after the chain's latency budget.
+"""
+import asyncio
+import logging
+import time
+from collections import defaultdict, deque
+
+import openai
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LATENCY_BUDGET = 60        # seconds; per chain with "latency_budget" in chain_configs
+DEFAULT_HEDGE_AFTER = 10           # seconds, until a route has MIN_SAMPLES latencies to take its p90 from
+MIN_SAMPLES = 10
+LATENCY_WINDOW = 50                # latencies kept per chain and provider
+ERROR_WINDOW = 20                  # outcomes kept per provider
+CIRCUIT_CONSECUTIVE_FAILURES = 5
+CIRCUIT_ERROR_RATE = 0.5           # ... or this share of the last ERROR_WINDOW calls (with at least MIN_SAMPLES of them)
+CIRCUIT_COOLDOWN = 60              # seconds before a half-open probe
+
+
+def is_provider_error(error: BaseException) -> bool:
+    """
+    Whether a failed call says the provider is in trouble. A response that didn't fit the output schema, or a request
+    the API turned down (400), fails the call but not the provider, so it doesn't count towards opening its circuit.
+    """
+    if isinstance(error, (TimeoutError, openai.APIConnectionError, openai.RateLimitError)):    # incl. APITimeoutError
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))] if values else None
+
+
+class ProviderHealth:
+    """Error tracking and circuit breaker of one provider, shared by all chains that use it."""
+
+    def __init__(self, name):
+        self.name = name
+        self.outcomes = deque(maxlen=ERROR_WINDOW)     # True = success
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.times_opened = 0
+
+    @property
+    def error_rate(self):
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= CIRCUIT_COOLDOWN else "open"
+
+    def allows_request(self):
+        state = self.state
+        return state == "closed" or (state == "half-open" and not self.probing)
+
+    def on_launch(self):
+        if self.state == "half-open":
+            self.probing = True     # only one probe at a time
+
+    def record_success(self):
+        self.outcomes.append(True)
+        self.consecutive_failures = 0
+        if self.opened_at is not None:
+            logger.info(f"🟢 Circuit for {self.name} closed again")
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self):
+        self.outcomes.append(False)
+        self.consecutive_failures += 1
+        self.probing = False
+        if self.opened_at is not None:
+            self.opened_at = time.monotonic()      # failed probe: stay open for another cooldown
+        elif (self.consecutive_failures >= CIRCUIT_CONSECUTIVE_FAILURES
+              or (len(self.outcomes) >= MIN_SAMPLES and self.error_rate >= CIRCUIT_ERROR_RATE)):
+            self.opened_at = time.monotonic()
+            self.times_opened += 1
+            logger.error(f"🔴 Circuit for {self.name} opened ({self.consecutive_failures} consecutive failures, "
+                         f"{self.error_rate:.0%} errors)")
+
+
+class RouterStats:
+    def __init__(self):
+        self.calls = 0
+        self.hedges = 0             # hedged duplicates fired
+        self.hedges_won = 0         # ... that answered before the original
+        self.fallbacks = 0          # calls answered by another route after the first one failed
+        self.skipped_open = 0       # routes skipped because their circuit was open
+
+
+class LLMRouter:
+
+    def __init__(self):
+        self.health = {}
+        self.latencies = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))    # (chain, provider) -> seconds
+        self.stats = RouterStats()
+
+    def _health(self, provider):
+        if provider not in self.health:
+            self.health[provider] = ProviderHealth(provider)
+        return self.health[provider]
+
+    def _p(self, chain_name, provider, share):
+        samples = self.latencies[(chain_name, provider)]
+        return percentile(samples, share) if len(samples) >= MIN_SAMPLES else None
+
+    def order_routes(self, chain_name, routes):
+        """Healthy routes, fastest first. Configured order wins while either route lacks latency data."""
+        healthy = []
+        for route in routes:
+            if self._health(route["provider"]).allows_request():
+                healthy.append(route)
+            else:
+                self.stats.skipped_open += 1
+        if len(healthy) == 2:
+            p50s = [self._p(chain_name, route["provider"], 0.5) for route in healthy]
+            if None not in p50s and p50s[1] < p50s[0]:
+                healthy.reverse()
+        return healthy
+
+    async def invoke(self, chain_name, routes, messages, config=None, latency_budget=DEFAULT_LATENCY_BUDGET):
+        """
+        Run `messages` through the chain's routes.
+
+        Args:
+            routes (list): Dicts with "provider" (LLMs.config.llms key), "chain" (runnable) and "model".
+            config: The RunnableConfig for each call, or a function (route) -> RunnableConfig, e.g. to give every route
+                its own usage callback when a call is hedged or falls back.
+        Returns:
+            tuple: (result, the route that produced it).
+        Raises:
+            asyncio.TimeoutError: Nothing answered within the latency budget.
+            Exception: The last route's error when every route failed, or RuntimeError when all circuits are open.
+        """
+        self.stats.calls += 1
+        candidates = self.order_routes(chain_name, routes)
+        if not candidates:
+            raise RuntimeError(f"All providers for '{chain_name}' are unavailable (circuit open)")
+        return await asyncio.wait_for(self._race(chain_name, candidates, messages, config), timeout=latency_budget)
+
+    async def _call(self, chain_name, route, messages, config):
+        started = time.monotonic()
+        health = self._health(route["provider"])
+        try:
+            result = await route["chain"].ainvoke(messages, config=config(route) if callable(config) else config)
+        except asyncio.CancelledError:
+            if health.probing:
+                health.probing = False     # the probe didn't get to finish, let the next call probe
+            raise
+        except Exception as e:
+            if is_provider_error(e):
+                health.record_failure()
+            else:
+                health.record_success()     # it answered, just not usably: fall back, but leave the circuit alone
+            raise
+        health.record_success()
+        self.latencies[(chain_name, route["provider"])].append(time.monotonic() - started)
+        return result
+
+    async def _race(self, chain_name, candidates, messages, config):
+        pending = {}            # task -> route
+        waiting = list(candidates)
+        last_error = None
+
+        def launch():
+            route = waiting.pop(0)
+            self._health(route["provider"]).on_launch()
+            pending[asyncio.create_task(self._call(chain_name, route, messages, config))] = route
+            return route
+
+        first = launch()
+        hedge_after = self._p(chain_name, first["provider"], 0.9) or DEFAULT_HEDGE_AFTER
+        try:
+            while pending:
+                timeout = hedge_after if waiting and len(pending) == 1 else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedge = launch()
+                    self.stats.hedges += 1
+                    logger.info(f"🏇 '{chain_name}': {first['provider']} slower than its p90 ({hedge_after:.1f} s), "
+                                f"hedging with {hedge['provider']}")
+                    continue
+                for task in done:
+                    route = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        last_error = e
+                        logger.warning(f"⚠️ '{chain_name}' failed on {route['provider']}: {e}")
+                        if waiting or pending:
+                            self.stats.fallbacks += 1
+                        if waiting and not pending:
+                            launch()
+                        continue
+                    if route is not first and last_error is None:
+                        self.stats.hedges_won += 1
+                    return result, route
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def summary(self) -> str:
+        stats = self.stats
+        lines = [
+            f"🔀 LLM router: {stats.calls} calls, {stats.hedges} hedges ({stats.hedges_won} won), "
+            f"{stats.fallbacks} fallbacks, {stats.skipped_open} skipped (circuit open)"
+        ]
+        for name, health in sorted(self.health.items()):
+            lines.append(f"• {name}: circuit {health.state}, {health.error_rate:.0%} errors (last {len(health.outcomes)}), "
+                         f"opened {health.times_opened}x")
+        for (chain_name, provider), samples in sorted(self.latencies.items()):
+            if samples:
+                lines.append(f"  {chain_name} @ {provider}: p50 {percentile(samples, 0.5):.1f} s, "
+                             f"p90 {percentile(samples, 0.9):.1f} s ({len(samples)} samples)")
+        return "\n".join(lines)
+
+
+llm_router = LLMRouter()
@@ -0,0 +1,107 @@
+# LLMs/speculation.py
+import asyncio
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class SpeculationStats:
+    """Running totals of how often speculative chains paid off, shown by the 'Speculation' trigger."""
+
+    def __init__(self):
+        self.messages = 0           # messages for which chains were started ahead of routing
+        self.paid_off = 0           # ... of which at least one speculative result was used
+        self.used = 0               # speculative chain results that were used
+        self.wasted = 0             # speculative chains that were cancelled or whose result was thrown away
+        self.failed = 0             # speculative chains that raised (the chain was then run the normal way)
+        self.saved_seconds = deque(maxlen=200)     # latency saved per message that paid off
+
+    def record(self, used, wasted, failed, saved):
+        self.messages += 1
+        self.used += used
+        self.wasted += wasted
+        self.failed += failed
+        if used:
+            self.paid_off += 1
+            self.saved_seconds.append(saved)
+
+    def summary(self) -> str:
+        if not self.messages:
+            return "No speculative classifications yet"
+        saved = sorted(self.saved_seconds)
+        median = saved[len(saved) // 2] if saved else 0.0
+        average = sum(saved) / len(saved) if saved else 0.0
+        return (
+            f"🔮 Speculative classification\n"
+            f"Messages: {self.messages}, paid off: {self.paid_off} ({self.paid_off / self.messages:.0%})\n"
+            f"Chain results used: {self.used}, wasted: {self.wasted}, failed: {self.failed}\n"
+            f"Latency saved when it paid off (last {len(saved)}): median {median:.2f} s, avg {average:.2f} s"
+        )
+
+
+speculation_stats = SpeculationStats()
+
+
+class Speculation:
+    """
+    Chains started before the routing that decides whether they're needed is known.
+
+    Each chain gets exactly one outcome: take() it (the result is used), or discard()/cancel_remaining() it. Once all
+    of them are settled, the message is added to speculation_stats. Latency saved for a used chain is the part of its
+    run that overlapped with the work before it was needed: without speculation it would only have started at take().
+    """
+
+    def __init__(self):
+        self._tasks = {}        # chain name -> (task, started_at)
+        self._finished_at = {}
+        self._used = self._wasted = self._failed = 0
+        self._saved = 0.0
+        self._recorded = False
+
+    def start(self, name, coroutine):
+        started_at = time.monotonic()
+        task = asyncio.create_task(coroutine)
+        task.add_done_callback(lambda _: self._finished_at.setdefault(name, time.monotonic()))
+        self._tasks[name] = (task, started_at)
+
+    async def take(self, name):
+        """The speculative result of `name`, or None if it wasn't speculated or it failed (then run it the normal way)."""
+        if name not in self._tasks:
+            return None
+        task, started_at = self._tasks.pop(name)
+        needed_at = time.monotonic()
+        try:
+            result = await task
+        except Exception as e:
+            logger.warning(f"Speculative '{name}' failed, running it normally: {e}")
+            self._failed += 1
+            self._maybe_record()
+            return None
+        duration = self._finished_at.get(name, time.monotonic()) - started_at
+        self._saved += min(duration, needed_at - started_at)
+        self._used += 1
+        self._maybe_record()
+        return result
+
+    def discard(self, *names):
+        for name in names:
+            if name in self._tasks:
+                task, _ = self._tasks.pop(name)
+                if task.done() and not task.cancelled():
+                    task.exception()    # mark a failure as retrieved, nobody is going to look at it
+                task.cancel()
+                self._wasted += 1
+                logger.info(f"Speculative '{name}' not needed, {'discarded' if task.done() else 'cancelled'}")
+        self._maybe_record()
+
+    def cancel_remaining(self):
+        self.discard(*list(self._tasks))
+
+    def _maybe_record(self):
+        if not self._tasks and not self._recorded:
+            self._recorded = True
+            speculation_stats.record(self._used, self._wasted, self._failed, self._saved)
+            if self._used:
+                logger.info(f"🔮 Speculation saved {self._saved:.2f} s ({self._used} used, {self._wasted} wasted)")
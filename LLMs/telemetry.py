@@ -0,0 +1,153 @@
+# LLMs/telemetry.py
+"""
+Structured telemetry for every LLM invocation: one row per call in manon_llm_calls.
+
+record() only appends to an in-memory buffer, so it never adds latency to a chain. A background task writes the
+buffer in batches (every FLUSH_INTERVAL seconds, or sooner once FLUSH_BATCH_SIZE records are waiting). report() is
+what /llmstats shows: call counts, p50/p95 latency and token spend per chain over a window.
+"""
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from utils.db import Database
+from utils.helpers import BERLIN_TZ
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 10         # seconds
+FLUSH_BATCH_SIZE = 100
+MAX_BUFFERED = 10_000       # when the database is unreachable, the oldest records are dropped beyond this
+
+COLUMNS = ("created_at", "chain_name", "model", "base_url", "prompt_tokens", "completion_tokens",
+           "latency_ms", "retries", "cache_hit", "error")
+INSERT_QUERY = f"""
+    INSERT INTO manon_llm_calls ({", ".join(COLUMNS)})
+    VALUES (to_timestamp($1), {", ".join(f"${i}" for i in range(2, len(COLUMNS) + 1))})
+"""
+
+
+def token_usage(message) -> tuple:
+    """(prompt_tokens, completion_tokens) from an AIMessage's usage_metadata, (None, None) when the provider sent none."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    return usage.get("input_tokens"), usage.get("output_tokens")
+
+
+class UsageCallback(BaseCallbackHandler):
+    """Collects token usage and retries of one chain run, for chains whose output (structured) hides the AIMessage."""
+
+    def __init__(self):
+        self.prompt_tokens = None
+        self.completion_tokens = None
+        self.retries = 0
+
+    def on_llm_end(self, response, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                prompt_tokens, completion_tokens = token_usage(getattr(generation, "message", None))
+                if prompt_tokens is not None:
+                    self.prompt_tokens = (self.prompt_tokens or 0) + prompt_tokens
+                    self.completion_tokens = (self.completion_tokens or 0) + (completion_tokens or 0)
+
+    def on_retry(self, retry_state, **kwargs):
+        self.retries += 1
+
+
+class LLMTelemetry:
+
+    def __init__(self):
+        self._buffer = deque(maxlen=MAX_BUFFERED)
+        self._wake = asyncio.Event()
+        self._flusher = None
+        self.dropped = 0
+
+    def record(self, chain_name, model=None, base_url=None, latency_ms=None, prompt_tokens=None,
+               completion_tokens=None, retries=0, cache_hit=False, error=None):
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+        self._buffer.append((
+            datetime.now(tz=BERLIN_TZ), chain_name, model, base_url, prompt_tokens, completion_tokens,
+            None if latency_ms is None else round(latency_ms, 1), retries, cache_hit,
+            None if error is None else str(error)[:500],
+        ))
+        if len(self._buffer) >= FLUSH_BATCH_SIZE:
+            self._wake.set()
+
+    def start(self):
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._flusher:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self) -> int:
+        """Write the buffered records in one batch. Returns how many were written; on failure they stay buffered."""
+        if not self._buffer or Database._pool is None:
+            return 0
+        records = list(self._buffer)
+        try:
+            async with Database.acquire() as conn:
+                # Not COPY: its binary format can't use the text timestamptz codec Database sets up. The timestamp goes
+                # in as epoch seconds, which works with or without that codec.
+                await conn.executemany(INSERT_QUERY, [(record[0].timestamp(), *record[1:]) for record in records])
+        except Exception as e:
+            logger.error(f"Couldn't write {len(records)} LLM telemetry records: {e}")
+            return 0
+        for _ in records:
+            self._buffer.popleft()
+        return len(records)
+
+    async def report(self, hours: float = 24) -> str:
+        async with Database.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT chain_name,
+                       COUNT(*) AS calls,
+                       COUNT(*) FILTER (WHERE cache_hit) AS cache_hits,
+                       COUNT(*) FILTER (WHERE error IS NOT NULL) AS errors,
+                       percentile_cont(0.5) WITHIN GROUP (ORDER BY latency_ms) FILTER (WHERE NOT cache_hit) AS p50,
+                       percentile_cont(0.95) WITHIN GROUP (ORDER BY latency_ms) FILTER (WHERE NOT cache_hit) AS p95,
+                       COALESCE(SUM(prompt_tokens), 0) AS prompt_tokens,
+                       COALESCE(SUM(completion_tokens), 0) AS completion_tokens,
+                       string_agg(DISTINCT model, ', ') AS models
+                FROM manon_llm_calls
+                WHERE created_at >= NOW() - make_interval(secs => $1)
+                GROUP BY chain_name
+                ORDER BY calls DESC
+            """, hours * 3600)
+        if not rows:
+            return f"No LLM calls recorded in the last {hours:g} h"
+
+        lines = [f"📈 LLM calls, last {hours:g} h"]
+        for row in rows:
+            latency = f"p50 {row['p50'] / 1000:.1f} s, p95 {row['p95'] / 1000:.1f} s" if row["p50"] is not None else "cached only"
+            lines.append(
+                f"• {row['chain_name']} ({row['models'] or '?'}): {row['calls']} calls, {latency}, "
+                f"{row['prompt_tokens']:,} in / {row['completion_tokens']:,} out tokens"
+                + (f", {row['cache_hits']} cached" if row["cache_hits"] else "")
+                + (f", {row['errors']} errors" if row["errors"] else "")
+            )
+        if self.dropped:
+            lines.append(f"⚠️ {self.dropped} records dropped while the database was unreachable")
+        return "\n".join(lines)
+
+
+llm_telemetry = LLMTelemetry()
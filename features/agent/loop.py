@@ -1,10 +1,13 @@
 # features/agent/loop.py
 
+import asyncio
 import json
 import logging
+import time
 from datetime import datetime
 from langchain_core.messages import SystemMessage, HumanMessage, ToolMessage, AIMessage
 from LLMs.config import llms
+from LLMs.telemetry import llm_telemetry, token_usage
 from features.agent.tools import create_agent_tools
 from features.agent.prompts import AGENT_SYSTEM_PROMPT
 from utils.helpers import BERLIN_TZ
@@ -14,6 +17,14 @@ logger = logging.getLogger(__name__)
 
 MAX_ITERATIONS = 5
 
+# Tool calls of one iteration run concurrently; each one is cut off after its timeout
+TOOL_TIMEOUT_SECONDS = 15
+TOOL_TIMEOUTS = {
+    "get_btc_price_tool": 10,
+    "get_weather_tool": 10,
+    "run_custom_query": 30,
+}
+
 
 def _extract_text(response) -> str:
     """
@@ -40,15 +51,88 @@ def _extract_text(response) -> str:
     return str(content)
 
 
+async def _run_tool_call(tc, tool_map, iteration):
+    """Run one tool call with its timeout. Returns the trace entry and the ToolMessage; never raises."""
+    tool_name = tc["name"]
+    tool_args = tc["args"]
+    timeout = TOOL_TIMEOUTS.get(tool_name, TOOL_TIMEOUT_SECONDS)
+
+    log_entry = {
+        "iteration": iteration + 1,
+        "timestamp": datetime.now(BERLIN_TZ).isoformat(),
+        "tool": tool_name,
+        "args": tool_args,
+    }
+
+    started = time.perf_counter()
+    try:
+        tool_fn = tool_map.get(tool_name)
+        if tool_fn is None:
+            result_str = f"Unknown tool: {tool_name}"
+        else:
+            result_str = await asyncio.wait_for(tool_fn.ainvoke(tool_args), timeout=timeout)
+        log_entry["result"] = result_str[:500] if len(str(result_str)) > 500 else result_str
+        log_entry["error"] = None
+    except asyncio.TimeoutError:
+        result_str = f"Tool error: {tool_name} timed out after {timeout} s"
+        log_entry["result"] = None
+        log_entry["error"] = f"timeout after {timeout} s"
+        logger.error(f"Agent tool timeout: {tool_name}({tool_args}) after {timeout} s")
+    except Exception as e:
+        result_str = f"Tool error: {e}"
+        log_entry["result"] = None
+        log_entry["error"] = str(e)
+        logger.error(f"Agent tool error: {tool_name}({tool_args}) -> {e}")
+    log_entry["wall_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    return log_entry, ToolMessage(content=str(result_str), tool_call_id=tc["id"])
+
+
+async def _invoke(model, messages, stream=None) -> AIMessage:
+    """
+    One LLM turn. With a `stream` (telegram_helpers.message_streamer.TelegramMessageStreamer) the turn is streamed and
+    its text is pushed as it arrives; if the turn turns out to be a tool call, that text is discarded again.
+    """
+    if stream is None:
+        return await model.ainvoke(messages)
+
+    response = None
+    async for chunk in model.astream(messages):
+        response = chunk if response is None else response + chunk
+        if not response.tool_call_chunks:
+            stream.push(_extract_text(chunk))
+    if response is not None and response.tool_calls:
+        stream.discard()
+    return response
+
+
+async def _timed_invoke(llm, model, messages, stream, chain_name):
+    """_invoke, recorded in the LLM call telemetry (LLMs/telemetry.py)."""
+    started = time.perf_counter()
+    try:
+        response = await _invoke(model, messages, stream)
+    except Exception as e:
+        llm_telemetry.record(chain_name, getattr(llm, "model_name", None), getattr(llm, "openai_api_base", None),
+                             latency_ms=(time.perf_counter() - started) * 1000, error=e)
+        raise
+    prompt_tokens, completion_tokens = token_usage(response)
+    llm_telemetry.record(chain_name, getattr(llm, "model_name", None), getattr(llm, "openai_api_base", None),
+                         latency_ms=(time.perf_counter() - started) * 1000,
+                         prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+    return response
+
+
 async def run_agent_loop(
     user_message: str,
     user_id: int,
     chat_id: int,
     first_name: str,
+    stream=None,
 ) -> str:
     """
     Run the agentic tool-calling loop for 'other' messages.
-    Returns the final plain-text response string.
+    Returns the final plain-text response string. Pass a TelegramMessageStreamer as `stream` to show the final
+    LLM turn while it's being generated.
     """
     now = datetime.now(BERLIN_TZ)
     weekday = now.strftime("%A")
@@ -57,7 +141,7 @@ async def run_agent_loop(
     tools = create_agent_tools(user_id, chat_id)
 
     # 2. Bind tools to the LLM (OpenRouter smart, fallback to OpenAI)
-    llm = llms.get("openrouter_smart", llms["smart"])
+    llm = llms["openrouter_smart"] if "openrouter_smart" in llms else llms["smart"]
     llm_with_tools = llm.bind_tools(tools)
 
     # 3. Build initial messages
@@ -75,10 +159,11 @@ async def run_agent_loop(
     # 4. Agent loop
     tool_map = {t.name: t for t in tools}
     tool_log = []
+    iteration_log = []
     response = None
 
     for iteration in range(MAX_ITERATIONS):
-        response: AIMessage = await llm_with_tools.ainvoke(messages)
+        response: AIMessage = await _timed_invoke(llm, llm_with_tools, messages, stream, "agent")
         messages.append(response)
 
         logger.info(
@@ -92,37 +177,23 @@ async def run_agent_loop(
         if not response.tool_calls:
             break
 
-        # Process each tool call
-        for tc in response.tool_calls:
-            tool_name = tc["name"]
-            tool_args = tc["args"]
-            tool_call_id = tc["id"]
-
-            log_entry = {
-                "iteration": iteration + 1,
-                "timestamp": datetime.now(BERLIN_TZ).isoformat(),
-                "tool": tool_name,
-                "args": tool_args,
-            }
-
-            try:
-                tool_fn = tool_map.get(tool_name)
-                if tool_fn is None:
-                    result_str = f"Unknown tool: {tool_name}"
-                else:
-                    result_str = await tool_fn.ainvoke(tool_args)
-                log_entry["result"] = result_str[:500] if len(str(result_str)) > 500 else result_str
-                log_entry["error"] = None
-            except Exception as e:
-                result_str = f"Tool error: {e}"
-                log_entry["result"] = None
-                log_entry["error"] = str(e)
-                logger.error(f"Agent tool error: {tool_name}({tool_args}) -> {e}")
+        # Run this iteration's tool calls concurrently; gather keeps the ToolMessages in tool_call order
+        iteration_started = time.perf_counter()
+        results = await asyncio.gather(*(_run_tool_call(tc, tool_map, iteration) for tc in response.tool_calls))
+        iteration_ms = round((time.perf_counter() - iteration_started) * 1000, 1)
 
+        for log_entry, tool_message in results:
             tool_log.append(log_entry)
-            messages.append(
-                ToolMessage(content=str(result_str), tool_call_id=tool_call_id)
-            )
+            messages.append(tool_message)
+
+        slowest = max((entry for entry, _ in results), key=lambda entry: entry["wall_ms"])
+        iteration_log.append({
+            "iteration": iteration + 1,
+            "tools": len(results),
+            "wall_ms": iteration_ms,                                    # what the user waited for these tools
+            "sequential_ms": round(sum(entry["wall_ms"] for entry, _ in results), 1),  # what it would have been one by one
+            "critical_path": slowest["tool"],
+        })
     else:
         # Hit max iterations — force a final text-only response
         messages.append(
@@ -131,13 +202,13 @@ async def run_agent_loop(
                 "Please give your final response now without using any more tools.]"
             ))
         )
-        response = await llm.ainvoke(messages)  # plain LLM, no tools bound
+        response = await _timed_invoke(llm, llm, messages, stream, "agent_final")  # plain LLM, no tools bound
 
     # 5. Log the full tool trace
     if tool_log:
         logger.info(
             f"🔧 Agent tool trace (user={user_id}, chat={chat_id}):\n"
-            + json.dumps(tool_log, indent=2, default=str)
+            + json.dumps({"iterations": iteration_log, "tool_calls": tool_log}, indent=2, default=str)
         )
 
     # 6. Extract final text (handles str, None, and list-of-content-blocks)
@@ -146,7 +217,7 @@ async def run_agent_loop(
         logger.warning(
             f"⚠️ Agent loop produced empty response. "
             f"raw content type={type(response.content).__name__ if response else 'NoResponse'}, "
-            f"raw content={response.content!r if response else 'N/A'}"
+            f"raw content={response.content if response else 'N/A'!r}"
         )
         final_text = f"I wasn't able to come up with a response {PA}"
 
@@ -2,13 +2,20 @@
 import asyncio
 import logging
 import math
+import httpx
 from models.bitcoin import BitcoinPrice
-import requests
 from telegram import Bot
+from utils.http_client import get_http_client
+from utils.ttl_cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
 STEP_PERCENT = 0.15  # 15% change triggers an alert
+PRICE_TTL_SECONDS = 120  # how long a fetched price is served to everyone else (commands, broadcasts, agent tool)
+COINGECKO_URL = "https://api.coingecko.com/api/v3/simple/price"
+
+# Shared price feed: every caller goes through this cache, concurrent misses share one CoinGecko request
+_price_cache = TTLCache("btc_price")
 
 # Module-level state for threshold monitoring
 _btc_state = {
@@ -44,7 +51,7 @@ async def monitor_btc_price(bot: Bot, chat_id: int):
     """
     while True:
         try:
-            bitcoin_price = await get_btc_price()
+            bitcoin_price = await get_btc_price(force_refresh=True)     # also publishes the fresh price into the shared cache
             price = bitcoin_price.raw_price
             if price is None or price == 0.0:
                 await asyncio.sleep(600)
@@ -84,35 +91,46 @@ async def monitor_btc_price(bot: Bot, chat_id: int):
         await asyncio.sleep(600)  # 10 minutes
 
 
-async def get_btc_price() -> BitcoinPrice:
-    url = "https://api.coingecko.com/api/v3/simple/price?ids=bitcoin&vs_currencies=usd,eur&include_24hr_change=true"
-    try:
-        response = requests.get(url)
-        response.raise_for_status()  # Raise HTTPError for bad responses
-        data = response.json()
+async def fetch_btc_price() -> BitcoinPrice:
+    """One CoinGecko request. Use get_btc_price() instead, which caches and coalesces."""
+    response = await get_http_client().get(
+        COINGECKO_URL,
+        params={"ids": "bitcoin", "vs_currencies": "usd,eur", "include_24hr_change": "true"},
+    )
+    response.raise_for_status()  # Raise HTTPError for bad responses
+    data = response.json()
 
-        usd_price = float(data["bitcoin"]["usd"])  # Convert to float for formatting
-        eur_price = float(data["bitcoin"]["eur"])  # Convert to float for formatting
-        usd_change = float(data["bitcoin"]["usd_24h_change"])  # 24-hour percentage change
+    usd_price = float(data["bitcoin"]["usd"])  # Convert to float for formatting
+    eur_price = float(data["bitcoin"]["eur"])  # Convert to float for formatting
+    usd_change = float(data["bitcoin"]["usd_24h_change"])  # 24-hour percentage change
 
-        mycelium_balance = 0.01614903
-        mycelium_euros = round(eur_price * mycelium_balance, 2)
+    mycelium_balance = 0.01614903
+    mycelium_euros = round(eur_price * mycelium_balance, 2)
 
-        # Format the prices with a comma as the thousands separator
-        usd_price_formatted = f"{usd_price:,.0f}"
-        mycelium_euros_formatted = f"{mycelium_euros:,.0f}"
+    # Format the prices with a comma as the thousands separator
+    usd_price_formatted = f"{usd_price:,.0f}"
+    mycelium_euros_formatted = f"{mycelium_euros:,.0f}"
 
-        simple_message = f"${usd_price_formatted}"
-        detailed_message = f"1₿ = ${usd_price_formatted}\n🍄 = €{mycelium_euros_formatted}"
-        raw_float_price = usd_price
+    simple_message = f"${usd_price_formatted}"
+    detailed_message = f"1₿ = ${usd_price_formatted}\n🍄 = €{mycelium_euros_formatted}"
+    raw_float_price = usd_price
 
-        return BitcoinPrice(
-            simple_message=simple_message,
-            detailed_message=detailed_message,
-            raw_price=raw_float_price,
-            usd_change=usd_change,
-        )
-    except requests.RequestException as e:
+    return BitcoinPrice(
+        simple_message=simple_message,
+        detailed_message=detailed_message,
+        raw_price=raw_float_price,
+        usd_change=usd_change,
+    )
+
+
+async def get_btc_price(force_refresh=False) -> BitcoinPrice:
+    """
+    Current Bitcoin price from the shared feed: served from cache when younger than PRICE_TTL_SECONDS,
+    otherwise fetched once for all concurrent callers.
+    """
+    try:
+        return await _price_cache.get("bitcoin", fetch_btc_price, ttl=PRICE_TTL_SECONDS, force_refresh=force_refresh)
+    except (httpx.HTTPError, KeyError, ValueError) as e:
         simple_message = "Error"
         detailed_message = f"Error fetching Bitcoin price: {e}"
         return BitcoinPrice(
@@ -0,0 +1,99 @@
+# features/broadcast/__init__.py
+import asyncio
+import logging
+import time
+
+from features.broadcast.rate_limiter import TelegramRateLimiter
+from models.message_plan import BroadcastReport, MessagePlan
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENT_PLAN_BUILDS = 8      # plan building hits the DB (and sometimes an LLM), keep well under the pool size
+MAX_CONCURRENT_CHATS = 50           # chats being sent to at the same time
+
+# Shared by every broadcast (and anything else that sends in bulk), so parallel broadcasts can't add up past Telegram's limits
+telegram_rate_limiter = TelegramRateLimiter()
+
+
+async def send_plan(bot, plan: MessagePlan, rate_limiter: TelegramRateLimiter = telegram_rate_limiter) -> int:
+    """Sends one user's plan in order, keeping its in-chat pacing. Returns the number of messages sent."""
+    sent = 0
+    for step in plan.steps:
+        if step.delay_before:
+            await asyncio.sleep(step.delay_before)
+        await rate_limiter.acquire(plan.chat_id)
+        await bot.send_message(
+            chat_id=plan.chat_id,
+            text=step.text,
+            parse_mode=step.parse_mode,
+            reply_markup=step.reply_markup,
+        )
+        sent += 1
+    return sent
+
+
+async def run_broadcast(bot, name, users, build_plan, rate_limiter: TelegramRateLimiter = telegram_rate_limiter) -> BroadcastReport:
+    """
+    Builds every user's message plan concurrently, then sends to all chats concurrently.
+
+    Pacing inside a chat comes from the plans' delays; across chats only the shared rate limiter applies,
+    so the broadcast takes about as long as the slowest single chat instead of the sum of all of them.
+    Within a chat (a group with several users) the plans go out one after another, so messages don't interleave.
+
+    Args:
+        bot: The bot instance to send with.
+        name (str): For logging, e.g. "Morning message".
+        users: Records/dicts with at least user_id, chat_id and first_name.
+        build_plan: Coroutine function (user) -> MessagePlan, or None to skip that user.
+        rate_limiter: Defaults to the shared telegram_rate_limiter.
+
+    Returns:
+        BroadcastReport with counts and the total duration.
+    """
+    started = time.monotonic()
+    build_slots = asyncio.Semaphore(MAX_CONCURRENT_PLAN_BUILDS)
+
+    async def build(user):
+        async with build_slots:
+            try:
+                return await build_plan(user)
+            except Exception as e:
+                logger.error(f"Error building {name} plan for user {user['user_id']} in chat {user['chat_id']}: {e}")
+                return None
+
+    plans = [plan for plan in await asyncio.gather(*(build(user) for user in users)) if plan and plan.steps]
+    build_seconds = time.monotonic() - started
+
+    send_slots = asyncio.Semaphore(MAX_CONCURRENT_CHATS)
+    failures = 0
+    messages_sent = 0
+
+    plans_by_chat = {}
+    for plan in plans:
+        plans_by_chat.setdefault(plan.chat_id, []).append(plan)
+
+    async def send_chat(chat_plans):
+        nonlocal failures, messages_sent
+        async with send_slots:
+            for plan in chat_plans:     # each user's messages as one block
+                try:
+                    sent = await send_plan(bot, plan, rate_limiter)
+                    messages_sent += sent
+                    logger.info(f"{plan.label} sent successfully to user {plan.user_id} in chat {plan.chat_id}")
+                except Exception as e:
+                    failures += 1
+                    logger.error(f"Error sending {plan.label} to chat_id {plan.chat_id}: {e}")
+
+    await asyncio.gather(*(send_chat(chat_plans) for chat_plans in plans_by_chat.values()))
+
+    report = BroadcastReport(
+        name=name,
+        recipients=len(users),
+        plans_sent=len(plans) - failures,
+        messages_sent=messages_sent,
+        failures=failures,
+        build_seconds=build_seconds,
+        total_seconds=time.monotonic() - started,
+    )
+    logger.info(f"📣 {report}")
+    return report
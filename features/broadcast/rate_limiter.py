@@ -0,0 +1,69 @@
+# features/broadcast/rate_limiter.py
+import asyncio
+import time
+
+SWEEP_INTERVAL = 60     # seconds between evictions of chat buckets nobody has used lately
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()     # FIFO, so waiting senders are served in order
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def is_idle(self, now: float) -> bool:
+        """Full again and nobody waiting: a fresh bucket would behave the same"""
+        return not self._lock.locked() and self._tokens + (now - self._updated) * self.rate >= self.capacity
+
+
+class TelegramRateLimiter:
+    """
+    Telegram's bot limits: ~30 messages/s overall, ~1 message/s per private chat and 20 messages/minute per group.
+    acquire(chat_id) waits for both the global and that chat's bucket.
+    """
+
+    def __init__(self, global_rate=30, private_chat_rate=1.0, group_chat_rate=20 / 60):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.private_chat_rate = private_chat_rate
+        self.group_chat_rate = group_chat_rate
+        self._chat_buckets = {}
+        self._last_sweep = time.monotonic()
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            self._evict_idle()
+            if chat_id < 0:     # groups and channels have negative ids
+                bucket = TokenBucket(self.group_chat_rate, 3)
+            else:
+                bucket = TokenBucket(self.private_chat_rate, 1)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _evict_idle(self):
+        """Drop the buckets of chats that haven't been sent to lately, so the dict doesn't grow with every chat ever seen"""
+        now = time.monotonic()
+        if now - self._last_sweep < SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        for chat_id in [chat_id for chat_id, bucket in self._chat_buckets.items() if bucket.is_idle(now)]:
+            del self._chat_buckets[chat_id]
+
+    async def acquire(self, chat_id: int):
+        await self._chat_bucket(chat_id).acquire()
+        await self.global_bucket.acquire()
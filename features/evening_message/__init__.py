@@ -1,6 +1,7 @@
 # features/evening_message/__init__.py
 from utils.db import Database
-from features.evening_message.service import send_personalized_evening_message
+from features.evening_message.service import build_evening_message_plan
+from features.broadcast import run_broadcast
 import logging
 
 logger = logging.getLogger(__name__)
@@ -21,15 +22,14 @@ async def send_evening_message(bot, specific_chat_id=None):
         async with Database.acquire() as conn:
             users = await conn.fetch("SELECT user_id, chat_id, first_name FROM manon_users")
 
-        for user in users:
-            user_id = user["user_id"]
-            chat_id = user["chat_id"]
-
-            if specific_chat_id and chat_id != specific_chat_id:    # skip all users not in the specific chat
-                continue
+        if specific_chat_id:    # skip all users not in the specific chat
+            users = [user for user in users if user["chat_id"] == specific_chat_id]
 
+        async def build_plan(user):
             first_name = user.get("first_name") or "Sardientje"  # Fallback if first_name is NULL or empty
-            await send_personalized_evening_message(bot, chat_id, user_id, first_name, always_send)
+            return await build_evening_message_plan(user["user_id"], user["chat_id"], first_name, always_send)
+
+        return await run_broadcast(bot, "Evening message", users, build_plan)
 
     except Exception as e:
         logger.error(f"Error sending evening messages: {e}")
\ No newline at end of file
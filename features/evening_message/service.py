@@ -1,5 +1,4 @@
 # features/evening_message/service.py
-import asyncio
 import random
 import logging
 from features.goals.service import get_overdue_goals
@@ -10,6 +9,8 @@ from features.evening_message.formatter import (
 )
 from features.bitcoin.monitoring import get_btc_price
 from models.bitcoin import BitcoinPrice
+from models.message_plan import MessagePlan
+from features.broadcast import send_plan
 from utils.session_avatar import PA
 
 logger = logging.getLogger(__name__)
@@ -75,6 +76,40 @@ async def create_evening_message_components(user_id: int, chat_id: int, first_na
     }
 
 
+async def build_evening_message_plan(user_id, chat_id, first_name, always_send=False):
+    """
+    Builds the evening message sequence for one user.
+
+    Returns:
+        MessagePlan, or None if there's nothing worth sending (unless always_send)
+    """
+    message_components = await create_evening_message_components(user_id, chat_id, first_name)
+
+    # Skip sending if no content
+    if not message_components["should_send"] and not always_send:
+        return None
+
+    plan = MessagePlan(chat_id=chat_id, user_id=user_id, label="Evening message")
+    plan.add(message_components["start_emoji"])
+    plan.add(message_components["greeting"], delay_before=1, parse_mode="Markdown")
+
+    # Individual goals with buttons
+    for goal in message_components["goals"]:
+        plan.add(goal["text"], reply_markup=goal["buttons"], parse_mode="Markdown")
+
+    # Stakes message if available
+    if message_components["stakes_message"]:
+        plan.add(message_components["stakes_message"], delay_before=4, parse_mode="Markdown")
+
+    # Motivational quote if available
+    if message_components["motivational_quote"]:
+        plan.add(message_components["motivational_quote"], delay_before=2, parse_mode="Markdown")
+
+    # Final emoji
+    plan.add(message_components["end_emoji"])
+    return plan
+
+
 async def send_personalized_evening_message(bot, chat_id, user_id, first_name, always_send=False):
     """
     Send the personalized evening message to a user
@@ -83,40 +118,11 @@ async def send_personalized_evening_message(bot, chat_id, user_id, first_name, a
         always_send: False by default, True when triggered by user request instead of Cron job
     """
     try:
-        message_components = await create_evening_message_components(user_id, chat_id, first_name)
-
-        # Skip sending if no content
-        if not message_components["should_send"] and not always_send:
+        plan = await build_evening_message_plan(user_id, chat_id, first_name, always_send)
+        if plan is None:
             return
-
-        # Send the message sequence
-        await bot.send_message(chat_id, message_components["start_emoji"])
-        await asyncio.sleep(1)
-        await bot.send_message(chat_id, message_components["greeting"], parse_mode="Markdown")
-
-        # Send individual goals with buttons
-        for goal in message_components["goals"]:
-            await bot.send_message(
-                chat_id=chat_id,
-                text=goal["text"],
-                reply_markup=goal["buttons"],
-                parse_mode="Markdown"
-            )
-
-        # Send stakes message if available
-        if message_components["stakes_message"]:
-            await asyncio.sleep(4)
-            await bot.send_message(chat_id, message_components["stakes_message"], parse_mode="Markdown")
-
-        # Send motivational quote if available
-        if message_components["motivational_quote"]:
-            await asyncio.sleep(2)
-            await bot.send_message(chat_id, message_components["motivational_quote"], parse_mode="Markdown")
-
-        # Send final emoji
-        await bot.send_message(chat_id, message_components["end_emoji"])
-
+        await send_plan(bot, plan)
         logger.info(f"Evening message sent successfully to {first_name}({user_id}) in chat {chat_id}")
 
     except Exception as e:
-        logger.error(f"Error sending evening message to chat_id {chat_id}: {e}")
\ No newline at end of file
+        logger.error(f"Error sending evening message to chat_id {chat_id}: {e}")
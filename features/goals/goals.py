@@ -9,7 +9,9 @@ from utils.db import(
     validate_goal_constraints, 
     update_user_data, 
     fetch_goal_data,
-    create_recurring_goal_instance,
+    create_recurring_goal_instances,
+    transition_goal,
+    POSTPONE_MULTIPLIER,
 )
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 import logging, re
@@ -491,13 +493,14 @@ async def handle_goal_completion(update, goal_id, query):
     try:
         user_id = update.effective_user.id
         chat_id = update.effective_chat.id
-        await update_goal_data(goal_id, status="archived_done", completion_time=datetime.now(tz=BERLIN_TZ))
-        goal_value = await fetch_goal_data(goal_id, columns="goal_value", single_value=True)
-        description = await fetch_goal_data(goal_id, columns="goal_description", single_value=True)
-        await update_user_data(user_id, chat_id, increment_score=goal_value, increment_finished_goals=1, increment_pending_goals=-1)
+        goal = await transition_goal(goal_id, "done", user_id=user_id, chat_id=chat_id)
+        if goal is None:
+            await query.edit_message_text(f"Goal #{goal_id} is no longer pending, nothing changed {PA}", reply_markup=None)
+            return
+        goal_value = goal["goal_value"] or 0
         logger.info(f"✅ Goal #{goal_id} completed: archived and user score increased by {goal_value}")
         await query.edit_message_text(
-                text=f"✅ Goal #{goal_id} completed: archived and user score increased by {round(goal_value, 1)}\n\n✍️ _{description}_",
+                text=f"✅ Goal #{goal_id} completed: archived and user score increased by {round(goal_value, 1)}\n\n✍️ _{goal['goal_description']}_",
             reply_markup=None,
             parse_mode="Markdown"
         )
@@ -505,25 +508,33 @@ async def handle_goal_completion(update, goal_id, query):
         logger.error(f"couldn't handle_goal_completion for goal {goal_id}:\n{e}'")   
     
     
+def archived_goal_text(goal, delete_all_expired_goals=False):
+    """Message for a goal that the scheduled archival marked as failed"""
+    score_decrease = (goal["penalty"] or 0) * -1
+    return f"❌ Goal #{goal['goal_id']} was marked as failed after no progress was reported{'' if delete_all_expired_goals else ' for >39 hours'}. {round(score_decrease, 1)} penalty charged. \n\n✍️_{goal['goal_description']}_"
+
+
 async def handle_goal_failure(update, goal_id, query, bot=None, delete_all_expired_goals=False):
     try:
-        if update == 1.5:
-            user_id = await fetch_goal_data(goal_id, columns="user_id", single_value=True)
-            chat_id = await fetch_goal_data(goal_id, columns="chat_id", single_value=True)
+        if update == 1.5:   # scheduled archiving job: charge the goal's owner
+            user_id, chat_id = None, None
         else:
             user_id = update.effective_user.id
             chat_id = update.effective_chat.id
             
-        await update_goal_data(goal_id, status="archived_failed", completion_time=datetime.now(tz=BERLIN_TZ))
-        penalty = await fetch_goal_data(goal_id, columns="penalty", single_value=True)
-        description = await fetch_goal_data(goal_id, columns="goal_description", single_value=True)
+        goal = await transition_goal(goal_id, "failed", user_id=user_id, chat_id=chat_id)
+        if goal is None:
+            if update != 1.5:
+                await query.edit_message_text(f"Goal #{goal_id} is no longer pending, nothing changed {PA}", reply_markup=None)
+            return
+        penalty = goal["penalty"] or 0
+        description = goal["goal_description"]
         score_decrease = penalty * -1
-        await update_user_data(user_id, chat_id, increment_score=score_decrease, increment_penalties_accrued=penalty, increment_failed_goals=1, increment_pending_goals=-1)
         logger.info(f"✅ Goal #{goal_id}'s failure completed: archived and {round(score_decrease, 1)} penalty charged")
         if update == 1.5:   # in case of scheduled archiving job 
             await bot.send_message(
-                chat_id,
-                text=f"❌ Goal #{goal_id} was marked as failed after no progress was reported{'' if delete_all_expired_goals else ' for >39 hours'}. {round(score_decrease, 1)} penalty charged. \n\n✍️_{description}_",
+                goal["chat_id"],
+                text=archived_goal_text(goal, delete_all_expired_goals),
                 reply_markup=None,
                 parse_mode="Markdown"
             )
@@ -539,39 +550,22 @@ async def handle_goal_failure(update, goal_id, query, bot=None, delete_all_expir
 
 async def handle_goal_push(update, goal_id, query):
     try:
-        # Calculate the new deadline
-        overdue_deadline = await fetch_goal_data(goal_id, columns="deadline", single_value=True)
         # postpone_to_day = match.group(3)    # not yet implemented
-        logging.critical(f"overdue deadline: {overdue_deadline}")
-        if overdue_deadline is None:
-            raise ValueError(f"Deadline not found for goal ID: {goal_id}")
-        # Ensure overdue_deadline is a datetime object
-        if not isinstance(overdue_deadline, datetime):
-            raise TypeError(f"Expected datetime object for deadline, got {type(overdue_deadline).__name__}")
-        
-        # Make overdue_deadline timezone-aware if it is naive
-        if overdue_deadline.tzinfo is None:
-            overdue_deadline = overdue_deadline.replace(tz=BERLIN_TZ)
-        
-        tomorrow = overdue_deadline + timedelta(days=1)
-        while tomorrow <= datetime.now(tz=BERLIN_TZ):
-            tomorrow += timedelta(days=1)
-        tomorrow_formatted = tomorrow.strftime('%a, %d %B')
-    
-        description = await fetch_goal_data(goal_id, columns="goal_description", single_value=True)
-
-        # set new deadline and increment goal
-        await update_goal_data(goal_id, deadline=tomorrow, increment_attempt=True)      
-    
-        # charge penalty
-        postpone_multiplier = 0.65
-        penalty = await fetch_goal_data(goal_id, columns="penalty", single_value=True) * postpone_multiplier
+        # New deadline (first same time-of-day after now), attempt + 1 and the partial penalty, all in one go
         user_id = update.effective_user.id
         chat_id = update.effective_chat.id
-        score_change = penalty * postpone_multiplier * -1
-        await update_user_data(user_id, chat_id, increment_score=score_change, increment_penalties_accrued=penalty)
+        goal = await transition_goal(goal_id, "postpone", user_id=user_id, chat_id=chat_id)
+        if goal is None:
+            await query.edit_message_text(f"Goal #{goal_id} is no longer pending, nothing changed {PA}")
+            return
+        if goal["deadline"] is None:
+            raise ValueError(f"Deadline not found for goal ID: {goal_id}")
+        tomorrow_formatted = goal["deadline"].astimezone(BERLIN_TZ).strftime('%a, %d %B')
+    
+        penalty = (goal["penalty"] or 0) * POSTPONE_MULTIPLIER
+        score_change = penalty * POSTPONE_MULTIPLIER * -1
         
-        text = f"⏭️ Postponed goal #{goal_id} to {tomorrow_formatted}. Charged a partial penalty: score {round(score_change, 1)} {PA}\n\n✍️ _{description}_"
+        text = f"⏭️ Postponed goal #{goal_id} to {tomorrow_formatted}. Charged a partial penalty: score {round(score_change, 1)} {PA}\n\n✍️ _{goal['goal_description']}_"
         await query.edit_message_text(
                 text=text,
                 parse_mode="Markdown"
@@ -582,54 +576,8 @@ async def handle_goal_push(update, goal_id, query):
 
 
 async def activate_recurring_goals(goal_id, user_id, chat_id):
-    columns = "user_id, chat_id, goal_value, penalty, interval, deadlines, goal_description, total_goal_value, goal_category"
-    set_time = datetime.now(tz=BERLIN_TZ)
-
-    goal_data = await fetch_goal_data(goal_id, columns=columns)
-    goal_value = goal_data["goal_value"]
-    penalty = goal_data["penalty"]
-    interval = goal_data["interval"]
-    deadlines = goal_data["deadlines"]
-    goal_description = goal_data["goal_description"]
-    goal_category = goal_data["goal_category"]
-    total_goal_value = goal_data["total_goal_value"]
-
-    deadlines_count = len(deadlines)
-    logger.info(f"Iterating over {deadlines_count} deadlines to activate recurring goals.")
-
-    new_goal_ids = []
-    for i, deadline in enumerate(deadlines, start=1):
-        if i == 1:
-            continue
-
-        final_iteration = "yes" if i == deadlines_count else "not yet"
-        logger.info(f"Inserting goal {i}/{deadlines_count}, final_iteration = {final_iteration}")
-
-        goal_kwargs = {
-            "user_id": user_id,
-            "chat_id": chat_id,
-            "group_id": goal_id,
-            "goal_value": goal_value,
-            "penalty": penalty,
-            "interval": interval,
-            "deadline": deadline,
-            "goal_description": goal_description,
-            "goal_category": goal_category,
-            "total_goal_value": total_goal_value,
-            "set_time": set_time.isoformat(),
-            "final_iteration": final_iteration,
-            "status": "pending",
-            "timeframe": "by_date",
-            "recurrence_type": "recurring",
-            "iteration": i,
-        }
-
-        new_goal_id = await create_recurring_goal_instance(**goal_kwargs)
-        if new_goal_id:
-            new_goal_ids.append(new_goal_id)
-        await update_user_data(user_id, chat_id, increment_pending_goals=1)
-
-    await update_user_data(user_id, chat_id, increment_pending_goals=deadlines_count)
+    # One statement inserts iterations 2..N and bumps pending_goals by the full deadline count (the mother goal is iteration 1)
+    new_goal_ids = await create_recurring_goal_instances(goal_id, user_id, chat_id)
     logger.info(f"All recurring goals created successfully: {new_goal_ids}")
     return new_goal_ids
 
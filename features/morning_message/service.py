@@ -1,5 +1,4 @@
 # features/morning_message/service.py
-import asyncio
 import random
 from datetime import datetime
 from models.user import User
@@ -14,6 +13,8 @@ from features.weather.monitoring import get_weather_change_message
 from utils.db import Database, fetch_random_todays_goal
 from utils.helpers import BERLIN_TZ
 from LLMs.orchestration import run_chain
+from features.broadcast import send_plan
+from models.message_plan import MessagePlan
 import logging
 from utils.session_avatar import PA
 
@@ -114,6 +115,60 @@ async def create_morning_message_components(user_id, chat_id, first_name):
     }
 
 
+async def build_morning_message_plan(user_id, chat_id, first_name=None, always_send=False):
+    """
+    Builds the morning_message sequence for one user (including the occasional grandpa quote).
+
+    Returns:
+        MessagePlan, or None if there's nothing worth sending (unless always_send)
+    """
+    if not first_name:
+        async with Database.acquire() as conn:
+            user = await User.fetch(conn, user_id, chat_id)
+            first_name = user.first_name if user else "there"
+
+    message_components = await create_morning_message_components(user_id, chat_id, first_name)
+
+    # Skip sending if no content
+    if not message_components["should_send"] and not always_send:
+        return None
+
+    plan = MessagePlan(chat_id=chat_id, user_id=user_id, label="Morning message")
+    plan.add(message_components["start_emoji"])
+    plan.add(message_components["greeting"], parse_mode="Markdown")
+
+    # Overdue goals
+    for goal in message_components["overdue_goals"]:
+        plan.add(goal["text"], delay_before=1, reply_markup=goal["buttons"], parse_mode="Markdown")
+
+    # Main content
+    plan.add(message_components["main_content"], delay_before=3, parse_mode="Markdown")
+
+    # Motivational quote if available
+    if message_components["motivational_quote"]:
+        plan.add(message_components["motivational_quote"], delay_before=2, parse_mode="Markdown")
+
+    # Final emoji
+    plan.add(message_components["end_emoji"], delay_before=4)
+
+    # 30% chance: a grandpa quote based on a random today's goal
+    if random.random() < 0.3:
+        todays_goal = await fetch_random_todays_goal(user_id, chat_id)
+        if todays_goal:
+            try:
+                result = await run_chain("grandpa_quote", {"active_goals": todays_goal})
+                grandpa_quote = result.response_text
+                plan.add(
+                    f"Mijn grootvader zei altijd:\n✨_{grandpa_quote}_ 🧙‍♂️✨",
+                    delay_before=random.uniform(3, 6),
+                    parse_mode="Markdown",
+                )
+            except Exception as e:
+                logger.error(f"Error building grandpa quote in morning message: {e}")
+
+    return plan
+
+
 async def send_personalized_morning_message(bot, chat_id, user_id, first_name=None, always_send=False):
     """
     Send the personalized morning_message to a user
@@ -122,58 +177,11 @@ async def send_personalized_morning_message(bot, chat_id, user_id, first_name=No
         always_send: False by default, True when triggered by user request instead of Cron job
     """
     try:
-
-        if not first_name:
-            async with Database.acquire() as conn:
-                user = await User.fetch(conn, user_id, chat_id)
-                first_name = user.first_name if user else "there"
-
-        message_components = await create_morning_message_components(user_id, chat_id, first_name)
-
-        # Skip sending if no content
-        if not message_components["should_send"] and not always_send:
+        plan = await build_morning_message_plan(user_id, chat_id, first_name, always_send)
+        if plan is None:
             return
-
-        # Send the message sequence
-        await bot.send_message(chat_id, message_components["start_emoji"])
-        await bot.send_message(chat_id, message_components["greeting"], parse_mode="Markdown")
-
-        # Send overdue goals
-        for goal in message_components["overdue_goals"]:
-            await asyncio.sleep(1)
-            await bot.send_message(
-                chat_id=chat_id,
-                text=goal["text"],
-                reply_markup=goal["buttons"],
-                parse_mode="Markdown"
-            )
-
-        # Send main content
-        await asyncio.sleep(3)
-        await bot.send_message(chat_id, message_components["main_content"], parse_mode="Markdown")
-
-        # Send motivational quote if available
-        if message_components["motivational_quote"]:
-            await asyncio.sleep(2)
-            await bot.send_message(chat_id, message_components["motivational_quote"], parse_mode="Markdown")
-
-        # Send final emoji
-        await asyncio.sleep(4)
-        await bot.send_message(chat_id, message_components["end_emoji"])
-
-        # 30% chance: send a grandpa quote based on a random today's goal
-        if random.random() < 0.3:
-            todays_goal = await fetch_random_todays_goal(user_id, chat_id)
-            if todays_goal:
-                try:
-                    result = await run_chain("grandpa_quote", {"active_goals": todays_goal})
-                    grandpa_quote = result.response_text
-                    await asyncio.sleep(random.uniform(3, 6))
-                    await bot.send_message(chat_id, f"Mijn grootvader zei altijd:\n✨_{grandpa_quote}_ 🧙‍♂️✨", parse_mode="Markdown")
-                except Exception as e:
-                    logger.error(f"Error sending grandpa quote in morning message: {e}")
-
+        await send_plan(bot, plan)
         logger.info(f"Morning message sent successfully to {first_name}({user_id}) in chat {chat_id}")
 
     except Exception as e:
-        logger.error(f"Error sending morning_message to chat_id {chat_id}: {e}")
\ No newline at end of file
+        logger.error(f"Error sending morning_message to chat_id {chat_id}: {e}")
@@ -0,0 +1,264 @@
+# features/reminders/dispatcher.py
+"""
+Sends reminders (of goals and standalone ones) when they're due, without a scheduler job per reminder.
+
+The dispatcher only holds the reminders due in a short look-ahead window (WINDOW) in a min-heap, and refills it every
+REFILL_INTERVAL with one indexed range query per table. Each refill is diffed against what's loaded: new and moved
+reminders are (re)pushed, deleted/completed ones are forgotten (stale heap entries are skipped when popped). So memory
+stays proportional to the reminders of the next few minutes, however many exist in total, and edits are picked up
+without any rebuild. Code that creates or changes a reminder calls refresh() to have it picked up right away.
+
+Every sent reminder is marked with the due time it was sent for (reminder_sent_for / sent_for), and each refill reads
+the unsent reminders from CATCH_UP ago on. So a reminder that's added (or moved) to a time that has already passed is
+still sent, reminders missed while the bot was down are sent after a restart, up to CATCH_UP late, and none are sent
+twice. A reminder that is moved after it was sent goes out again at its new time.
+"""
+import asyncio
+import heapq
+import logging
+import statistics
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from utils.db import Database
+from utils.helpers import BERLIN_TZ
+
+logger = logging.getLogger(__name__)
+
+WINDOW = timedelta(minutes=15)      # how far ahead reminders are loaded
+REFILL_INTERVAL = 60                # seconds between window refills
+CATCH_UP = timedelta(hours=1)       # still send reminders that were missed (bot down, added late) up to an hour ago
+LAG_WARNING = 5                     # seconds; log when a reminder goes out later than this
+
+
+async def fetch_due_reminders(after: datetime, until: datetime) -> list:
+    """Unsent goal and standalone reminders due in (after, until], as dicts ready for send_reminder."""
+    async with Database.acquire() as conn:
+        goals = await conn.fetch("""
+            SELECT goal_id, user_id, chat_id, goal_description, deadline, reminder_time
+            FROM manon_goals
+            WHERE reminder_scheduled = TRUE
+                AND status = 'pending'
+                AND reminder_time > $1
+                AND reminder_time <= $2
+                AND reminder_sent_for IS DISTINCT FROM reminder_time
+        """, after.isoformat(), until.isoformat())
+        reminders = await conn.fetch("""
+            SELECT reminder_id, user_id, chat_id, reminder_text, time
+            FROM manon_reminders
+            WHERE time > $1
+                AND time <= $2
+                AND sent_for IS DISTINCT FROM time
+        """, after.isoformat(), until.isoformat())
+    return [dict(row) for row in goals] + [dict(row) for row in reminders]
+
+
+async def mark_reminders_sent(sent: dict):
+    """Mark reminders as sent for their due time, `sent` is {reminder_key: due}, in one transaction"""
+    goals = [(key[1], due) for key, due in sent.items() if key[0] == "goal"]
+    reminders = [(key[1], due) for key, due in sent.items() if key[0] == "reminder"]
+    async with Database.acquire() as conn:
+        async with conn.transaction():
+            if goals:
+                await conn.execute("""
+                    UPDATE manon_goals AS g SET reminder_sent_for = s.due::timestamptz
+                    FROM unnest($1::int[], $2::text[]) AS s(goal_id, due)
+                    WHERE g.goal_id = s.goal_id
+                """, [goal_id for goal_id, _ in goals], [due.isoformat() for _, due in goals])
+            if reminders:
+                await conn.execute("""
+                    UPDATE manon_reminders AS r SET sent_for = s.due::timestamptz
+                    FROM unnest($1::int[], $2::text[]) AS s(reminder_id, due)
+                    WHERE r.reminder_id = s.reminder_id
+                """, [reminder_id for reminder_id, _ in reminders], [due.isoformat() for _, due in reminders])
+
+
+def reminder_key(reminder_data: dict):
+    if reminder_data.get("goal_id") is not None:
+        return ("goal", reminder_data["goal_id"]), reminder_data["reminder_time"]
+    return ("reminder", reminder_data["reminder_id"]), reminder_data["time"]
+
+
+class DispatchStats:
+    def __init__(self, max_samples: int = 500):
+        self.lags = deque(maxlen=max_samples)      # seconds between due time and sending
+        self.dispatched = 0
+        self.refills = 0
+        self.refill_ms = 0.0
+        self.loaded = 0
+        self.peak_loaded = 0
+
+    def record_refill(self, ms: float, loaded: int):
+        self.refills += 1
+        self.refill_ms += ms
+        self.loaded = loaded
+        self.peak_loaded = max(self.peak_loaded, loaded)
+
+    def record_dispatch(self, lag: float):
+        self.dispatched += 1
+        self.lags.append(lag)
+
+    def summary(self) -> str:
+        lines = [
+            f"Reminder dispatcher (window {int(WINDOW.total_seconds() // 60)} min)",
+            f"Loaded now: {self.loaded} (peak {self.peak_loaded})",
+            f"Refills: {self.refills}, avg {self.refill_ms / self.refills if self.refills else 0:.1f} ms",
+            f"Dispatched: {self.dispatched}",
+        ]
+        if self.lags:
+            lags = sorted(self.lags)
+            p95 = lags[min(len(lags) - 1, int(len(lags) * 0.95))]
+            lines.append(f"Dispatch lag: median {statistics.median(lags) * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms, "
+                         f"max {lags[-1] * 1000:.0f} ms (last {len(lags)})")
+        return "\n".join(lines)
+
+
+class ReminderDispatcher:
+
+    def __init__(self, send=None):
+        self._send = send               # async callable(reminder_data); defaults to send_reminder_job
+        self._heap = []                 # (due, seq, key)
+        self._loaded = {}               # key -> (due, reminder_data): what the heap entries are checked against
+        self._seq = 0
+        self._sent = {}                 # key -> due of sent reminders that aren't marked as sent in the database yet
+        self._horizon = None            # reminders are loaded up to here
+        self._wake = asyncio.Event()
+        self._refill_requested = False
+        self._task = None
+        self._sending = set()
+        self.stats = DispatchStats()
+
+    @property
+    def loaded(self) -> int:
+        return len(self._loaded)
+
+    async def start(self):
+        """Load the unsent reminders (missed ones of the last CATCH_UP included) and start dispatching. Call once the
+        database is set up."""
+        now = datetime.now(tz=BERLIN_TZ)
+        await self.refill(now)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        logger.info(f"⏰ Reminder dispatcher started: {self.loaded} reminders in the next {WINDOW}, "
+                    f"catching up from {now - CATCH_UP:%H:%M:%S}")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def refresh(self):
+        """Have the window re-read right away, e.g. after a reminder was added or changed"""
+        self._refill_requested = True
+        self._wake.set()
+
+    async def refill(self, now: datetime = None):
+        """Re-read the unsent reminders due from CATCH_UP ago to the end of the window, and diff them in."""
+        started = time.perf_counter()
+        now = now or datetime.now(tz=BERLIN_TZ)
+        horizon = now + WINDOW
+        rows = await fetch_due_reminders(now - CATCH_UP, horizon)
+
+        loaded = {}
+        for reminder_data in rows:
+            key, due = reminder_key(reminder_data)
+            if self._sent.get(key) == due:
+                continue    # sent, only its mark isn't written yet
+            loaded[key] = (due, reminder_data)
+            if self._loaded.get(key, (None,))[0] != due:
+                self._push(key, due)
+        self._loaded = loaded           # anything not read back was deleted, completed or moved out of the window
+        self._horizon = horizon
+        if len(self._heap) > 2 * len(self._loaded) + 64:
+            self._compact()
+        self.stats.record_refill((time.perf_counter() - started) * 1000, len(self._loaded))
+
+    def _push(self, key, due):
+        self._seq += 1
+        heapq.heappush(self._heap, (due, self._seq, key))
+
+    def _compact(self):
+        self._heap = [entry for entry in self._heap if self._loaded.get(entry[2], (None,))[0] == entry[0]]
+        heapq.heapify(self._heap)
+
+    def pop_due(self, now: datetime) -> list:
+        """Take every loaded reminder that is due by `now`, in order, and remember them as sent."""
+        due_reminders = []
+        while self._heap and self._heap[0][0] <= now:
+            due, _, key = heapq.heappop(self._heap)
+            entry = self._loaded.get(key)
+            if entry is None or entry[0] != due:
+                continue    # stale: moved or gone since it was pushed
+            del self._loaded[key]
+            self._sent[key] = due
+            due_reminders.append((due, entry[1]))
+        return due_reminders
+
+    def _next_wait(self, now: datetime, next_refill: float) -> float:
+        wait = next_refill - time.monotonic()
+        while self._heap and self._loaded.get(self._heap[0][2], (None,))[0] != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        if self._heap:
+            wait = min(wait, (self._heap[0][0] - now).total_seconds())
+        return max(wait, 0)
+
+    async def _run(self):
+        next_refill = time.monotonic() + REFILL_INTERVAL
+        while True:
+            try:
+                if self._refill_requested or time.monotonic() >= next_refill:
+                    self._refill_requested = False
+                    await self.refill()
+                    next_refill = time.monotonic() + REFILL_INTERVAL
+
+                now = datetime.now(tz=BERLIN_TZ)
+                due_reminders = self.pop_due(now)
+                if due_reminders:
+                    self._dispatch(due_reminders, now)
+                    await self._mark_sent()
+                    continue
+
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self._next_wait(now, next_refill))
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in reminder dispatcher: {e}")
+                await asyncio.sleep(REFILL_INTERVAL)
+                next_refill = 0
+
+    def _dispatch(self, due_reminders: list, now: datetime):
+        if self._send is None:
+            from features.reminders.reminders import send_reminder_job
+            self._send = send_reminder_job
+        for due, reminder_data in due_reminders:
+            lag = (now - due).total_seconds()
+            self.stats.record_dispatch(lag)
+            if lag > LAG_WARNING:
+                logger.warning(f"⏰ Reminder {reminder_key(reminder_data)[0]} sent {lag:.1f} s late")
+            task = asyncio.create_task(self._send(reminder_data))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _mark_sent(self):
+        sent = dict(self._sent)
+        try:
+            await mark_reminders_sent(sent)
+        except Exception as e:
+            # They stay in _sent, so this process doesn't send them again, and are marked with the next batch
+            logger.error(f"Couldn't mark {len(sent)} reminders as sent: {e}")
+            return
+        for key, due in sent.items():
+            if self._sent.get(key) == due:
+                del self._sent[key]
+
+
+reminder_dispatcher = ReminderDispatcher()
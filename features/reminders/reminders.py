@@ -3,100 +3,40 @@ from datetime import time, datetime, timezone, timedelta
 from utils.helpers import BERLIN_TZ
 from utils.session_avatar import PA
 from utils.db import Database, get_first_name
-from utils.scheduler import scheduler
+from telegram_helpers.bot_registry import get_bot
 
 logger = logging.getLogger(__name__)
 
-# Cleanup of old jobs before scheduling new ones
-def cleanup_old_reminders():
-    for job in scheduler.get_jobs():
-        if job.id.startswith(('goalreminder_', 'regularreminder_')):
-            scheduler.remove_job(job.id)
-            
 
-async def check_upcoming_reminders(bot):
-    
-    """Check for and schedule Goals' & Regular reminders due in the next 24 hours"""
-    
-    try: 
-        cleanup_old_reminders()
-    except Exception as e:
-        logging.errror(f"Couldn't clean up past reminders")
-        
-    try:
-        now = datetime.now(tz=BERLIN_TZ)
-        tomorrow = now + timedelta(days=1)
-        now_str = now.isoformat()
-        tomorrow_str = tomorrow.isoformat()
-        
-        # Query for Goals' reminders in the next 24 hours
-        goals_query = """
-            SELECT 
-                goal_id, user_id, chat_id, goal_description, deadline, reminder_time
-            FROM manon_goals
-            WHERE 
-                reminder_scheduled = True 
-                AND reminder_time >= $1 
-                AND reminder_time <= $2
-                AND status = 'pending'
-            ORDER BY reminder_time
-        """
-        
-        # Query for Regular (standalone) reminders in the next 24 hours
-        reminders_query = """
-            SELECT 
-                reminder_id, user_id, chat_id, reminder_text, time
-            FROM manon_reminders
-            WHERE 
-                time >= $1 
-                AND time <= $2
-            ORDER BY time
-        """
-        
-        async with Database.acquire() as conn:
-            # First query for goals' reminders
-            goals_rows = await conn.fetch(goals_query, now_str, tomorrow_str)
-            # Second query for regular reminders
-            reminder_rows = await conn.fetch(reminders_query, now_str, tomorrow_str)
+async def reminder_is_current(reminder_data: dict) -> bool:
+    """
+    Whether a reminder should still go out: the goal or reminder can have changed (completed, deleted, moved) after
+    the dispatcher loaded it.
+    """
+    async with Database.acquire() as conn:
+        if reminder_data.get("goal_id") is not None:
+            row = await conn.fetchrow("""
+                SELECT reminder_time AS time FROM manon_goals
+                WHERE goal_id = $1 AND status = 'pending' AND reminder_scheduled = TRUE
+            """, reminder_data["goal_id"])
+            scheduled_for = reminder_data.get("reminder_time")
+        else:
+            row = await conn.fetchrow("SELECT time FROM manon_reminders WHERE reminder_id = $1", reminder_data["reminder_id"])
+            scheduled_for = reminder_data.get("time")
+    if row is None:
+        return False
+    return row["time"] is None or scheduled_for is None or abs((row["time"] - scheduled_for).total_seconds()) < 60
 
-            # Schedule each Goals' reminder
-            for row in goals_rows:
-                reminder_time = row['reminder_time']
-                # Calculate delay until reminder time
-                delay = (reminder_time - now).total_seconds()
-                if delay > 0:
-                    # Schedule the reminder
-                    scheduler.add_job(
-                        send_reminder,
-                        'date',
-                        run_date=reminder_time,
-                        args=[bot, row],
-                        id=f"goalreminder_{row['goal_id']}",
-                        replace_existing=True
-                    )
-                    logger.info(f"Scheduled Goals' reminder for goal #{row['goal_id']} at {reminder_time}")
-                    
-            # Schedule each Regular reminder
-            for row in reminder_rows:
-                reminder_time = row['time']
-                # Calculate delay until reminder time
-                delay = (reminder_time - now).total_seconds()
-                if delay > 0:
-                    # Schedule the reminder
-                    scheduler.add_job(
-                        send_reminder,
-                        'date',
-                        run_date=reminder_time,
-                        args=[bot, row],
-                        id=f"regularreminder_{row['reminder_id']}",
-                        replace_existing=True
-                    )
-                    logger.info(f"Scheduled Regular reminder: #{row['reminder_id']} at {reminder_time}")
 
+async def send_reminder_job(reminder_data: dict):
+    """send_reminder for the reminder dispatcher, unless the reminder changed since it was loaded"""
+    try:
+        if not await reminder_is_current(reminder_data):
+            logger.info(f"Skipping outdated reminder: {reminder_data.get('goal_id') or reminder_data.get('reminder_id')}")
+            return
     except Exception as e:
-        logger.error(f"Error checking upcoming reminders: {e}")
-        import traceback
-        logger.error(traceback.format_exc())
+        logger.error(f"Couldn't check whether reminder is still current, sending it anyway: {e}")
+    await send_reminder(get_bot(), reminder_data)
 
 
 async def send_reminder(bot, reminder_data):
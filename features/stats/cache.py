@@ -0,0 +1,35 @@
+# features/stats/cache.py
+"""
+Per-user cache for /stats results.
+
+Everything /stats shows only changes when a goal changes status (or is postponed), when the nightly snapshot runs,
+or when the day rolls over. So results are cached per (user_id, chat_id) for the current day, and the places that
+change goal status call invalidate_user_stats(). Deliberately free of DB imports, so utils.db can use it.
+"""
+import logging
+from datetime import datetime
+
+from utils.helpers import BERLIN_TZ
+
+logger = logging.getLogger(__name__)
+
+_stats_cache = {}      # (user_id, chat_id) -> (date, stats)
+
+
+def get_cached_stats(user_id, chat_id):
+    entry = _stats_cache.get((user_id, chat_id))
+    if entry and entry[0] == datetime.now(BERLIN_TZ).date():
+        return entry[1]
+    return None
+
+
+def store_stats(user_id, chat_id, stats):
+    _stats_cache[(user_id, chat_id)] = (datetime.now(BERLIN_TZ).date(), stats)
+
+
+def invalidate_user_stats(user_id, chat_id):
+    _stats_cache.pop((user_id, chat_id), None)
+
+
+def invalidate_all_stats():
+    _stats_cache.clear()
@@ -11,8 +11,9 @@ async def stats_command(update, context):
     chat_id = update.effective_chat.id
     first_name = await get_first_name(context, user_id, chat_id)
 
-    # Get comprehensive stats
-    stats = await StatsManager.get_comprehensive_stats(user_id, chat_id)
+    # Today, all-time and period stats (two concurrent queries, or none when cached)
+    all_stats = await StatsManager.get_all_stats(user_id, chat_id)
+    stats = all_stats['periods']
 
     def get_trend_arrow(current, baseline, metric_name):
         """Returns emoji arrow based on comparison with weekly baseline"""
@@ -32,9 +33,8 @@ async def stats_command(update, context):
             values.append(f"{value:7.1f}{trend}")
         return f"{metric_name:<14} {' | '.join(values)}"
 
-    # Get both today's and total stats
-    today_stats = await StatsManager.get_today_stats(user_id, chat_id)
-    total_stats = await StatsManager.get_total_stats(user_id, chat_id)
+    today_stats = all_stats['today']
+    total_stats = all_stats['total']
 
     # Calculate today's completion rate
     today_completed = today_stats.get('completed_goals', 0)
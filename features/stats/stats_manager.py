@@ -2,93 +2,138 @@
 from utils.helpers import BERLIN_TZ
 import asyncio, random, re, logging
 from utils.db import get_first_name, fetch_user_stats, Database
+from features.stats.cache import get_cached_stats, store_stats, invalidate_all_stats
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 
 logger = logging.getLogger(__name__)
 
+BACKFILL_MAX_DAYS = 31      # how far back the nightly snapshot job fills days it missed while the bot was down
+STATS_PERIODS = {'week': 7, 'month': 30, 'quarter': 90, 'year': 365}
+
+
 class StatsManager:
     @staticmethod
-    async def update_daily_stats(specific_chat_id=None):
-        """Run at midnight to create daily snapshot"""
-        try:
-            logger.info("Starting daily stats update...")
-            async with Database.acquire() as conn:
-                today = datetime.now(BERLIN_TZ).date()
-                users = await conn.fetch("SELECT user_id, chat_id FROM manon_users")
-                logger.info(f"Fetched {len(users)} users for daily stats update.")
-
-                for user in users:
-                    # If specific_chat_id is provided, process only that chat
-                    if specific_chat_id and user['chat_id'] != specific_chat_id:
-                        continue
-                    logger.info(f"Processing user_id: {user['user_id']}, chat_id: {user['chat_id']}")
+    async def update_daily_stats(specific_chat_id=None, start_date=None, end_date=None, capture_totals=True):
+        """
+        Upserts one snapshot row per user per day in [start_date, end_date] (default: today) in a single statement.
 
-                    # Fetch totals snapshot from manon_users
-                    user_totals = await conn.fetchrow("""
-                        SELECT score, pending_goals, finished_goals, failed_goals
-                        FROM manon_users
-                        WHERE user_id = $1 AND chat_id = $2
-                    """, user['user_id'], user['chat_id'])
+        Only goals touched in the window (set, finished or failed) are read. Rerunning is safe: existing rows are
+        overwritten with the recalculated day metrics.
 
-                    if not user_totals:
-                        logger.warning(f"No totals found for user_id: {user['user_id']}, chat_id: {user['chat_id']}")
-                        continue
-                    
-                    # Calculate daily metrics
-                    daily_metrics = await conn.fetchrow("""
-                        WITH today_goals AS (
-                            SELECT 
-                                COUNT(*) FILTER (WHERE status = 'pending') as goals_set,
-                                COUNT(*) FILTER (WHERE status = 'archived_done' 
-                                    AND DATE(completion_time) = $1) as goals_finished,
-                                COUNT(*) FILTER (WHERE status = 'archived_failed' 
-                                    AND DATE(completion_time) = $1) as goals_failed,
-                                SUM(CASE 
-                                    WHEN status = 'archived_done' AND DATE(completion_time) = $1 
-                                    THEN goal_value * COALESCE(difficulty_multiplier, 1) * COALESCE(impact_multiplier, 1)
-                                    ELSE 0 
-                                END) as score_gained,
-                                SUM(CASE 
-                                    WHEN status = 'archived_failed' AND DATE(completion_time) = $1 
-                                    THEN COALESCE(penalty, 0) 
-                                    ELSE 0 
-                                END) as penalties_incurred
-                            FROM manon_goals 
-                            WHERE user_id = $2 AND chat_id = $3
-                        )
-                        SELECT 
-                            *,
-                            CASE 
-                                WHEN (goals_finished + goals_failed) > 0 
-                                THEN ROUND(CAST(goals_finished::float / (goals_finished + goals_failed) * 100 AS numeric), 2)
-                                ELSE NULL 
-                            END as completion_rate
-                        FROM today_goals
-                    """, today, user['user_id'], user['chat_id'])
+        Args:
+            specific_chat_id: Only snapshot this chat.
+            start_date / end_date (date): Days to (re)calculate, inclusive.
+            capture_totals (bool): Store the current manon_users totals (score, pending/finished/failed) on the
+                last day of the window. Totals can't be reconstructed for older days, those keep what they had (or NULL).
 
-                    if not daily_metrics:
-                        logger.warning(f"No metrics found for user_id: {user['user_id']}, chat_id: {user['chat_id']}")
-                        continue
+        Returns:
+            int: Number of snapshot rows written.
+        """
+        try:
+            today = datetime.now(BERLIN_TZ).date()
+            start_date = start_date or today
+            end_date = end_date or start_date
+            logger.info(f"Starting daily stats update for {start_date} → {end_date}...")
+            async with Database.acquire() as conn:
+                result = await conn.execute("""
+                    WITH days AS (
+                        SELECT d::date AS date FROM generate_series($1::date, $2::date, INTERVAL '1 day') AS d
+                    ), events AS (
+                        -- goals set in the window
+                        SELECT user_id, chat_id, (set_time AT TIME ZONE 'Europe/Berlin')::date AS date,
+                               1 AS goals_set, 0 AS goals_finished, 0 AS goals_failed, 0 AS score_gained, 0 AS penalties_incurred
+                        FROM manon_goals
+                        WHERE set_time >= $1::date::timestamptz AND set_time < ($2::date + 1)::timestamptz
+                          AND status NOT IN ('limbo', 'archived_canceled')
+                          AND ($3::BIGINT IS NULL OR chat_id = $3)
+                        UNION ALL
+                        -- goals finished or failed in the window (goal_value already includes the multipliers)
+                        SELECT user_id, chat_id, (completion_time AT TIME ZONE 'Europe/Berlin')::date,
+                               0,
+                               (status = 'archived_done')::int,
+                               (status = 'archived_failed')::int,
+                               CASE WHEN status = 'archived_done' THEN COALESCE(goal_value, 0) ELSE 0 END,
+                               CASE WHEN status = 'archived_failed' THEN COALESCE(penalty, 0) ELSE 0 END
+                        FROM manon_goals
+                        WHERE completion_time >= $1::date::timestamptz AND completion_time < ($2::date + 1)::timestamptz
+                          AND status IN ('archived_done', 'archived_failed')
+                          AND ($3::BIGINT IS NULL OR chat_id = $3)
+                    ), daily AS (
+                        SELECT user_id, chat_id, date,
+                               SUM(goals_set) AS goals_set,
+                               SUM(goals_finished) AS goals_finished,
+                               SUM(goals_failed) AS goals_failed,
+                               SUM(score_gained) AS score_gained,
+                               SUM(penalties_incurred) AS penalties_incurred
+                        FROM events
+                        GROUP BY user_id, chat_id, date
+                    )
+                    INSERT INTO manon_stats_snapshots (
+                        user_id, chat_id, date, goals_set, goals_finished,
+                        goals_failed, score_gained, penalties_incurred, completion_rate,
+                        score, pending_goals, finished_goals, failed_goals
+                    )
+                    SELECT
+                        u.user_id, u.chat_id, days.date,
+                        COALESCE(daily.goals_set, 0),
+                        COALESCE(daily.goals_finished, 0),
+                        COALESCE(daily.goals_failed, 0),
+                        COALESCE(daily.score_gained, 0),
+                        COALESCE(daily.penalties_incurred, 0),
+                        CASE
+                            WHEN (daily.goals_finished + daily.goals_failed) > 0
+                            THEN ROUND(CAST(daily.goals_finished::float / (daily.goals_finished + daily.goals_failed) * 100 AS numeric), 2)
+                            ELSE NULL
+                        END,
+                        CASE WHEN $4 AND days.date = $2::date THEN u.score END,
+                        CASE WHEN $4 AND days.date = $2::date THEN u.pending_goals END,
+                        CASE WHEN $4 AND days.date = $2::date THEN u.finished_goals END,
+                        CASE WHEN $4 AND days.date = $2::date THEN u.failed_goals END
+                    FROM manon_users u
+                    CROSS JOIN days
+                    LEFT JOIN daily ON daily.user_id = u.user_id AND daily.chat_id = u.chat_id AND daily.date = days.date
+                    WHERE $3::BIGINT IS NULL OR u.chat_id = $3
+                    ON CONFLICT (user_id, chat_id, date) DO UPDATE SET
+                        goals_set = EXCLUDED.goals_set,
+                        goals_finished = EXCLUDED.goals_finished,
+                        goals_failed = EXCLUDED.goals_failed,
+                        score_gained = EXCLUDED.score_gained,
+                        penalties_incurred = EXCLUDED.penalties_incurred,
+                        completion_rate = EXCLUDED.completion_rate,
+                        score = COALESCE(EXCLUDED.score, manon_stats_snapshots.score),
+                        pending_goals = COALESCE(EXCLUDED.pending_goals, manon_stats_snapshots.pending_goals),
+                        finished_goals = COALESCE(EXCLUDED.finished_goals, manon_stats_snapshots.finished_goals),
+                        failed_goals = COALESCE(EXCLUDED.failed_goals, manon_stats_snapshots.failed_goals),
+                        snapshot_time = NOW()
+                """, start_date, end_date, specific_chat_id, capture_totals)
 
-                    await conn.execute("""
-                        INSERT INTO manon_stats_snapshots (
-                            user_id, chat_id, date, goals_set, goals_finished, 
-                            goals_failed, score_gained, penalties_incurred, completion_rate,
-                            score, pending_goals, finished_goals, failed_goals
-                        ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13)
-                    """, user['user_id'], user['chat_id'], today, 
-                        daily_metrics['goals_set'], daily_metrics['goals_finished'],
-                        daily_metrics['goals_failed'], daily_metrics['score_gained'],
-                        daily_metrics['penalties_incurred'], daily_metrics['completion_rate'],
-                        user_totals['score'], user_totals['pending_goals'],
-                        user_totals['finished_goals'], user_totals['failed_goals'])
-                    logger.info(f"Inserted stats for user_id: {user['user_id']}, chat_id: {user['chat_id']}")
+            rows_written = int(result.split()[-1])
+            invalidate_all_stats()
+            logger.info(f"Daily stats update wrote {rows_written} snapshot rows ({start_date} → {end_date})")
+            return rows_written
 
         except Exception as e:
             logger.error(f"Error updating daily stats: {e}", exc_info=True)
             raise
 
+    @staticmethod
+    async def backfill_daily_stats(capture_totals=True, max_days=BACKFILL_MAX_DAYS):
+        """
+        Nightly job (00:01): snapshots the day that just ended, plus any earlier days that were missed because the bot
+        was down at 00:01 (at most max_days back). Also run on startup, with capture_totals=False, since by then the
+        user totals no longer reflect the end of those days.
+        """
+        yesterday = datetime.now(BERLIN_TZ).date() - timedelta(days=1)
+        async with Database.acquire() as conn:
+            last_snapshot = await conn.fetchval("SELECT MAX(date) FROM manon_stats_snapshots WHERE date <= $1", yesterday)
+
+        start_date = yesterday
+        if last_snapshot is not None and last_snapshot < yesterday:
+            start_date = max(last_snapshot + timedelta(days=1), yesterday - timedelta(days=max_days - 1))
+            logger.warning(f"Backfilling daily stats for {start_date} → {yesterday}")
+        return await StatsManager.update_daily_stats(start_date=start_date, end_date=yesterday, capture_totals=capture_totals)
+
     @staticmethod
     async def get_stats_for_period(user_id: int, chat_id: int, days: int, label: str) -> StatsSnapshot:
         """Get aggregated stats for a specific period"""
@@ -139,156 +184,117 @@ class StatsManager:
             raise
 
     @staticmethod
-    async def get_today_stats(user_id: int, chat_id: int) -> dict:
-        """Get statistics for today"""
-        try:
-            today_start = datetime.now(BERLIN_TZ).replace(hour=0, minute=0, second=0, microsecond=0)
-            today_end = today_start + timedelta(days=1)
-
-            # Convert datetime objects to strings
-            today_start_str = today_start.isoformat()
-            today_end_str = today_end.isoformat()
+    async def _fetch_period_stats(user_id: int, chat_id: int) -> Dict[str, StatsSnapshot]:
+        """Week, month, quarter and year figures from the daily snapshots, in one statement."""
+        end_date = datetime.now(BERLIN_TZ).date()
+        columns = []
+        for period_name, days in STATS_PERIODS.items():
+            in_period = f"FILTER (WHERE date >= $3::date - {days})"
+            columns += [
+                f"COALESCE(SUM(goals_set) {in_period}, 0) AS {period_name}_goals_set",
+                f"COALESCE(SUM(goals_finished) {in_period}, 0) AS {period_name}_goals_finished",
+                f"COALESCE(SUM(goals_failed) {in_period}, 0) AS {period_name}_goals_failed",
+                f"COALESCE(SUM(score_gained) {in_period}, 0) AS {period_name}_score_gained",
+                f"COALESCE(SUM(penalties_incurred) {in_period}, 0) AS {period_name}_penalties",
+                f"COALESCE(AVG(goals_set) {in_period}, 0) AS {period_name}_avg_daily_goals_set",
+                f"COALESCE(AVG(goals_finished) {in_period}, 0) AS {period_name}_avg_daily_goals_finished",
+            ]
+        async with Database.acquire() as conn:
+            row = await conn.fetchrow(f"""
+                SELECT {', '.join(columns)}
+                FROM manon_stats_snapshots
+                WHERE user_id = $1
+                    AND chat_id = $2
+                    AND date BETWEEN $3::date - {max(STATS_PERIODS.values())} AND $3::date
+            """, user_id, chat_id, end_date)
 
-            async with Database.acquire() as conn:
-                # Update queries to use string parameters
-                pending_query = """
-                    SELECT COUNT(*) 
-                    FROM manon_goals 
-                    WHERE user_id = $1 
-                    AND chat_id = $2 
-                    AND status = 'pending'
-                    AND deadline >= $3::timestamptz
-                    AND deadline < $4::timestamptz
-                """
-                pending_count = await conn.fetchval(pending_query, user_id, chat_id, today_start_str, today_end_str)
+        periods = {}
+        for period_name in STATS_PERIODS:
+            finished = row[f"{period_name}_goals_finished"]
+            failed = row[f"{period_name}_goals_failed"]
+            periods[period_name] = StatsSnapshot(
+                total_goals_set=row[f"{period_name}_goals_set"],
+                total_goals_finished=finished,
+                total_goals_failed=failed,
+                total_score_gained=row[f"{period_name}_score_gained"],
+                total_penalties=row[f"{period_name}_penalties"],
+                avg_completion_rate=(finished / (finished + failed) * 100) if (finished + failed) > 0 else 0,
+                avg_daily_goals_set=row[f"{period_name}_avg_daily_goals_set"],
+                avg_daily_goals_finished=row[f"{period_name}_avg_daily_goals_finished"],
+                period_name=period_name,
+            )
+        return periods
 
-                # Update other queries similarly...
-                completed_query = """
-                    SELECT COUNT(*) 
-                    FROM manon_goals 
-                    WHERE user_id = $1 
-                    AND chat_id = $2 
-                    AND status = 'archived_done'
-                    AND completion_time >= $3::timestamptz
-                    AND completion_time < $4::timestamptz
-                """
-                completed_count = await conn.fetchval(completed_query, user_id, chat_id, today_start_str, today_end_str)
+    @staticmethod
+    async def _fetch_today_and_total_stats(user_id: int, chat_id: int) -> tuple:
+        """Today's and all-time goal figures plus the score, in one statement."""
+        today_start = datetime.now(BERLIN_TZ).replace(hour=0, minute=0, second=0, microsecond=0)
+        today_end = today_start + timedelta(days=1)
+        async with Database.acquire() as conn:
+            row = await conn.fetchrow("""
+                SELECT
+                    COUNT(*) FILTER (WHERE status = 'pending' AND deadline >= $3::timestamptz AND deadline < $4::timestamptz) AS today_pending,
+                    COUNT(*) FILTER (WHERE status = 'archived_done' AND completion_time >= $3::timestamptz AND completion_time < $4::timestamptz) AS today_completed,
+                    COUNT(*) FILTER (WHERE status = 'archived_failed' AND deadline >= $3::timestamptz AND deadline < $4::timestamptz) AS today_failed,
+                    COALESCE(SUM(goal_value) FILTER (WHERE status = 'archived_done' AND completion_time >= $3::timestamptz AND completion_time < $4::timestamptz), 0) AS today_points,
+                    COUNT(*) FILTER (WHERE set_time >= $3::timestamptz AND set_time < $4::timestamptz AND status NOT IN ('limbo', 'archived_canceled')) AS today_new_goals,
+                    COUNT(*) FILTER (WHERE status = 'pending') AS total_pending,
+                    COUNT(*) FILTER (WHERE status = 'archived_done') AS total_completed,
+                    COUNT(*) FILTER (WHERE status = 'archived_failed') AS total_failed,
+                    COUNT(*) AS total_goals_set,
+                    (SELECT score FROM manon_users WHERE user_id = $1 AND chat_id = $2) AS total_score
+                FROM manon_goals
+                WHERE user_id = $1
+                AND chat_id = $2
+            """, user_id, chat_id, today_start.isoformat(), today_end.isoformat())
 
-                # Get failed goals
-                failed_query = """
-                    SELECT COUNT(*) 
-                    FROM manon_goals 
-                    WHERE user_id = $1 
-                    AND chat_id = $2 
-                    AND status = 'archived_failed'
-                    AND deadline >= $3::timestamptz
-                    AND deadline < $4::timestamptz
-                """
-                failed_count = await conn.fetchval(failed_query, user_id, chat_id, today_start_str, today_end_str)
+        today = {
+            'pending_goals': row['today_pending'],
+            'completed_goals': row['today_completed'],
+            'failed_goals': row['today_failed'],
+            'points_delta': row['today_points'],
+            'new_goals_set': row['today_new_goals'],
+        }
+        total = {
+            'total_score': row['total_score'] or 0,
+            'total_pending': row['total_pending'],
+            'total_completed': row['total_completed'],
+            'total_failed': row['total_failed'],
+            'total_goals_set': row['total_goals_set'],
+        }
+        return today, total
 
-                # Get points gained today
-                points_query = """
-                    SELECT COALESCE(SUM(goal_value), 0)
-                    FROM manon_goals 
-                    WHERE user_id = $1 
-                    AND chat_id = $2 
-                    AND status = 'archived_done'
-                    AND completion_time >= $3::timestamptz
-                    AND completion_time < $4::timestamptz
-                """
-                points_delta = await conn.fetchval(points_query, user_id, chat_id, today_start_str, today_end_str)
+    @staticmethod
+    async def get_all_stats(user_id: int, chat_id: int) -> Dict:
+        """
+        Everything /stats shows: {'today': {...}, 'total': {...}, 'periods': {'week': StatsSnapshot, ...}}.
 
-                # Get new goals set today
-                new_goals_query = """
-                    SELECT COUNT(*) 
-                    FROM manon_goals 
-                    WHERE user_id = $1 
-                    AND chat_id = $2 
-                    AND set_time >= $3::timestamptz
-                    AND set_time < $4::timestamptz
-                    AND status NOT IN ('limbo', 'archived_canceled')
-                """
-                new_goals = await conn.fetchval(new_goals_query, user_id, chat_id, today_start_str, today_end_str)
+        Two statements, run concurrently. Results are cached per user until one of their goals changes status
+        (see features/stats/cache.py), the nightly snapshot runs, or the day rolls over.
+        """
+        cached = get_cached_stats(user_id, chat_id)
+        if cached is not None:
+            return cached
 
-                return {
-                    'pending_goals': pending_count,
-                    'completed_goals': completed_count,
-                    'failed_goals': failed_count,
-                    'points_delta': points_delta,
-                    'new_goals_set': new_goals
-                }
+        (today, total), periods = await asyncio.gather(
+            StatsManager._fetch_today_and_total_stats(user_id, chat_id),
+            StatsManager._fetch_period_stats(user_id, chat_id),
+        )
+        stats = {'today': today, 'total': total, 'periods': periods}
+        store_stats(user_id, chat_id, stats)
+        return stats
 
-        except Exception as e:
-            logger.error(f"Error getting today's stats: {e}")
-            return {
-                'pending_goals': 0,
-                'completed_goals': 0,
-                'failed_goals': 0,
-                'points_delta': 0,
-                'new_goals_set': 0
-            }
+    @staticmethod
+    async def get_today_stats(user_id: int, chat_id: int) -> dict:
+        """Get statistics for today"""
+        return (await StatsManager.get_all_stats(user_id, chat_id))['today']
 
     @staticmethod
     async def get_total_stats(user_id: int, chat_id: int) -> dict:
         """Get all-time totals"""
-        try:
-            async with Database.acquire() as conn:
-                # Get total score from manon_users table
-                score_query = """
-                    SELECT score 
-                    FROM manon_users 
-                    WHERE user_id = $1 
-                    AND chat_id = $2
-                """
-                total_score = await conn.fetchval(score_query, user_id, chat_id)
-
-                # Get counts for different goal statuses
-                stats_query = """
-                    SELECT 
-                        COUNT(*) FILTER (WHERE status = 'pending') as total_pending,
-                        COUNT(*) FILTER (WHERE status = 'archived_done') as total_completed,
-                        COUNT(*) FILTER (WHERE status = 'archived_failed') as total_failed,
-                        COUNT(*) as total_goals_set
-                    FROM manon_goals 
-                    WHERE user_id = $1 
-                    AND chat_id = $2
-                """
-                stats = await conn.fetchrow(stats_query, user_id, chat_id)
-
-                return {
-                    'total_score': total_score or 0,
-                    'total_pending': stats['total_pending'] or 0,
-                    'total_completed': stats['total_completed'] or 0,
-                    'total_failed': stats['total_failed'] or 0,
-                    'total_goals_set': stats['total_goals_set'] or 0
-                }
-
-        except Exception as e:
-            logger.error(f"Error getting total stats: {e}")
-            return {
-                'total_score': 0,
-                'total_pending': 0,
-                'total_completed': 0,
-                'total_failed': 0,
-                'total_goals_set': 0
-            }
+        return (await StatsManager.get_all_stats(user_id, chat_id))['total']
 
     @staticmethod
     async def get_comprehensive_stats(user_id: int, chat_id: int) -> Dict:
         """Get stats for multiple time periods"""
-        periods = {
-            'week': 7,
-            'month': 30,
-            'quarter': 90,
-            'year': 365
-        }
-        
-        stats = {}
-        for period_name, days in periods.items():
-            stats[period_name] = await StatsManager.get_stats_for_period(
-                user_id, chat_id, days, period_name
-            )
-            
-        return stats
-
-
+        return (await StatsManager.get_all_stats(user_id, chat_id))['periods']
@@ -1,13 +1,52 @@
 # features/weather/monitoring.py
-import requests
 import logging
+import time
 from datetime import datetime, timedelta
 from utils.helpers import BERLIN_TZ
+from utils.http_client import get_http_client
+from utils.ttl_cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
 LEIPZIG_LAT = 51.34
 LEIPZIG_LON = 12.38
+OPEN_METEO_URL = "https://api.open-meteo.com/v1/forecast"
+
+# One forecast (yesterday + 5 days, max & min) serves the morning message, the summary and the agent tool
+_forecast_cache = TTLCache("weather_forecast")
+
+
+def _next_full_hour(_forecast=None) -> float:
+    """open-meteo refreshes its forecasts hourly, so a fetched forecast stays good until the next full hour."""
+    now = time.time()
+    return now - (now % 3600) + 3600
+
+
+async def fetch_forecast() -> dict:
+    """One open-meteo request for the union of fields both weather messages need: {date_iso: (max, min)}."""
+    response = await get_http_client().get(
+        OPEN_METEO_URL,
+        params={
+            "latitude": LEIPZIG_LAT,
+            "longitude": LEIPZIG_LON,
+            "daily": "temperature_2m_max,temperature_2m_min",
+            "past_days": 1,
+            "forecast_days": 5,
+            "timezone": "Europe/Berlin",
+        },
+    )
+    response.raise_for_status()
+    daily = response.json()["daily"]
+    return {
+        d: (hi, lo)
+        for d, hi, lo in zip(daily["time"], daily["temperature_2m_max"], daily["temperature_2m_min"])
+    }
+
+
+async def get_forecast() -> dict:
+    """Cached forecast for Leipzig, keyed by today's date so it's refetched when the day rolls over."""
+    today = datetime.now(BERLIN_TZ).date().isoformat()
+    return await _forecast_cache.get(today, fetch_forecast, expires_at=_next_full_hour)
 
 
 async def get_weather_change_message() -> str:
@@ -25,24 +64,8 @@ async def get_weather_change_message() -> str:
         yesterday = today - timedelta(days=1)
         target_day = today + timedelta(days=4)
 
-        response = requests.get(
-            "https://api.open-meteo.com/v1/forecast",
-            params={
-                "latitude": LEIPZIG_LAT,
-                "longitude": LEIPZIG_LON,
-                "daily": "temperature_2m_max",
-                "past_days": 1,
-                "forecast_days": 5,
-                "timezone": "Europe/Berlin",
-            },
-            timeout=10,
-        )
-        response.raise_for_status()
-        data = response.json()
-
-        dates = data["daily"]["time"]
-        temps = data["daily"]["temperature_2m_max"]
-        temp_lookup = dict(zip(dates, temps))
+        forecast = await get_forecast()
+        temp_lookup = {d: hi for d, (hi, lo) in forecast.items()}
 
         temp_yesterday = temp_lookup.get(yesterday.isoformat())
         temp_today = temp_lookup.get(today.isoformat())
@@ -92,26 +115,12 @@ async def get_weather_summary() -> str:
     try:
         today = datetime.now(BERLIN_TZ).date()
 
-        response = requests.get(
-            "https://api.open-meteo.com/v1/forecast",
-            params={
-                "latitude": LEIPZIG_LAT,
-                "longitude": LEIPZIG_LON,
-                "daily": "temperature_2m_max,temperature_2m_min",
-                "forecast_days": 5,
-                "timezone": "Europe/Berlin",
-            },
-            timeout=10,
-        )
-        response.raise_for_status()
-        data = response.json()
-
-        dates = data["daily"]["time"]
-        maxs = data["daily"]["temperature_2m_max"]
-        mins = data["daily"]["temperature_2m_min"]
+        forecast = await get_forecast()
 
         lines = [f"Weather in Leipzig (5-day forecast):"]
-        for d, hi, lo in zip(dates, maxs, mins):
+        for d, (hi, lo) in forecast.items():
+            if d < today.isoformat():     # the forecast also holds yesterday, for the change message
+                continue
             day_label = "Today" if d == today.isoformat() else datetime.fromisoformat(d).strftime("%a %d")
             lines.append(f"  {day_label}: {lo:.0f}°C – {hi:.0f}°C")
 
@@ -1,5 +1,6 @@
 ﻿# main.py
 import asyncio
+import time
 from telegram.ext import ApplicationBuilder, MessageHandler, filters, CommandHandler, CallbackQueryHandler, ExtBot
 from datetime import datetime
 
@@ -8,16 +9,25 @@ from features.morning_message.scheduler import setup_morning_message_scheduler
 from utils.environment_vars import ENV_VARS, is_running_dev
 from utils.helpers import BERLIN_TZ
 from features.bitcoin.monitoring import monitor_btc_price
+from utils.http_client import close_http_client
+from LLMs.telemetry import llm_telemetry
+from utils.job_metrics import job_metrics
+from LLMs.config import WARM_UP_CHAINS, warm_up_chains
 from logger.logger import configure_logging
 from utils.session_avatar import PA
 from utils.db import setup_database, Database
+from telegram_helpers.update_processor import PerChatUpdateProcessor
 from utils.scheduler import (
     scheduler,
+    durable_jobstore,
     CronTrigger,
     fail_goals_warning,
 )
+from utils.leader import leader_election
+from apscheduler.triggers.date import DateTrigger
 # from features.goals.morning_message import send_morning_message
-from features.reminders.reminders import check_upcoming_reminders
+from features.reminders.dispatcher import reminder_dispatcher
+from telegram_helpers.bot_registry import set_bot
 from features.stats.stats_manager import StatsManager
 
 print(f"\n... STARTING ... {PA} \n")
@@ -27,6 +37,17 @@ logger = configure_logging()
 # Global bot instance
 global_bot: ExtBot = None
 
+# Update dispatch: concurrent across chats, in order within a chat (False = PTB's default one-at-a-time processing)
+CONCURRENT_UPDATES = True
+MAX_CONCURRENT_HANDLERS = 16    # global cap on updates being handled at once
+
+# The bitcoin price monitor's alerts
+# BTC_CHAT_ID = -4788252476  # PA test channel
+BTC_CHAT_ID = 1875436366 # Ben & Manon's private channel
+
+# Work that runs in one instance only, the leader (see utils/leader.py), and is stopped when it stops being the leader
+_leader_tasks = []
+
 
 
 
@@ -37,15 +58,49 @@ async def reset_things_on_startup():
 
 # Set up the database and environment
 async def initialize_environment(app):
+    start = time.perf_counter()
     try:
         # Initialize database tables
         await setup_database()
+        logger.info(f"⏱️ Database ready {(time.perf_counter() - start) * 1000:.0f} ms into initialize_environment")
         await reset_things_on_startup()
-        await check_upcoming_reminders(app.bot)     # for any reminders that were scheduled for today at midnight, and were lost upon reboot
-        logger.info("Environment initialized successfully")
+        logger.info(f"Environment initialized successfully in {(time.perf_counter() - start) * 1000:.0f} ms")
     except Exception as e:
         logger.error(f"Error initializing environment: {e}")
         raise
+
+
+# Called by leader_election once this instance holds the leader lock
+async def start_leader_duties(application):
+    # Fire times missed while this instance was following were another instance's to run
+    for job in scheduler.get_jobs(jobstore="default"):
+        if not isinstance(job.trigger, DateTrigger):
+            job.reschedule(job.trigger)
+    scheduler.resume()
+    logger.info("Main scheduler resumed")
+
+    await StatsManager.backfill_daily_stats(capture_totals=False)    # for nights no instance was running at 00:01
+    await durable_jobstore.load()               # archival jobs from before the restart (or from the previous leader)
+    await reminder_dispatcher.start()           # sends reminders, including ones missed while no instance was leading
+
+    # Print all scheduled jobs
+    jobs = scheduler.get_jobs()
+    logger.info(f"Total scheduled jobs: {len(jobs)}")
+    for job in jobs:
+        logger.info(f"Job: {job.name}, Next run: {job.next_run_time}")
+
+    # Start the bitcoin price monitor
+    _leader_tasks.append(asyncio.create_task(monitor_btc_price(application.bot, BTC_CHAT_ID)))
+
+
+# Called by leader_election when the leader lock is lost or released; the jobs stay registered for a next term
+async def stop_leader_duties():
+    scheduler.pause()
+    for task in _leader_tasks:
+        task.cancel()
+    _leader_tasks.clear()
+    await reminder_dispatcher.stop()
+    await durable_jobstore.unload()     # the next leader loads them from the database
     
 
 # Retrieve the bot token based on the environment
@@ -63,6 +118,7 @@ def register_handlers(application):
     from features.bitcoin.command import bitcoin_command, btc_command, btc_alert_command
     from LLMs.commands import smarter_command
     from LLMs.commands import pro_command
+    from LLMs.commands import llmstats_command
     from features.diceroll.command import dice_command
     from features.start.command import start_command
     from features.stats.command import stats_command
@@ -94,6 +150,7 @@ def register_handlers(application):
     
     application.add_handler(CommandHandler("smarter", smarter_command))
     application.add_handler(CommandHandler("pro", pro_command))
+    application.add_handler(CommandHandler("llmstats", llmstats_command))
     application.add_handler(CommandHandler("translate", translate_command))
     
     from utils.listener import analyze_any_message, print_edit, analyze_voice_message
@@ -150,14 +207,6 @@ async def setup(application):
         setup_evening_message_scheduler(application.bot)
         logger.info("Evening message scheduler setup completed")
 
-        scheduler.add_job(
-            check_upcoming_reminders, 
-            CronTrigger(hour=0, minute=0),  # Run at midnight
-            args=[application.bot],
-            misfire_grace_time=7200,
-            coalesce=True
-        )
-        
         # Check and warn for >22hs overdue goals (6hs later schedule_goal_deletion)
         scheduler.add_job(
             fail_goals_warning, 
@@ -168,32 +217,35 @@ async def setup(application):
         )
         
         scheduler.add_job(
-            StatsManager.update_daily_stats,
+            StatsManager.backfill_daily_stats,     # snapshot of the day that just ended (+ any missed days)
             CronTrigger(hour=0, minute=1),  # Run at 00:01
             misfire_grace_time=7200,
             coalesce=True
         )
 
-        if not scheduler.running:
-            logger.info("Starting main scheduler...")
-            scheduler.start()
-            logger.info("Main scheduler started")
-        else:
-            logger.info("Scheduler already running, skipping start in setup()")
-
-        # Print all scheduled jobs after setup
-        jobs = scheduler.get_jobs()
-        logger.info(f"Total scheduled jobs: {len(jobs)}")
-        for job in jobs:
-            logger.info(f"Job: {job.name}, Next run: {job.next_run_time}")
-        
-        # Initialize database, reinitialize reminders and reset necessary data
+        # Initialize database and reset necessary data
         await initialize_environment(application)
-        
-        # Start the bitcoin price monitor
-        # chat_id = -4788252476  # PA test channel
-        chat_id = 1875436366 # Ben & Manon's private channel
-        asyncio.create_task(monitor_btc_price(application.bot, chat_id))
+
+        # Every instance starts the scheduler paused, so jobs added while handling messages (archivals after the
+        # 'resolve' trigger) are written to the durable job store; it only runs them once this instance leads
+        if not scheduler.running:
+            scheduler.start(paused=True)
+            logger.info("Main scheduler started (paused until this instance is the leader)")
+
+        # Only one instance runs the scheduler, reminders and monitors: this one once it's elected (right away, unless
+        # another instance is already running against the same database)
+        leader_election.start(
+            on_elected=lambda: start_leader_duties(application),
+            on_demoted=stop_leader_duties,
+        )
+
+        # Batched writer for the LLM call telemetry
+        llm_telemetry.start()
+        job_metrics.start()
+
+        # Build the LLM chains in the background once polling has started, instead of at import time
+        if WARM_UP_CHAINS:
+            asyncio.create_task(warm_up_chains())
         
         logger.info("Setup completed successfully")
 
@@ -204,6 +256,15 @@ async def setup(application):
         raise
     
 
+async def shutdown(application):
+    await leader_election.stop()    # stops the leader's work first, then lets another instance take over
+    await llm_telemetry.stop()
+    await job_metrics.stop()
+    await reminder_dispatcher.stop()
+    await durable_jobstore.close()
+    await close_http_client()
+
+
 def main():
     logger.info("Entering main function")
 
@@ -216,18 +277,22 @@ def main():
         logger.info("Using *dev bot* (@TestManon_bot)" if is_running_dev() else "Using *prod bot* (@Manon_PA_bot)\n")
         
         # Create the bot application with ApplicationBuilder
-        application = ApplicationBuilder() \
+        builder = ApplicationBuilder() \
             .token(ENV_VARS.TELEGRAM_API_KEY) \
             .connect_timeout(20) \
             .read_timeout(20) \
             .post_init(setup) \
-            .build()
+            .post_shutdown(shutdown)
+        if CONCURRENT_UPDATES:
+            builder = builder.concurrent_updates(PerChatUpdateProcessor(max_concurrent_handlers=MAX_CONCURRENT_HANDLERS))
+        application = builder.build()
 
         # Set the global bot instance
         global global_bot
         global_bot = application.bot
         if not global_bot:
             raise ValueError("Failed to initialize bot")
+        set_bot(global_bot)     # for jobs in the durable job store
 
         # Register handlers
         register_handlers(application)
@@ -2,6 +2,7 @@ import asyncpg
 from datetime import datetime
 from typing import Optional, Dict, Any
 from utils.helpers import BERLIN_TZ
+from features.stats.cache import invalidate_user_stats
 
 
 class Goal:
@@ -90,4 +91,5 @@ class Goal:
             self.penalty,
             self.reminder_scheduled,
             self.final_iteration,
-        )
\ No newline at end of file
+        )
+        invalidate_user_stats(self.user_id, self.chat_id)
\ No newline at end of file
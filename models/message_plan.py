@@ -0,0 +1,42 @@
+# models/message_plan.py
+from dataclasses import dataclass, field
+from typing import Any, List, Optional
+
+
+@dataclass
+class MessageStep:
+    """One message of a plan, sent delay_before seconds after the previous one (in-chat pacing)."""
+    text: str
+    delay_before: float = 0.0
+    parse_mode: Optional[str] = None
+    reply_markup: Any = None
+
+
+@dataclass
+class MessagePlan:
+    """Everything one user gets in one broadcast, built up front so sending is just pacing + rate limiting."""
+    chat_id: int
+    user_id: int
+    label: str
+    steps: List[MessageStep] = field(default_factory=list)
+
+    def add(self, text, delay_before=0.0, parse_mode=None, reply_markup=None) -> "MessagePlan":
+        self.steps.append(MessageStep(text, delay_before, parse_mode, reply_markup))
+        return self
+
+
+@dataclass
+class BroadcastReport:
+    name: str
+    recipients: int             # users considered
+    plans_sent: int             # users that actually got messages
+    messages_sent: int
+    failures: int
+    build_seconds: float
+    total_seconds: float
+
+    def __str__(self) -> str:
+        return (
+            f"{self.name}: {self.messages_sent} messages to {self.plans_sent}/{self.recipients} users "
+            f"in {self.total_seconds:.1f}s (plans built in {self.build_seconds:.1f}s, {self.failures} failed)"
+        )
@@ -0,0 +1,74 @@
+# scripts/benchmarks/_common.py
+"""
+Shared plumbing for the database benchmarks in this folder.
+
+Each benchmark runs against DATABASE_URL, but inside its own throwaway schema (search_path), so the real tables
+are never touched. The pool is installed on utils.db.Database, so the production functions run unmodified.
+"""
+import os
+import sys
+import time
+import uuid
+from contextlib import asynccontextmanager
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+import asyncpg
+
+from utils.environment_vars import ENV_VARS
+from utils.helpers import BERLIN_TZ
+from utils.db import Database, setup_database
+
+
+def _decode_timestamptz(value):
+    from datetime import datetime
+    return datetime.fromisoformat(value).astimezone(BERLIN_TZ) if value is not None else value
+
+
+async def _init_connection(conn):
+    # Same text-format timestamptz codec as Database.initialize()
+    await conn.set_type_codec('timestamptz', encoder=lambda value: value, decoder=_decode_timestamptz, schema='pg_catalog')
+
+
+@asynccontextmanager
+async def bench_database(name):
+    """Yields a connection pool bound to a fresh schema with the bot's tables; drops the schema afterwards."""
+    if not ENV_VARS.DATABASE_URL:
+        raise SystemExit("DATABASE_URL is not set - benchmarks need a (disposable) PostgreSQL database")
+
+    schema = f"bench_{name}_{uuid.uuid4().hex[:8]}"
+    admin = await asyncpg.connect(ENV_VARS.DATABASE_URL)
+    await admin.execute(f"CREATE SCHEMA {schema}")
+    pool = await asyncpg.create_pool(
+        ENV_VARS.DATABASE_URL,
+        min_size=2,
+        max_size=10,
+        server_settings={'timezone': 'Europe/Berlin', 'search_path': schema},
+        init=_init_connection,
+    )
+    Database._pool = pool
+    try:
+        await setup_database()
+        yield pool
+    finally:
+        Database._pool = None
+        await pool.close()
+        await admin.execute(f"DROP SCHEMA {schema} CASCADE")
+        await admin.close()
+
+
+class Timer:
+    """with Timer() as t: ... then t.ms"""
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.ms = (time.perf_counter() - self._start) * 1000
+
+
+def print_table(headers, rows):
+    widths = [max(len(str(h)), *(len(str(r[i])) for r in rows)) for i, h in enumerate(headers)]
+    print("  ".join(str(h).rjust(w) for h, w in zip(headers, widths)))
+    for row in rows:
+        print("  ".join(str(c).rjust(w) for c, w in zip(row, widths)))
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# scripts/benchmarks/bench_daily_stats.py
+"""
+Nightly stats snapshot: the previous per-user loop (3 queries per user) vs the single set-based upsert.
+
+The loop is timed on a sample of users and extrapolated, at 10k users it would otherwise run for a very long time.
+
+Usage (needs a disposable PostgreSQL database):
+    DATABASE_URL=postgresql://... python scripts/benchmarks/bench_daily_stats.py [--users 10000] [--goals 100000] [--loop-sample 200]
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta
+
+from _common import bench_database, Timer, print_table
+
+from utils.helpers import BERLIN_TZ
+from features.stats.stats_manager import StatsManager
+
+
+async def seed(conn, users, goals, days=30):
+    await conn.execute("""
+        INSERT INTO manon_users (user_id, chat_id, score, pending_goals, finished_goals, failed_goals)
+        SELECT u, u, random() * 100, 3, 10, 2 FROM generate_series(1, $1) AS u
+    """, users)
+    # goals spread over the last `days` days; ~60% done, ~20% failed, rest pending
+    await conn.execute("""
+        INSERT INTO manon_goals (user_id, chat_id, status, goal_value, penalty, set_time, deadline, completion_time)
+        SELECT u, u, s.status, 1 + random() * 9, 1 + random() * 20, s.set_time, s.set_time + INTERVAL '1 day',
+               CASE WHEN s.status <> 'pending' THEN s.set_time + random() * INTERVAL '30 hours' END
+        FROM (
+            SELECT 1 + (g % $2) AS u,
+                   NOW() - random() * make_interval(days => $3) AS set_time,
+                   CASE WHEN r < 0.6 THEN 'archived_done' WHEN r < 0.8 THEN 'archived_failed' ELSE 'pending' END AS status
+            FROM (SELECT g, random() AS r FROM generate_series(1, $1) AS g) x
+        ) s
+    """, goals, users, days)
+    await conn.execute("ANALYZE manon_goals; ANALYZE manon_users")
+
+
+async def legacy_update_daily_stats(conn, today, users):
+    """The previous implementation's per-user queries (minus logging), for comparison."""
+    for user in users:
+        user_totals = await conn.fetchrow("""
+            SELECT score, pending_goals, finished_goals, failed_goals
+            FROM manon_users WHERE user_id = $1 AND chat_id = $2
+        """, user['user_id'], user['chat_id'])
+        daily_metrics = await conn.fetchrow("""
+            WITH today_goals AS (
+                SELECT
+                    COUNT(*) FILTER (WHERE status = 'pending') as goals_set,
+                    COUNT(*) FILTER (WHERE status = 'archived_done' AND DATE(completion_time) = $1) as goals_finished,
+                    COUNT(*) FILTER (WHERE status = 'archived_failed' AND DATE(completion_time) = $1) as goals_failed,
+                    SUM(CASE WHEN status = 'archived_done' AND DATE(completion_time) = $1
+                        THEN goal_value * COALESCE(difficulty_multiplier, 1) * COALESCE(impact_multiplier, 1) ELSE 0 END) as score_gained,
+                    SUM(CASE WHEN status = 'archived_failed' AND DATE(completion_time) = $1
+                        THEN COALESCE(penalty, 0) ELSE 0 END) as penalties_incurred
+                FROM manon_goals WHERE user_id = $2 AND chat_id = $3
+            )
+            SELECT *, CASE WHEN (goals_finished + goals_failed) > 0
+                THEN ROUND(CAST(goals_finished::float / (goals_finished + goals_failed) * 100 AS numeric), 2) END as completion_rate
+            FROM today_goals
+        """, today, user['user_id'], user['chat_id'])
+        await conn.execute("""
+            INSERT INTO manon_stats_snapshots (
+                user_id, chat_id, date, goals_set, goals_finished, goals_failed, score_gained, penalties_incurred,
+                completion_rate, score, pending_goals, finished_goals, failed_goals
+            ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13)
+        """, user['user_id'], user['chat_id'], today,
+            daily_metrics['goals_set'], daily_metrics['goals_finished'], daily_metrics['goals_failed'],
+            daily_metrics['score_gained'], daily_metrics['penalties_incurred'], daily_metrics['completion_rate'],
+            user_totals['score'], user_totals['pending_goals'], user_totals['finished_goals'], user_totals['failed_goals'])
+
+
+async def main(args):
+    yesterday = datetime.now(BERLIN_TZ).date() - timedelta(days=1)
+    async with bench_database("daily_stats") as pool:
+        async with pool.acquire() as conn:
+            with Timer() as t:
+                await seed(conn, args.users, args.goals)
+            print(f"Seeded {args.users} users / {args.goals} goals in {t.ms / 1000:.1f}s")
+
+            sample = await conn.fetch("SELECT user_id, chat_id FROM manon_users ORDER BY user_id LIMIT $1", args.loop_sample)
+            with Timer() as loop_t:
+                await legacy_update_daily_stats(conn, yesterday - timedelta(days=40), sample)
+            loop_per_user = loop_t.ms / len(sample)
+
+        with Timer() as one_day:
+            rows = await StatsManager.update_daily_stats(start_date=yesterday, end_date=yesterday)
+        with Timer() as rerun:
+            await StatsManager.update_daily_stats(start_date=yesterday, end_date=yesterday)
+        with Timer() as backfill:
+            backfill_rows = await StatsManager.update_daily_stats(
+                start_date=yesterday - timedelta(days=6), end_date=yesterday, capture_totals=False
+            )
+
+    print_table(
+        ["variant", "rows", "total ms", "ms/user"],
+        [
+            (f"per-user loop (extrapolated from {len(sample)})", args.users, f"{loop_per_user * args.users:.0f}", f"{loop_per_user:.3f}"),
+            ("set-based, one day", rows, f"{one_day.ms:.0f}", f"{one_day.ms / args.users:.4f}"),
+            ("set-based, rerun same day", rows, f"{rerun.ms:.0f}", f"{rerun.ms / args.users:.4f}"),
+            ("set-based, 7-day backfill", backfill_rows, f"{backfill.ms:.0f}", f"{backfill.ms / args.users:.4f}"),
+        ],
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--goals", type=int, default=100_000)
+    parser.add_argument("--loop-sample", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# scripts/benchmarks/bench_recurring_activation.py
+"""
+Recurring goal activation: per-instance inserts (old loop) vs one bulk statement.
+
+Usage (needs a disposable PostgreSQL database):
+    DATABASE_URL=postgresql://... python scripts/benchmarks/bench_recurring_activation.py [N ...]
+"""
+import asyncio
+import sys
+from datetime import datetime, timedelta
+
+from _common import bench_database, Timer, print_table
+
+from utils.helpers import BERLIN_TZ
+from utils.db import Database, create_recurring_goal_instance, create_recurring_goal_instances, update_user_data
+
+USER_ID, CHAT_ID = 1, 1
+REPEATS = 3
+
+
+async def create_mother_goal(conn, n):
+    start = datetime.now(tz=BERLIN_TZ).replace(hour=20, minute=0, second=0, microsecond=0)
+    deadlines = [(start + timedelta(days=i)).isoformat() for i in range(n)]
+    return await conn.fetchval('''
+        INSERT INTO manon_goals (user_id, chat_id, status, recurrence_type, goal_value, penalty, interval,
+                                 deadlines, goal_description, goal_category, total_goal_value)
+        VALUES ($1, $2, 'pending', 'recurring', 2.5, 3.75, 'daily', $3, 'Benchmark goal', ARRAY['health'], $4)
+        RETURNING goal_id
+    ''', USER_ID, CHAT_ID, deadlines, 2.5 * n)
+
+
+async def activate_per_instance(goal_id):
+    """The previous implementation: one INSERT and one counter UPDATE per deadline."""
+    async with Database.acquire() as conn:
+        goal = await conn.fetchrow("SELECT * FROM manon_goals WHERE goal_id = $1", goal_id)
+    set_time = datetime.now(tz=BERLIN_TZ)
+    deadlines = goal["deadlines"]
+    for i, deadline in enumerate(deadlines, start=1):
+        if i == 1:
+            continue
+        await create_recurring_goal_instance(
+            user_id=USER_ID, chat_id=CHAT_ID, group_id=goal_id, goal_value=goal["goal_value"], penalty=goal["penalty"],
+            interval=goal["interval"], deadline=deadline, goal_description=goal["goal_description"],
+            goal_category=goal["goal_category"], total_goal_value=goal["total_goal_value"], set_time=set_time.isoformat(),
+            final_iteration="yes" if i == len(deadlines) else "not yet", status="pending", timeframe="by_date",
+            recurrence_type="recurring", iteration=i,
+        )
+        await update_user_data(USER_ID, CHAT_ID, increment_pending_goals=1)
+
+
+async def main(sizes):
+    async with bench_database("recurring") as pool:
+        async with pool.acquire() as conn:
+            await conn.execute("INSERT INTO manon_users (user_id, chat_id) VALUES ($1, $2)", USER_ID, CHAT_ID)
+
+        rows = []
+        for n in sizes:
+            timings = {"loop": [], "bulk": []}
+            for _ in range(REPEATS):
+                for variant, activate in (("loop", activate_per_instance), ("bulk", None)):
+                    async with pool.acquire() as conn:
+                        goal_id = await create_mother_goal(conn, n)
+                    with Timer() as t:
+                        if activate:
+                            await activate(goal_id)
+                        else:
+                            await create_recurring_goal_instances(goal_id, USER_ID, CHAT_ID)
+                    timings[variant].append(t.ms)
+            loop_ms, bulk_ms = min(timings["loop"]), min(timings["bulk"])
+            rows.append((
+                n, 2 * (n - 1), 1,
+                f"{loop_ms:.1f}", f"{bulk_ms:.1f}",
+                f"{loop_ms / n:.3f}", f"{bulk_ms / n:.3f}", f"{loop_ms / bulk_ms:.1f}x",
+            ))
+
+    print(f"\nRecurring goal activation, best of {REPEATS} (ms)")
+    print_table(["N", "trips(loop)", "trips(bulk)", "loop", "bulk", "loop/goal", "bulk/goal", "speedup"], rows)
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [7, 30, 90, 365]
+    asyncio.run(main(sizes))
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# scripts/benchmarks/bench_reminder_dispatcher.py
+"""
+Reminder scheduling at startup: the old 24-hour rescan (one APScheduler job per reminder due in the next day) vs the
+dispatcher's look-ahead window, by time, what's held in memory, and dispatch lag for a burst of reminders due at once.
+
+Usage (needs a disposable PostgreSQL database):
+    DATABASE_URL=postgresql://... python scripts/benchmarks/bench_reminder_dispatcher.py [N ...]
+"""
+import asyncio
+import logging
+import statistics
+import sys
+import tracemalloc
+from datetime import datetime, timedelta
+
+from _common import bench_database, Timer, print_table
+
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+from features.reminders.dispatcher import ReminderDispatcher, fetch_due_reminders
+from utils.helpers import BERLIN_TZ
+
+USER_ID, CHAT_ID = 1, 1
+DAYS = 7            # reminders are spread over the coming week
+BURST = 200         # reminders due at the same moment, for the lag measurement
+
+
+async def noop(reminder_data):
+    pass
+
+
+async def seed_reminders(conn, n, start, spread):
+    times = [(start + spread * i / n).isoformat() for i in range(n)]
+    await conn.executemany('''
+        INSERT INTO manon_goals (user_id, chat_id, status, goal_description, deadline, reminder_scheduled, reminder_time)
+        VALUES ($1, $2, 'pending', 'Benchmark goal', $3, TRUE, $3)
+    ''', [(USER_ID, CHAT_ID, t) for t in times[::2]])
+    await conn.executemany('''
+        INSERT INTO manon_reminders (user_id, chat_id, reminder_text, time) VALUES ($1, $2, 'Benchmark reminder', $3)
+    ''', [(USER_ID, CHAT_ID, t) for t in times[1::2]])
+
+
+async def rescan():
+    """The old boot path: everything due in the next 24 hours becomes a scheduler job"""
+    scheduler = AsyncIOScheduler(timezone=BERLIN_TZ, jobstores={"default": MemoryJobStore()})
+    scheduler.start(paused=True)
+    now = datetime.now(tz=BERLIN_TZ)
+    for reminder_data in await fetch_due_reminders(now, now + timedelta(days=1)):
+        job_id = f"goalreminder_{reminder_data['goal_id']}" if "goal_id" in reminder_data else f"regularreminder_{reminder_data['reminder_id']}"
+        scheduler.add_job(noop, 'date', run_date=reminder_data.get("reminder_time") or reminder_data["time"],
+                          args=[reminder_data], id=job_id, replace_existing=True)
+    return scheduler, len(scheduler.get_jobs())
+
+
+async def window():
+    dispatcher = ReminderDispatcher(send=noop)
+    await dispatcher.start()
+    return dispatcher, dispatcher.loaded
+
+
+async def measure(setup):
+    tracemalloc.start()
+    with Timer() as t:
+        held, count = await setup()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return held, count, t.ms, memory / 1024
+
+
+async def measure_lag(pool):
+    async with pool.acquire() as conn:
+        await conn.execute("TRUNCATE manon_goals, manon_reminders")
+        due = datetime.now(tz=BERLIN_TZ) + timedelta(seconds=2)
+        await seed_reminders(conn, BURST, due, timedelta(0))
+    dispatcher = ReminderDispatcher(send=noop)
+    await dispatcher.start()
+    while dispatcher.stats.dispatched < BURST:
+        await asyncio.sleep(0.1)
+    await dispatcher.stop()
+    lags = sorted(dispatcher.stats.lags)
+    return statistics.median(lags) * 1000, lags[int(len(lags) * 0.95)] * 1000, lags[-1] * 1000
+
+
+async def main(sizes):
+    logging.disable(logging.WARNING)
+    async with bench_database("dispatcher") as pool:
+        async with pool.acquire() as conn:
+            await conn.execute("INSERT INTO manon_users (user_id, chat_id) VALUES ($1, $2)", USER_ID, CHAT_ID)
+        rows = []
+        for n in sizes:
+            async with pool.acquire() as conn:
+                await conn.execute("TRUNCATE manon_goals, manon_reminders")
+                await seed_reminders(conn, n, datetime.now(tz=BERLIN_TZ) + timedelta(minutes=1), timedelta(days=DAYS))
+                await conn.execute("ANALYZE manon_goals; ANALYZE manon_reminders")
+
+            scheduler, jobs, rescan_ms, rescan_kb = await measure(rescan)
+            scheduler.shutdown(wait=False)
+            dispatcher, loaded, window_ms, window_kb = await measure(window)
+            await dispatcher.stop()
+            rows.append((n, jobs, f"{rescan_ms:.1f}", f"{rescan_kb:.0f}", loaded, f"{window_ms:.1f}", f"{window_kb:.0f}"))
+
+        median, p95, worst = await measure_lag(pool)
+
+    print(f"\nReminders over the next {DAYS} days: 24h rescan into scheduler jobs vs dispatcher window")
+    print_table(["N", "jobs", "rescan ms", "rescan KiB", "loaded", "window ms", "window KiB"], rows)
+    print(f"\nDispatch lag for {BURST} reminders due at once: median {median:.1f} ms, p95 {p95:.1f} ms, max {worst:.1f} ms")
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100, 1000, 10000, 50000]
+    asyncio.run(main(sizes))
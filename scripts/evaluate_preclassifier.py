@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# scripts/evaluate_preclassifier.py
+"""
+Offline evaluation of the local pre-classifier (LLMs/preclassifier.py) against logged initial_classification results.
+
+The log is split chronologically: the model is trained on the older part and evaluated on the newer part, the way it
+would have been used live. The LLM's answers are the ground truth. For every threshold it reports how many LLM calls
+the pre-classifier would have avoided, and how accurate it was on those messages.
+
+Usage:
+    python scripts/evaluate_preclassifier.py [--log log_files/initial_classifications.jsonl] [--train-share 0.8]
+"""
+import argparse
+import os
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import LLMs.preclassifier as preclassifier_module
+from LLMs.preclassifier import PRECLASSIFIER_LOG_PATH, PRECLASSIFIER_THRESHOLD, PreClassifier, load_examples
+
+THRESHOLDS = [0.8, 0.9, 0.95, 0.98, 0.99]
+
+
+def is_correct(prediction, example):
+    return (prediction.result.classification == example["classification"]
+            and prediction.result.user_message_language == example["user_message_language"])
+
+
+def evaluate(classifier, examples, threshold):
+    predictions = [(classifier.classify(example["text"]), example) for example in examples]
+    handled = [(prediction, example) for prediction, example in predictions
+               if prediction and prediction.confidence >= threshold]
+    correct = sum(is_correct(prediction, example) for prediction, example in handled)
+    return {
+        "avoided": len(handled) / len(examples) if examples else 0.0,
+        "accuracy": correct / len(handled) if handled else None,
+        "wrong": len(handled) - correct,
+    }
+
+
+def print_table(headers, rows):
+    widths = [max(len(str(h)), *(len(str(r[i])) for r in rows)) for i, h in enumerate(headers)]
+    print("  ".join(str(h).rjust(w) for h, w in zip(headers, widths)))
+    for row in rows:
+        print("  ".join(str(c).rjust(w) for c, w in zip(row, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--log", default=PRECLASSIFIER_LOG_PATH)
+    parser.add_argument("--train-share", type=float, default=0.8)
+    parser.add_argument("--min-training-examples", type=int, default=preclassifier_module.MIN_TRAINING_EXAMPLES)
+    args = parser.parse_args()
+
+    examples = sorted(load_examples(args.log, limit=None), key=lambda example: example.get("time", ""))
+    if len(examples) < 10:
+        raise SystemExit(f"Only {len(examples)} logged classifications in {args.log}, nothing to evaluate yet")
+
+    preclassifier_module.MIN_TRAINING_EXAMPLES = args.min_training_examples
+    split = int(len(examples) * args.train_share)
+    train, test = examples[:split], examples[split:]
+    print(f"{len(examples)} logged classifications: training on {len(train)}, evaluating on {len(test)}")
+    print(f"Label mix (test): {dict(Counter(example['classification'] for example in test))}\n")
+
+    variants = {
+        "rules only": PreClassifier(use_rules=True).train([]),
+        "model only": PreClassifier(use_rules=False).train(train),
+        "rules + model": PreClassifier(use_rules=True).train(train),
+    }
+    rows = []
+    for name, classifier in variants.items():
+        if name != "rules only" and classifier.classification_model is None:
+            rows.append((name, "-", "-", "-", f"model off (< {args.min_training_examples} examples)"))
+            continue
+        for threshold in THRESHOLDS:
+            result = evaluate(classifier, test, threshold)
+            accuracy = f"{result['accuracy']:.1%}" if result["accuracy"] is not None else "-"
+            marker = " <- live" if threshold == PRECLASSIFIER_THRESHOLD and name == "rules + model" else ""
+            rows.append((name, threshold, f"{result['avoided']:.1%}", accuracy, f"{result['wrong']}{marker}"))
+    print_table(["variant", "threshold", "LLM calls avoided", "accuracy (handled)", "misroutes"], rows)
+
+    rule_hits = Counter()
+    rule_correct = Counter()
+    rules = PreClassifier(use_rules=True).train([])
+    for example in examples:
+        prediction = rules.classify(example["text"])
+        if prediction:
+            rule_hits[prediction.source] += 1
+            rule_correct[prediction.source] += is_correct(prediction, example)
+    if rule_hits:
+        print("\nPer rule (whole log):")
+        print_table(["rule", "hits", "precision"],
+                    [(rule, hits, f"{rule_correct[rule] / hits:.1%}") for rule, hits in rule_hits.most_common()])
+
+
+if __name__ == "__main__":
+    main()
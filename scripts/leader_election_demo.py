@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# scripts/leader_election_demo.py
+"""
+One contender in the leader election of utils/leader.py, without the bot: prints a line whenever it's elected or
+demoted. Start it in two (or more) terminals against the same database, then stop or kill -9 the leader and watch
+another one take over.
+
+Usage:
+    DATABASE_URL=postgresql://... python scripts/leader_election_demo.py [--name a] [--retry 10] [--heartbeat 10] [--lock-id N]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.environment_vars import ENV_VARS
+from utils.leader import LeaderElection, LEADER_LOCK_ID, RETRY_INTERVAL, HEARTBEAT_INTERVAL
+
+
+def announce(name, event):
+    print(f"{time.time():.3f} {name} {event}", flush=True)
+
+
+async def main(args):
+    election = LeaderElection(lock_id=args.lock_id, retry_interval=args.retry, heartbeat_interval=args.heartbeat,
+                              dsn=ENV_VARS.DATABASE_URL)
+
+    async def on_elected():
+        announce(args.name, "elected")
+
+    async def on_demoted():
+        announce(args.name, "demoted")
+
+    election.start(on_elected, on_demoted)
+    announce(args.name, "started")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await election.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--name", default=str(os.getpid()))
+    parser.add_argument("--retry", type=float, default=RETRY_INTERVAL, help="seconds between attempts to take the lock")
+    parser.add_argument("--heartbeat", type=float, default=HEARTBEAT_INTERVAL, help="seconds between the leader's checks")
+    parser.add_argument("--lock-id", type=int, default=LEADER_LOCK_ID)
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
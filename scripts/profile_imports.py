@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# scripts/profile_imports.py
+"""
+Import-time profile of the bot: which modules make startup slow.
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter (so nothing is cached in this process), and
+prints the slowest modules by cumulative time (the module plus everything it imported first) and by self time.
+Optionally also times building every LLM chain, which is deferred until first use / the background warm-up.
+
+Usage:
+    python scripts/profile_imports.py [--module main] [--top 25] [--chains]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def profile(module):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000, len(name) - len(name.lstrip())))
+    if result.returncode != 0 and not rows:
+        raise SystemExit(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    return rows
+
+
+def print_table(headers, rows):
+    widths = [max(len(str(h)), *(len(str(r[i])) for r in rows)) for i, h in enumerate(headers)]
+    print("  ".join(str(h).ljust(w) if i == 0 else str(h).rjust(w) for i, (h, w) in enumerate(zip(headers, widths))))
+    for row in rows:
+        print("  ".join(str(c).ljust(w) if i == 0 else str(c).rjust(w) for i, (c, w) in enumerate(zip(row, widths))))
+
+
+def time_chain_building():
+    sys.path.insert(0, ROOT)
+    started = time.perf_counter()
+    from LLMs.config import chain_configs, chains
+    imported = time.perf_counter()
+    for name in chain_configs:
+        chains[name]
+    built = time.perf_counter()
+    print(f"\nimport LLMs.config: {(imported - started) * 1000:.0f} ms, "
+          f"building all {len(chain_configs)} chains: {(built - imported) * 1000:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--chains", action="store_true", help="also time building all chains")
+    args = parser.parse_args()
+
+    rows = profile(args.module)
+    total = next((cumulative for name, _, cumulative, depth in rows if name == args.module), None)
+    print(f"import {args.module}: {total:.0f} ms total, {len(rows)} modules\n" if total else "")
+
+    by_cumulative = sorted(rows, key=lambda row: row[2], reverse=True)
+    print("Slowest by cumulative time:")
+    print_table(["module", "cumulative ms", "self ms"],
+                [(name, f"{cumulative:.1f}", f"{self_ms:.1f}") for name, self_ms, cumulative, _ in by_cumulative[:args.top]])
+
+    own_modules = [row for row in rows if row[0].split(".")[0] in {"LLMs", "features", "utils", "telegram_helpers", "logger", "models", "leftovers", "main"}]
+    print("\nSlowest of the bot's own modules (self time, i.e. module-level code):")
+    print_table(["module", "self ms", "cumulative ms"],
+                [(name, f"{self_ms:.1f}", f"{cumulative:.1f}")
+                 for name, self_ms, cumulative, _ in sorted(own_modules, key=lambda row: row[1], reverse=True)[:args.top]])
+
+    if args.chains:
+        time_chain_building()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+# telegram_helpers/bot_registry.py
+"""
+The running bot instance, for code that can't be handed one: jobs in the durable job store (utils/job_store.py) are
+pickled, and a Bot can't be, so they look it up here when they run.
+"""
+
+_bot = None
+
+
+def set_bot(bot):
+    global _bot
+    _bot = bot
+
+
+def get_bot():
+    if _bot is None:
+        raise RuntimeError("No bot registered yet (set_bot() is called in main.py)")
+    return _bot
@@ -0,0 +1,201 @@
+# telegram_helpers/message_streamer.py
+import asyncio
+import logging
+import time
+from collections import deque
+
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+TG_MAX = 4000                   # same margin as LLMs.orchestration.TG_MAX (Telegram's hard limit is 4096)
+PLACEHOLDER = "💭"
+PRIVATE_EDIT_INTERVAL = 1.0     # seconds between edits of one message; Telegram allows ~1 message/s per chat
+GROUP_EDIT_INTERVAL = 3.0       # ... and ~20 messages/minute in groups
+CURSOR = " ▍"
+FINAL_EDIT_RETRIES = 3          # retries of the final render after throttling or a network error
+NETWORK_RETRY_DELAY = 1.0
+
+
+class StreamingStats:
+    """Recent time-to-first-token / time-to-first-visible-text measurements, shown by the 'Streaming' trigger."""
+
+    def __init__(self):
+        self.first_token = deque(maxlen=100)
+        self.first_visible = deque(maxlen=100)
+        self.total = deque(maxlen=100)
+        self.edits = 0
+
+    def summary(self) -> str:
+        def median(values):
+            values = sorted(values)
+            return f"{values[len(values) // 2]:.2f} s" if values else "-"
+        return (
+            f"📝 Streamed responses (last {len(self.total)})\n"
+            f"Time to first token: median {median(self.first_token)}\n"
+            f"Time to first visible text: median {median(self.first_visible)}\n"
+            f"Full response: median {median(self.total)}\n"
+            f"Message edits: {self.edits}"
+        )
+
+
+streaming_stats = StreamingStats()
+
+
+def _split_at(text: str, max_len: int) -> int:
+    """Where to cut a too-long text: a paragraph break, else a newline, else a space, else hard."""
+    for separator in ("\n\n", "\n", " "):
+        cut = text.rfind(separator, 0, max_len)
+        if cut > 0:
+            return cut
+    return max_len
+
+
+def split_text(text: str, max_len: int = TG_MAX) -> list:
+    chunks = []
+    while len(text) > max_len:
+        cut = _split_at(text, max_len)
+        chunks.append(text[:cut].rstrip())
+        text = text[cut:].lstrip()
+    return chunks + [text]
+
+
+class TelegramMessageStreamer:
+    """
+    Shows an LLM response while it's being generated, by progressively editing a placeholder message.
+
+    push() only buffers text, so the LLM stream is never held up by Telegram. A background task edits the visible
+    message at most once per edit interval, and continues in a new message once the text outgrows TG_MAX.
+    finish() renders the final text over the same messages, with Markdown where it parses.
+
+    Args:
+        message: The Telegram message to reply to.
+        edit_interval (float): Seconds between edits, defaults to the private/group chat limits.
+    """
+
+    def __init__(self, message, edit_interval: float = None):
+        self.reply_to = message
+        self.chat_id = message.chat_id
+        self.edit_interval = edit_interval or (GROUP_EDIT_INTERVAL if self.chat_id < 0 else PRIVATE_EDIT_INTERVAL)
+        self.messages = []          # sent Telegram messages, oldest first
+        self._shown = {}            # message_id -> (text, parse_mode) it currently shows
+        self._text = ""
+        self._changed = asyncio.Event()
+        self._flusher = None
+        self._started_at = None
+        self.first_token_at = None
+        self.first_visible_at = None
+
+    @property
+    def message_ids(self):
+        return [message.message_id for message in self.messages]
+
+    async def start(self):
+        self._started_at = time.monotonic()
+        await self._new_message()
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    def push(self, text: str):
+        if not text:
+            return
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+        self._text += text
+        self._changed.set()
+
+    def discard(self):
+        """Forget the streamed text (the model decided to call tools after all)."""
+        self._text = ""
+        self._changed.set()
+
+    async def _flush_loop(self):
+        while True:
+            await self._changed.wait()
+            self._changed.clear()
+            chunks = split_text(self._text) if self._text.strip() else [PLACEHOLDER]
+            chunks[-1] += CURSOR if self._text.strip() else ""
+            try:
+                await self._render(chunks)
+                for message in self.messages[len(chunks):]:     # the text got shorter (discarded turn)
+                    await self._edit(message, PLACEHOLDER)
+            except Exception as e:      # e.g. TimedOut: keep streaming, the next edit shows the latest text
+                logger.warning(f"Streaming edit failed, retrying with the next one: {type(e).__name__}: {e}")
+                self._changed.set()
+            await asyncio.sleep(self.edit_interval)
+
+    async def _new_message(self):
+        message = await self.reply_to.reply_text(PLACEHOLDER)
+        self.messages.append(message)
+        self._shown[message.message_id] = (PLACEHOLDER, None)
+
+    async def _render(self, chunks, parse_mode=None, retries=0):
+        for i, chunk in enumerate(chunks):
+            if i == len(self.messages):
+                await self._new_message()
+            await self._edit(self.messages[i], chunk, parse_mode, retries)
+
+    async def _edit(self, message, text, parse_mode=None, retries=0):
+        if self._shown.get(message.message_id) == (text, parse_mode):
+            return
+        try:
+            await message.edit_text(text, parse_mode=parse_mode)
+        except RetryAfter as e:
+            logger.warning(f"Streaming edit throttled by Telegram, waiting {e.retry_after} s")
+            await asyncio.sleep(e.retry_after)
+            if retries:
+                await self._edit(message, text, parse_mode, retries - 1)
+            else:
+                self._changed.set()     # the flusher shows the latest text once it's allowed to again
+            return
+        except BadRequest as e:
+            if parse_mode:
+                await self._edit(message, text, retries=retries)      # unbalanced Markdown: fall back to plain text
+                return
+            if "not modified" not in str(e).lower():
+                logger.error(f"Streaming edit failed: {e}")
+                return
+        except NetworkError:
+            if not retries:
+                raise
+            await asyncio.sleep(NETWORK_RETRY_DELAY)
+            await self._edit(message, text, parse_mode, retries - 1)
+            return
+        streaming_stats.edits += 1
+        self._shown[message.message_id] = (text, parse_mode)
+        if self.first_visible_at is None and text != PLACEHOLDER:
+            self.first_visible_at = time.monotonic()
+
+    async def finish(self, final_text: str, parse_mode="Markdown"):
+        """Stop streaming and show `final_text` (the complete response) across as many messages as it needs."""
+        if self._flusher:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:      # it died earlier; the final text below is what counts
+                logger.error(f"Streaming flusher had stopped: {type(e).__name__}: {e}")
+
+        chunks = split_text(final_text)
+        await self._render(chunks, parse_mode, retries=FINAL_EDIT_RETRIES)
+        for message in self.messages[len(chunks):]:
+            try:
+                await message.delete()
+            except Exception as e:
+                logger.error(f"Couldn't delete leftover streaming message: {e}")
+        self.messages = self.messages[:len(chunks)]
+
+        now = time.monotonic()
+        if self.first_token_at:
+            streaming_stats.first_token.append(self.first_token_at - self._started_at)
+        if self.first_visible_at:
+            streaming_stats.first_visible.append(self.first_visible_at - self._started_at)
+        streaming_stats.total.append(now - self._started_at)
+        logger.info(
+            f"📝 Streamed response in {len(self.messages)} message(s): "
+            f"first token {self._seconds(self.first_token_at)}, first visible text {self._seconds(self.first_visible_at)}, "
+            f"done {now - self._started_at:.2f} s"
+        )
+
+    def _seconds(self, at):
+        return f"{at - self._started_at:.2f} s" if at else "n/a"
@@ -0,0 +1,115 @@
+# telegram_helpers/update_processor.py
+import asyncio
+import logging
+import time
+from collections import deque
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """
+    Processes updates concurrently across chats, but strictly in arrival order within a chat.
+
+    Every chat gets its own FIFO lock (asyncio locks wake waiters in order), so a slow LLM pipeline in one chat
+    only delays that chat's later messages/button taps. A global semaphore, taken *after* the chat lock, caps how many
+    handlers run at once; queued updates of a busy chat therefore never hold global slots.
+
+    Args:
+        max_concurrent_handlers (int): How many updates may be processed at the same time, across all chats.
+        max_queued_updates (int): Admission limit for updates that are being processed or waiting (PTB's own semaphore).
+    """
+
+    def __init__(self, max_concurrent_handlers: int = 16, max_queued_updates: int = 1024):
+        super().__init__(max_concurrent_updates=max_queued_updates)
+        self.max_concurrent_handlers = max_concurrent_handlers
+        self._handler_slots = None
+        self._chat_locks = {}           # chat key -> asyncio.Lock
+        self._chat_queued = {}          # chat key -> number of updates holding or waiting for that lock
+        self._active = 0
+        self._processed = 0
+        self._wait_times = deque(maxlen=500)    # seconds from arrival until the handler started
+        self._max_depth_seen = 0
+
+    async def initialize(self) -> None:
+        self._handler_slots = asyncio.Semaphore(self.max_concurrent_handlers)
+
+    async def shutdown(self) -> None:
+        self._chat_locks.clear()
+        self._chat_queued.clear()
+
+    @staticmethod
+    def _chat_key(update):
+        if isinstance(update, Update):
+            if update.effective_chat:
+                return update.effective_chat.id
+            if update.effective_user:
+                return f"user_{update.effective_user.id}"
+        return None
+
+    async def do_process_update(self, update, coroutine) -> None:
+        if self._handler_slots is None:
+            await self.initialize()
+        arrived = time.monotonic()
+        key = self._chat_key(update)
+
+        if key is None:     # nothing to keep in order with (e.g. poll updates)
+            async with self._handler_slots:
+                await self._run(coroutine, arrived)
+            return
+
+        lock = self._chat_locks.setdefault(key, asyncio.Lock())
+        self._chat_queued[key] = self._chat_queued.get(key, 0) + 1
+        self._max_depth_seen = max(self._max_depth_seen, self._chat_queued[key])
+        try:
+            async with lock:
+                async with self._handler_slots:
+                    await self._run(coroutine, arrived)
+        finally:
+            self._chat_queued[key] -= 1
+            if self._chat_queued[key] == 0:     # forget idle chats so the dicts don't grow forever
+                del self._chat_queued[key]
+                self._chat_locks.pop(key, None)
+
+    async def _run(self, coroutine, arrived):
+        self._wait_times.append(time.monotonic() - arrived)
+        self._active += 1
+        try:
+            await coroutine
+        finally:
+            self._active -= 1
+            self._processed += 1
+
+    def get_metrics(self) -> dict:
+        """Snapshot of queue depths and wait times, e.g. for the 'Queues' trigger."""
+        waits = sorted(self._wait_times)
+
+        def percentile(p):
+            return waits[min(len(waits) - 1, int(p * len(waits)))] if waits else 0.0
+
+        return {
+            "active_handlers": self._active,
+            "max_concurrent_handlers": self.max_concurrent_handlers,
+            "queued_per_chat": {key: depth for key, depth in self._chat_queued.items() if depth > 1},
+            "total_waiting": sum(depth - 1 for depth in self._chat_queued.values()),
+            "max_chat_depth_seen": self._max_depth_seen,
+            "processed": self._processed,
+            "wait_p50_ms": round(percentile(0.50) * 1000, 1),
+            "wait_p95_ms": round(percentile(0.95) * 1000, 1),
+            "wait_max_ms": round(waits[-1] * 1000, 1) if waits else 0.0,
+        }
+
+
+def format_update_processor_metrics(metrics: dict) -> str:
+    queued = "\n".join(f"  • {chat}: {depth}" for chat, depth in metrics["queued_per_chat"].items()) or "  • none"
+    return (
+        f"📬 Update dispatch\n"
+        f"Active handlers: {metrics['active_handlers']}/{metrics['max_concurrent_handlers']}\n"
+        f"Waiting updates: {metrics['total_waiting']} (deepest chat queue seen: {metrics['max_chat_depth_seen']})\n"
+        f"Chats with a backlog:\n{queued}\n"
+        f"Wait before handling (last {min(metrics['processed'], 500)}): "
+        f"p50 {metrics['wait_p50_ms']} ms, p95 {metrics['wait_p95_ms']} ms, max {metrics['wait_max_ms']} ms"
+    )
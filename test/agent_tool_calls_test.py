@@ -0,0 +1,82 @@
+import asyncio
+import time
+import unittest
+from unittest.mock import patch
+
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.tools import tool
+
+import features.agent.loop as agent_loop
+
+
+@tool
+async def slow_goals() -> str:
+    """Slow read."""
+    await asyncio.sleep(0.2)
+    return "3 active goals"
+
+
+@tool
+async def slow_stats() -> str:
+    """Slow read."""
+    await asyncio.sleep(0.2)
+    return "score 42"
+
+
+@tool
+async def hanging_weather() -> str:
+    """Never answers."""
+    await asyncio.sleep(10)
+    return "sunny"
+
+
+class ScriptedLLM:
+    """Asks for all tools in the first iteration, then answers."""
+
+    def __init__(self, tool_names):
+        self.tool_names = tool_names
+        self.seen_messages = None
+
+    def bind_tools(self, tools):
+        return self
+
+    async def ainvoke(self, messages):
+        if not any(isinstance(message, ToolMessage) for message in messages):
+            return AIMessage(content="", tool_calls=[
+                {"name": name, "args": {}, "id": f"call_{i}"} for i, name in enumerate(self.tool_names)
+            ])
+        self.seen_messages = list(messages)
+        return AIMessage(content="Done 💁‍♀️")
+
+
+class AgentToolCallsTest(unittest.IsolatedAsyncioTestCase):
+
+    async def run_loop(self, tools):
+        llm = ScriptedLLM([t.name for t in tools])
+        with patch.object(agent_loop, "create_agent_tools", lambda user_id, chat_id: tools), \
+                patch.dict(agent_loop.llms, {"openrouter_smart": llm}), \
+                patch.dict(agent_loop.TOOL_TIMEOUTS, {"hanging_weather": 0.1}):
+            started = time.perf_counter()
+            answer = await agent_loop.run_agent_loop("How am I doing?", 1, 2, "Josefientje")
+            return answer, llm.seen_messages, time.perf_counter() - started
+
+    async def test_tool_calls_run_concurrently_in_order(self):
+        answer, messages, elapsed = await self.run_loop([slow_goals, slow_stats])
+
+        self.assertEqual("Done 💁‍♀️", answer)
+        self.assertLess(elapsed, 0.35)      # one by one would take 0.4 s
+        tool_messages = [message for message in messages if isinstance(message, ToolMessage)]
+        self.assertEqual(["call_0", "call_1"], [message.tool_call_id for message in tool_messages])
+        self.assertEqual(["3 active goals", "score 42"], [message.content for message in tool_messages])
+
+    async def test_slow_tool_times_out_without_blocking_the_others(self):
+        answer, messages, elapsed = await self.run_loop([hanging_weather, slow_goals])
+
+        self.assertLess(elapsed, 0.35)
+        tool_messages = [message for message in messages if isinstance(message, ToolMessage)]
+        self.assertIn("timed out", tool_messages[0].content)
+        self.assertEqual("3 active goals", tool_messages[1].content)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import asyncio
+import time
+import unittest
+from unittest.mock import patch
+
+import features.broadcast.rate_limiter as rate_limiter_module
+from features.broadcast import run_broadcast
+from features.broadcast.rate_limiter import TelegramRateLimiter
+from models.message_plan import MessagePlan
+
+GROUP, OTHER_GROUP = -100, -200
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await asyncio.sleep(0)
+        self.sent.append((chat_id, text, time.monotonic()))
+
+
+def fast_limiter():
+    return TelegramRateLimiter(global_rate=10_000, private_chat_rate=10_000, group_chat_rate=10_000)
+
+
+class BroadcastTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_plans_in_one_chat_go_out_one_after_another(self):
+        users = [{"user_id": user_id, "chat_id": chat_id, "first_name": f"user{user_id}"}
+                 for user_id, chat_id in [(1, GROUP), (2, GROUP), (3, GROUP), (4, OTHER_GROUP)]]
+
+        async def build_plan(user):
+            plan = MessagePlan(chat_id=user["chat_id"], user_id=user["user_id"], label="Morning message")
+            for step in range(3):
+                plan.add(f"{user['user_id']}.{step}", delay_before=0.02)
+            return plan
+
+        bot = FakeBot()
+        report = await run_broadcast(bot, "Morning message", users, build_plan, rate_limiter=fast_limiter())
+
+        self.assertEqual((12, 0), (report.messages_sent, report.failures))
+        in_group = [text for chat_id, text, _ in bot.sent if chat_id == GROUP]
+        self.assertEqual([f"{user_id}.{step}" for user_id in (1, 2, 3) for step in range(3)], in_group)
+        # ... while the other chat was sent to at the same time
+        first_other = min(stamp for chat_id, _, stamp in bot.sent if chat_id == OTHER_GROUP)
+        last_group = max(stamp for chat_id, _, stamp in bot.sent if chat_id == GROUP)
+        self.assertLess(first_other, last_group)
+
+    async def test_idle_chat_buckets_are_evicted(self):
+        limiter = fast_limiter()
+        for chat_id in range(1, 101):
+            await limiter.acquire(chat_id)
+        self.assertEqual(100, len(limiter._chat_buckets))
+
+        with patch.object(rate_limiter_module, "SWEEP_INTERVAL", 0):
+            await asyncio.sleep(0.01)           # every bucket has refilled
+            await limiter.acquire(1000)
+        self.assertEqual([1000], list(limiter._chat_buckets))
+
+    async def test_buckets_still_in_use_are_kept(self):
+        limiter = TelegramRateLimiter(private_chat_rate=1.0)
+        await limiter.acquire(1)                # empty until it refills in a second
+        with patch.object(rate_limiter_module, "SWEEP_INTERVAL", 0):
+            await limiter.acquire(2)
+        self.assertEqual({1, 2}, set(limiter._chat_buckets))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import json
+import os
+import unittest
+import uuid
+from datetime import datetime, timedelta
+
+import asyncpg
+
+from features.reminders.dispatcher import WINDOW, fetch_due_reminders
+from utils.db import Database, fetch_upcoming_goals, setup_database
+from utils.helpers import BERLIN_TZ
+from utils.migrations import MANAGED_INDEXES
+from utils.scheduler import fetch_overdue_goals, fetch_overdue_goals_by_user
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+USER_ID, CHAT_ID = 1001, 2002
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+@unittest.skipUnless(TEST_DATABASE_URL, "TEST_DATABASE_URL not set (needs a disposable PostgreSQL database)")
+class GoalIndexUsageTest(unittest.IsolatedAsyncioTestCase):
+    """
+    Runs the real overview/reminder functions against a throwaway schema, captures the SQL they send and EXPLAINs it.
+    Sequential scans are switched off, so the planner takes an index whenever one *can* serve the query; what's
+    asserted is that every time predicate ends up in an index condition instead of a row-by-row filter.
+    """
+
+    async def asyncSetUp(self):
+        self.schema = f"test_idx_{uuid.uuid4().hex[:8]}"
+        self.captured = []
+        self.admin = await asyncpg.connect(TEST_DATABASE_URL)
+        await self.admin.execute(f"CREATE SCHEMA {self.schema}")
+
+        async def init(conn):
+            await conn.set_type_codec('timestamptz', encoder=lambda value: value, decoder=lambda value: value, schema='pg_catalog')
+            conn.add_query_logger(lambda record: self.captured.append((record.query, record.args)))
+
+        self.pool = await asyncpg.create_pool(
+            TEST_DATABASE_URL,
+            min_size=1,
+            max_size=2,
+            server_settings={'timezone': 'Europe/Berlin', 'search_path': self.schema, 'enable_seqscan': 'off'},
+            init=init,
+        )
+        self.original_pool, Database._pool = Database._pool, self.pool
+        await setup_database()
+        async with self.pool.acquire() as conn:
+            await conn.execute("INSERT INTO manon_users (user_id, chat_id) VALUES ($1, $2)", USER_ID, CHAT_ID)
+            await conn.execute("ANALYZE")
+        self.captured.clear()
+
+    async def asyncTearDown(self):
+        Database._pool = self.original_pool
+        await self.pool.close()
+        await self.admin.execute(f"DROP SCHEMA {self.schema} CASCADE")
+        await self.admin.close()
+
+    async def explain_captured(self, table):
+        """EXPLAIN every captured SELECT on `table`, returning their flattened plan nodes."""
+        plans = []
+        async with self.pool.acquire() as conn:
+            for query, args in self.captured:
+                if f"FROM {table}" not in query or not query.lstrip().upper().startswith("SELECT"):
+                    continue
+                result = await conn.fetchval(f"EXPLAIN (FORMAT JSON) {query}", *(args or ()))
+                plans.append((query, list(plan_nodes(json.loads(result)[0]["Plan"]))))
+        self.assertTrue(plans, f"no queries on {table} were captured")
+        return plans
+
+    def assertColumnUsesIndex(self, plans, column, index_name):
+        for query, nodes in plans:
+            with self.subTest(query=" ".join(query.split())[:160]):
+                index_conditions = " ".join(node.get("Index Cond", "") for node in nodes)
+                filters = " ".join(node.get("Filter", "") for node in nodes)
+                self.assertIn(index_name, [node.get("Index Name") for node in nodes])
+                self.assertIn(column, index_conditions)
+                self.assertNotIn(column, filters)
+
+    async def test_managed_indexes_exist(self):
+        async with self.pool.acquire() as conn:
+            existing = {row["indexname"] for row in await conn.fetch(
+                "SELECT indexname FROM pg_indexes WHERE schemaname = $1", self.schema
+            )}
+        self.assertLessEqual(set(MANAGED_INDEXES), existing)
+
+    async def test_overdue_goal_timeframes_use_pending_deadline_index(self):
+        for timeframe in ("today", "overdue", "overdue_today", "overdue_old", "yesterday", "older", "older_followup"):
+            await fetch_overdue_goals(CHAT_ID, USER_ID, timeframe=timeframe)
+        plans = await self.explain_captured("manon_goals")
+        self.assertEqual(7, len(plans))
+        self.assertColumnUsesIndex(plans, "deadline", "idx_manon_goals_pending_user_deadline")
+
+    async def test_overdue_goals_of_all_users_use_pending_deadline_index(self):
+        await fetch_overdue_goals_by_user(timeframe="older")
+        await fetch_overdue_goals_by_user(timeframe="overdue", chat_id=CHAT_ID)
+        plans = await self.explain_captured("manon_users")
+        self.assertEqual(2, len(plans))
+        self.assertColumnUsesIndex(plans, "deadline", "idx_manon_goals_pending_user_deadline")
+
+    async def test_upcoming_goal_timeframes_use_pending_deadline_index(self):
+        for timeframe in ("24hs", "rest_of_day", "tomorrow", "next week", 6):
+            await fetch_upcoming_goals(CHAT_ID, USER_ID, timeframe=timeframe)
+        plans = await self.explain_captured("manon_goals")
+        self.assertEqual(5, len(plans))
+        self.assertColumnUsesIndex(plans, "deadline", "idx_manon_goals_pending_user_deadline")
+
+    async def test_dispatcher_window_uses_time_indexes(self):
+        now = datetime.now(tz=BERLIN_TZ)
+        await fetch_due_reminders(now - timedelta(minutes=1), now + WINDOW)
+        self.assertColumnUsesIndex(await self.explain_captured("manon_goals"), "reminder_time", "idx_manon_goals_pending_reminder_time")
+        self.assertColumnUsesIndex(await self.explain_captured("manon_reminders"), "time", "idx_manon_reminders_time")
+
+
+if __name__ == "__main__":
+    unittest.main()
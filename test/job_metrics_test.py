@@ -0,0 +1,129 @@
+import asyncio
+import os
+import time
+import unittest
+import uuid
+from datetime import datetime, timedelta
+
+import asyncpg
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+from utils.db import Database
+from utils.helpers import BERLIN_TZ
+from utils.job_metrics import JobMetrics
+from utils.migrations import run_migrations
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+
+async def quick():
+    await asyncio.sleep(0.05)
+
+
+async def broken():
+    raise ValueError("nope")
+
+
+def blocking_tick():
+    pass
+
+
+class JobMetricsTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.metrics = JobMetrics()
+        self.scheduler = AsyncIOScheduler(timezone=BERLIN_TZ)
+        self.metrics.attach(self.scheduler)
+        self.scheduler.start()
+
+    async def asyncTearDown(self):
+        self.scheduler.shutdown(wait=False)
+
+    async def wait_for_runs(self, count):
+        for _ in range(100):
+            if len(self.metrics.runs) >= count:
+                return
+            await asyncio.sleep(0.02)
+        self.fail(f"only {len(self.metrics.runs)} of {count} runs recorded")
+
+    async def test_outcomes_lag_and_duration(self):
+        now = datetime.now(tz=BERLIN_TZ)
+        self.scheduler.add_job(quick, "date", run_date=now, id="quick", name="Quick job")
+        self.scheduler.add_job(broken, "date", run_date=now, id="broken")
+        self.scheduler.add_job(quick, "date", run_date=now - timedelta(seconds=30), id="late", misfire_grace_time=1)
+        await self.wait_for_runs(3)
+
+        runs = {run.job_id: run for run in self.metrics.runs}
+        self.assertEqual(("ok", "Quick job"), (runs["quick"].outcome, runs["quick"].job_name))
+        self.assertGreaterEqual(runs["quick"].duration, 0.04)
+        self.assertLess(runs["quick"].lag, 1)
+        self.assertEqual("error", runs["broken"].outcome)
+        self.assertIn("nope", runs["broken"].error)
+        self.assertEqual("missed", runs["late"].outcome)
+        self.assertGreaterEqual(runs["late"].lag, 30)
+
+        summary = self.metrics.summary()
+        self.assertIn("Quick job: 1 runs, lag p50", summary)
+        self.assertIn("broken: 1 runs", summary)
+        self.assertIn("1 error", summary)
+        self.assertIn("1 missed", summary)
+
+    async def test_blocked_loop_shows_as_lag_and_coalesced_runs(self):
+        self.scheduler.add_job(blocking_tick, "interval", seconds=0.1, id="tick", coalesce=True, misfire_grace_time=5)
+        await self.wait_for_runs(1)
+        time.sleep(0.45)        # the event loop is blocked through several fire times
+        await self.wait_for_runs(2)
+
+        late_run = self.metrics.runs[1]
+        self.assertEqual("ok", late_run.outcome)
+        self.assertGreaterEqual(late_run.coalesced, 2)
+        self.assertGreater(late_run.lag, 0.2)
+        self.assertIn("coalesced", self.metrics.summary())
+
+
+@unittest.skipUnless(TEST_DATABASE_URL, "TEST_DATABASE_URL not set (needs a disposable PostgreSQL database)")
+class JobMetricsExportTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.schema = f"test_jobruns_{uuid.uuid4().hex[:8]}"
+        self.admin = await asyncpg.connect(TEST_DATABASE_URL)
+        await self.admin.execute(f"CREATE SCHEMA {self.schema}")
+
+        async def init(conn):
+            # Text-format timestamptz, as Database.initialize() sets up
+            await conn.set_type_codec('timestamptz', encoder=lambda value: value, decoder=lambda value: value, schema='pg_catalog')
+
+        self.pool = await asyncpg.create_pool(TEST_DATABASE_URL, min_size=1, max_size=2, init=init, server_settings={'search_path': self.schema})
+        self.original_pool, Database._pool = Database._pool, self.pool
+        async with self.pool.acquire() as conn:
+            await run_migrations(conn)
+
+    async def asyncTearDown(self):
+        Database._pool = self.original_pool
+        await self.pool.close()
+        await self.admin.execute(f"DROP SCHEMA {self.schema} CASCADE")
+        await self.admin.close()
+
+    async def test_runs_are_exported(self):
+        metrics = JobMetrics()
+        scheduled = datetime.now(tz=BERLIN_TZ) - timedelta(seconds=2)
+        metrics._record("morning", "Morning Message", scheduled, scheduled + timedelta(seconds=1.5), datetime.now(tz=BERLIN_TZ), "ok", 0)
+        metrics._record("stats", None, scheduled, None, datetime.now(tz=BERLIN_TZ), "missed", 3)
+        self.assertEqual(2, await metrics.flush())
+        self.assertEqual(0, await metrics.flush())
+
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT job_id, job_name, outcome, coalesced, start_lag_ms, duration_ms,
+                       abs(extract(epoch FROM scheduled_time) - $1) < 0.001 AS same_time
+                FROM manon_job_runs ORDER BY id
+            """, scheduled.timestamp())
+        self.assertEqual([("morning", "Morning Message", "ok", 0), ("stats", "stats", "missed", 3)],
+                         [(row["job_id"], row["job_name"], row["outcome"], row["coalesced"]) for row in rows])
+        self.assertAlmostEqual(1500, rows[0]["start_lag_ms"], delta=1)
+        self.assertIsNone(rows[1]["duration_ms"])
+        self.assertTrue(all(row["same_time"] for row in rows))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+import asyncio
+import os
+import threading
+import unittest
+import uuid
+from datetime import datetime, timedelta
+
+import asyncpg
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+from utils.db import Database
+from utils.helpers import BERLIN_TZ
+from utils.job_store import PostgresJobStore
+from utils.migrations import run_migrations
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+ran = []
+
+
+async def remember(value):
+    ran.append(value)
+
+
+@unittest.skipUnless(TEST_DATABASE_URL, "TEST_DATABASE_URL not set (needs a disposable PostgreSQL database)")
+class PostgresJobStoreTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        ran.clear()
+        self.schema = f"test_jobs_{uuid.uuid4().hex[:8]}"
+        self.admin = await asyncpg.connect(TEST_DATABASE_URL)
+        await self.admin.execute(f"CREATE SCHEMA {self.schema}")
+        self.pool = await asyncpg.create_pool(TEST_DATABASE_URL, min_size=1, max_size=2, server_settings={'search_path': self.schema})
+        self.original_pool, Database._pool = Database._pool, self.pool
+        async with self.pool.acquire() as conn:
+            await run_migrations(conn)
+        self.schedulers = []
+
+    async def asyncTearDown(self):
+        for scheduler, store in self.schedulers:
+            await store.close()
+            scheduler.shutdown(wait=False)
+        Database._pool = self.original_pool
+        await self.pool.close()
+        await self.admin.execute(f"DROP SCHEMA {self.schema} CASCADE")
+        await self.admin.close()
+
+    async def start_scheduler(self):
+        """A scheduler as after a (re)start of the bot: started, then the durable store is loaded."""
+        store = PostgresJobStore()
+        scheduler = AsyncIOScheduler(timezone=BERLIN_TZ, jobstores={"durable": store})
+        scheduler.start()
+        self.schedulers.append((scheduler, store))
+        await store.load()
+        return scheduler, store
+
+    async def test_jobs_survive_a_restart(self):
+        scheduler, store = await self.start_scheduler()
+        run_date = (datetime.now(tz=BERLIN_TZ) + timedelta(hours=3)).replace(microsecond=0)
+        scheduler.add_job(remember, "date", run_date=run_date, args=[{"reminder_id": 7, "time": run_date}],
+                          id="regularreminder_7", jobstore="durable")
+        scheduler.add_job(remember, "date", run_date=run_date, args=["gone"], id="regularreminder_8", jobstore="durable")
+        scheduler.remove_job("regularreminder_8")
+        self.assertEqual(2, await store.flush())     # one upsert, one delete
+
+        restarted, _ = await self.start_scheduler()
+        job = restarted.get_job("regularreminder_7")
+        self.assertEqual(run_date, job.next_run_time)
+        self.assertEqual([{"reminder_id": 7, "time": run_date}], list(job.args))
+        self.assertIsNone(restarted.get_job("regularreminder_8"))
+
+    async def test_missed_job_runs_after_restart(self):
+        scheduler, store = await self.start_scheduler()
+        scheduler.pause()       # the bot goes down before the job is due
+        scheduler.add_job(remember, "date", run_date=datetime.now(tz=BERLIN_TZ) - timedelta(minutes=30), args=["late"],
+                          id="goalarchival_1", jobstore="durable", misfire_grace_time=3600)
+        await store.flush()
+
+        await self.start_scheduler()
+        for _ in range(50):
+            if ran:
+                break
+            await asyncio.sleep(0.02)
+        self.assertEqual(["late"], ran)
+
+    async def test_unloaded_jobs_are_read_back_as_the_other_leader_left_them(self):
+        scheduler, store = await self.start_scheduler()
+        run_date = datetime.now(tz=BERLIN_TZ) + timedelta(hours=3)
+        for goal_id in (1, 2):
+            scheduler.add_job(remember, "date", run_date=run_date, args=[goal_id], id=f"goalarchival_{goal_id}", jobstore="durable")
+        scheduler.pause()       # no longer the leader
+        await store.unload()
+        self.assertEqual([], store.get_all_jobs())
+
+        other, _ = await self.start_scheduler()     # the new leader runs one of them
+        other.remove_job("goalarchival_1")
+        await self.schedulers[-1][1].flush()
+
+        scheduler.resume()      # leader again
+        await store.load()
+        self.assertEqual(["goalarchival_2"], [job.id for job in store.get_all_jobs()])
+
+    async def test_jobs_added_by_a_follower_are_picked_up_by_the_leader(self):
+        leader, leader_store = await self.start_scheduler()
+        run_date = datetime.now(tz=BERLIN_TZ) + timedelta(hours=6)
+        leader.add_job(remember, "date", run_date=run_date, args=["leader's"], id="goalarchival_1", jobstore="durable")
+        await leader_store.flush()
+        leader.remove_job("goalarchival_1")     # its deletion isn't written yet when the leader refreshes
+
+        follower_store = PostgresJobStore()
+        follower = AsyncIOScheduler(timezone=BERLIN_TZ, jobstores={"durable": follower_store})
+        follower.start(paused=True)     # never loads: not the leader
+        self.schedulers.append((follower, follower_store))
+        follower.add_job(remember, "date", run_date=run_date, args=["follower's"], id="goalarchival_2", jobstore="durable")
+        self.assertEqual([], follower_store.get_all_jobs())
+        await follower_store.flush()
+
+        self.assertEqual(1, await leader_store.refresh())
+        self.assertEqual(["goalarchival_2"], [job.id for job in leader_store.get_all_jobs()])
+        self.assertEqual(["follower's"], list(leader.get_job("goalarchival_2").args))
+        self.assertEqual(0, await leader_store.refresh())
+
+    async def test_unpicklable_job_is_refused(self):
+        scheduler, store = await self.start_scheduler()
+        with self.assertRaises(Exception):
+            scheduler.add_job(remember, "date", run_date=datetime.now(tz=BERLIN_TZ) + timedelta(hours=1),
+                              args=[threading.Lock()], id="bad", jobstore="durable")
+        self.assertIsNone(scheduler.get_job("bad"))
+        self.assertEqual(0, await store.flush())
+
+
+if __name__ == "__main__":
+    unittest.main()
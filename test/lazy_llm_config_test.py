@@ -0,0 +1,29 @@
+import unittest
+
+from LLMs.config import LLM_SPECS, LazyLLMs, chain_configs, chains
+
+
+class LazyLLMConfigTest(unittest.TestCase):
+
+    def test_clients_are_built_on_first_access(self):
+        registry = LazyLLMs(LLM_SPECS)
+        self.assertEqual([], list(dict.keys(registry)))
+        self.assertIn("mini", registry)
+        self.assertNotIn("gpt-7", registry)
+        self.assertIsNone(registry.get("gpt-7"))
+
+        mini = registry["mini"]
+        self.assertIs(mini, registry["mini"])
+        self.assertEqual(["mini"], list(dict.keys(registry)))
+
+    def test_chains_are_built_on_first_use(self):
+        self.assertIsNone(chains.get("no_such_chain"))
+        chain = chains["translation"]
+        self.assertIs(chain, chains.get("translation"))
+        self.assertEqual("smart", chain["routes"][0]["provider"])
+        self.assertEqual(chain_configs["translation"]["schema"], chain["schema"])
+        self.assertTrue(hasattr(chain["template"], "format_prompt"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+import asyncio
+import os
+import random
+import signal
+import sys
+import time
+import unittest
+
+import asyncpg
+
+from utils.leader import LeaderElection
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DEMO = os.path.join(ROOT, "scripts", "leader_election_demo.py")
+
+RETRY, HEARTBEAT = 0.3, 0.3
+
+
+class Contender:
+    """scripts/leader_election_demo.py in its own process, as a second bot instance would be"""
+
+    def __init__(self, name):
+        self.name = name
+        self.events = []
+        self.process = None
+
+    async def start(self, lock_id):
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, DEMO, "--name", self.name, "--retry", str(RETRY), "--heartbeat", str(HEARTBEAT),
+            "--lock-id", str(lock_id),
+            cwd=ROOT, env={**os.environ, "DATABASE_URL": TEST_DATABASE_URL},
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL,
+        )
+        await self.wait_for("started", timeout=30)
+
+    async def wait_for(self, event, timeout):
+        """Read output until `event` shows up; returns when it happened, or None after `timeout` seconds"""
+        deadline = time.monotonic() + timeout
+        while event not in [e for _, e in self.events]:
+            try:
+                line = await asyncio.wait_for(self.process.stdout.readline(), max(deadline - time.monotonic(), 0))
+            except asyncio.TimeoutError:
+                return None
+            if not line:
+                return None
+            stamp, _, happened = line.decode().split()
+            self.events.append((float(stamp), happened))
+        return next(stamp for stamp, e in self.events if e == event)
+
+    async def kill(self):
+        if self.process.returncode is None:
+            self.process.send_signal(signal.SIGKILL)
+            await self.process.wait()
+
+
+@unittest.skipUnless(TEST_DATABASE_URL, "TEST_DATABASE_URL not set (needs a disposable PostgreSQL database)")
+class LeaderElectionTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.lock_id = random.randrange(1, 2 ** 62)      # not the bot's own lock, in case it runs on this database
+        self.admin = await asyncpg.connect(TEST_DATABASE_URL)
+
+    async def asyncTearDown(self):
+        await self.admin.close()
+
+    async def lock_is_free(self):
+        if await self.admin.fetchval("SELECT pg_try_advisory_lock($1)", self.lock_id):
+            await self.admin.execute("SELECT pg_advisory_unlock($1)", self.lock_id)
+            return True
+        return False
+
+    async def test_one_of_two_processes_leads_and_the_other_takes_over_when_it_dies(self):
+        contenders = [Contender("a"), Contender("b")]
+        for contender in contenders:
+            self.addAsyncCleanup(contender.kill)
+            await contender.start(self.lock_id)
+
+        elected = await asyncio.gather(*(contender.wait_for("elected", timeout=3) for contender in contenders))
+        self.assertEqual(1, sum(stamp is not None for stamp in elected), "exactly one process is elected")
+        leader, follower = contenders if elected[0] else reversed(contenders)
+
+        await leader.kill()
+        killed = time.time()
+        taken_over = await follower.wait_for("elected", timeout=10)
+        self.assertIsNotNone(taken_over)
+        self.assertLess(taken_over - killed, RETRY + 1)
+
+    async def test_leader_steps_down_when_its_session_is_gone_and_is_elected_again(self):
+        calls = []
+
+        async def on_elected():
+            calls.append("elected")
+
+        async def on_demoted():
+            calls.append("demoted")
+
+        election = LeaderElection(lock_id=self.lock_id, retry_interval=RETRY, heartbeat_interval=HEARTBEAT, dsn=TEST_DATABASE_URL)
+        election.start(on_elected, on_demoted)
+        self.addAsyncCleanup(election.stop)
+        await self.wait_until(lambda: election.is_leader)
+        self.assertFalse(await self.lock_is_free())
+
+        # e.g. the database restarted, or an admin killed the session
+        await self.admin.execute("SELECT pg_terminate_backend(pid) FROM pg_locks WHERE locktype = 'advisory' AND objid = $1 AND granted",
+                                 self.lock_id & 0xFFFFFFFF)
+        await self.wait_until(lambda: calls[-1:] == ["demoted"])
+        await self.wait_until(lambda: election.is_leader)
+        self.assertEqual(["elected", "demoted", "elected"], calls)
+        self.assertEqual(2, election.terms)
+
+        await election.stop()
+        self.assertEqual("demoted", calls[-1])
+        self.assertTrue(await self.lock_is_free())
+
+    async def test_failing_to_start_the_leaders_work_releases_the_lock(self):
+        async def on_elected():
+            raise RuntimeError("scheduler didn't start")
+
+        demoted = asyncio.Event()
+
+        async def on_demoted():
+            demoted.set()
+
+        election = LeaderElection(lock_id=self.lock_id, retry_interval=5, heartbeat_interval=HEARTBEAT, dsn=TEST_DATABASE_URL)
+        election.start(on_elected, on_demoted)
+        self.addAsyncCleanup(election.stop)
+        await asyncio.wait_for(demoted.wait(), 5)
+        await self.wait_until(lambda: election._conn is None)
+        self.assertFalse(election.is_leader)
+        self.assertTrue(await self.lock_is_free())
+
+    async def wait_until(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail("condition not met in time")
+            await asyncio.sleep(0.05)
+
+
+if __name__ == "__main__":
+    unittest.main()
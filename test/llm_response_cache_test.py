@@ -0,0 +1,104 @@
+import os
+import unittest
+import uuid
+
+import asyncpg
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from LLMs.config import chain_configs
+from LLMs.orchestration import cache_key_messages
+from LLMs.prompts_templates import diary_header_template
+from LLMs.response_cache import LLMResponseCache
+from LLMs.structured_output_schemas import LanguageCheck, Translation
+from utils.db import Database
+from utils.migrations import run_migrations
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+MESSAGES = [SystemMessage("Translate to German"), HumanMessage("Good morning")]
+
+
+class LLMResponseCacheTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.original_pool, Database._pool = Database._pool, None    # memory only
+        self.addCleanup(setattr, Database, "_pool", self.original_pool)
+
+    def test_key_covers_chain_messages_and_schema(self):
+        key = LLMResponseCache.make_key("translation", MESSAGES, Translation, "gpt-5.2")
+        self.assertEqual(key, LLMResponseCache.make_key("translation", list(MESSAGES), Translation, "gpt-5.2"))
+        self.assertNotEqual(key, LLMResponseCache.make_key("translations", MESSAGES, Translation, "gpt-5.2"))
+        self.assertNotEqual(key, LLMResponseCache.make_key("translation", MESSAGES[:1] + [HumanMessage("Good night")], Translation, "gpt-5.2"))
+        self.assertNotEqual(key, LLMResponseCache.make_key("translation", MESSAGES, LanguageCheck, "gpt-5.2"))
+        self.assertNotEqual(key, LLMResponseCache.make_key("translation", MESSAGES, Translation, "gpt-5-mini"))
+
+    def test_time_of_day_doesnt_change_the_diary_header_key(self):
+        chain = {"template": diary_header_template, "cache_key_vars": chain_configs["diary_header"]["cache_key_vars"]}
+
+        def key(now, user_message="next friday"):
+            variables = {"now": now, "weekday": "Friday", "user_message": user_message}
+            messages = diary_header_template.format_prompt(**variables).to_messages()
+            self.assertIn(now, messages[0].content)     # the LLM still gets the time
+            return LLMResponseCache.make_key("diary_header", cache_key_messages(chain, variables, messages))
+
+        self.assertEqual(key("2025-03-14 09:26:53"), key("2025-03-14 21:02:11"))
+        self.assertNotEqual(key("2025-03-14 09:26:53"), key("2025-03-15 09:26:53"))
+        self.assertNotEqual(key("2025-03-14 09:26:53"), key("2025-03-14 09:26:53", "yesterday"))
+
+    async def test_hit_after_put_and_expiry(self):
+        cache = LLMResponseCache()
+        key = cache.make_key("translation", MESSAGES, Translation)
+        self.assertIsNone(await cache.get("translation", key, Translation))
+
+        await cache.put("translation", key, Translation(translation="Guten Morgen"), ttl=60, llm_seconds=2.0)
+        self.assertEqual(Translation(translation="Guten Morgen"), await cache.get("translation", key, Translation))
+        stats = cache.stats["translation"]
+        self.assertEqual((1, 1, 2.0), (stats.misses, stats.memory_hits, stats.avg_miss_seconds))
+
+        await cache.put("translation", key, Translation(translation="Guten Morgen"), ttl=-1)
+        self.assertIsNone(await cache.get("translation", key, Translation))
+
+    async def test_memory_is_bounded(self):
+        cache = LLMResponseCache(max_entries=2)
+        for text in ("a", "b", "c"):
+            await cache.put("translation", text, Translation(translation=text), ttl=60)
+        self.assertIsNone(await cache.get("translation", "a", Translation))
+        self.assertEqual("c", (await cache.get("translation", "c", Translation)).translation)
+
+
+@unittest.skipUnless(TEST_DATABASE_URL, "TEST_DATABASE_URL not set (needs a disposable PostgreSQL database)")
+class PersistentLLMResponseCacheTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.schema = f"test_llmcache_{uuid.uuid4().hex[:8]}"
+        self.admin = await asyncpg.connect(TEST_DATABASE_URL)
+        await self.admin.execute(f"CREATE SCHEMA {self.schema}")
+        self.pool = await asyncpg.create_pool(TEST_DATABASE_URL, min_size=1, max_size=2, server_settings={'search_path': self.schema})
+        self.original_pool, Database._pool = Database._pool, self.pool
+        async with self.pool.acquire() as conn:
+            await run_migrations(conn)
+
+    async def asyncTearDown(self):
+        Database._pool = self.original_pool
+        await self.pool.close()
+        await self.admin.execute(f"DROP SCHEMA {self.schema} CASCADE")
+        await self.admin.close()
+
+    async def test_entries_survive_a_restart(self):
+        key = LLMResponseCache.make_key("translation", MESSAGES, Translation)
+        await LLMResponseCache().put("translation", key, Translation(translation="Guten Morgen"), ttl=60)
+
+        restarted = LLMResponseCache()
+        self.assertEqual("Guten Morgen", (await restarted.get("translation", key, Translation)).translation)
+        self.assertEqual(1, restarted.stats["translation"].db_hits)
+        await restarted.get("translation", key, Translation)
+        self.assertEqual(1, restarted.stats["translation"].memory_hits)
+
+    async def test_expired_rows_are_ignored(self):
+        key = LLMResponseCache.make_key("translation", MESSAGES, Translation)
+        await LLMResponseCache().put("translation", key, Translation(translation="Guten Morgen"), ttl=-1)
+        self.assertIsNone(await LLMResponseCache().get("translation", key, Translation))
+
+
+if __name__ == "__main__":
+    unittest.main()
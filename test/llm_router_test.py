@@ -0,0 +1,136 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+import httpx
+import openai
+
+import LLMs.router as router_module
+from LLMs.router import LLMRouter, is_provider_error
+
+
+class FakeProvider:
+    """A chain runnable that answers after `delay` seconds, or raises `error` when `fail` is set."""
+
+    def __init__(self, name, delay=0.0, fail=False, error=TimeoutError):
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.error = error
+        self.calls = 0
+        self.cancelled = 0
+        self.configs = []
+
+    async def ainvoke(self, messages, config=None):
+        self.calls += 1
+        self.configs.append(config)
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.fail:
+            raise self.error(f"{self.name} failed")
+        return f"answer from {self.name}"
+
+
+def routes(*providers):
+    return [{"provider": p.name, "chain": p, "model": p.name, "base_url": None} for p in providers]
+
+
+class LLMRouterTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_primary_answers(self):
+        router = LLMRouter()
+        primary, secondary = FakeProvider("openrouter_fast"), FakeProvider("mini")
+        result, route = await router.invoke("initial_classification", routes(primary, secondary), [])
+        self.assertEqual(("answer from openrouter_fast", "openrouter_fast"), (result, route["provider"]))
+        self.assertEqual(0, secondary.calls)
+
+    async def test_falls_back_when_primary_fails(self):
+        router = LLMRouter()
+        primary, secondary = FakeProvider("openrouter_fast", fail=True), FakeProvider("mini")
+        result, route = await router.invoke("initial_classification", routes(primary, secondary), [])
+        self.assertEqual("mini", route["provider"])
+        self.assertEqual(1, router.stats.fallbacks)
+
+    async def test_hedges_slow_primary_and_cancels_it(self):
+        router = LLMRouter()
+        primary, secondary = FakeProvider("openrouter_fast", delay=0.01), FakeProvider("mini", delay=0.01)
+        chain_routes = routes(primary, secondary)
+        for _ in range(router_module.MIN_SAMPLES):
+            await router.invoke("initial_classification", chain_routes, [])     # learns a p90 of ~10 ms
+
+        primary.delay = 5
+        result, route = await router.invoke("initial_classification", chain_routes, [])
+        self.assertEqual("mini", route["provider"])
+        self.assertEqual((1, 1), (router.stats.hedges, router.stats.hedges_won))
+        await asyncio.sleep(0)
+        self.assertEqual(1, primary.cancelled)
+
+    async def test_prefers_the_faster_provider(self):
+        router = LLMRouter()
+        slow, fast = FakeProvider("openrouter_smart", delay=0.2), FakeProvider("smart", delay=0.001)
+        for _ in range(router_module.MIN_SAMPLES):
+            router.latencies[("diary_header", "openrouter_smart")].append(0.2)
+            router.latencies[("diary_header", "smart")].append(0.05)
+        _, route = await router.invoke("diary_header", routes(slow, fast), [])
+        self.assertEqual("smart", route["provider"])
+        self.assertEqual(0, slow.calls)
+
+    async def test_circuit_opens_and_half_opens(self):
+        router = LLMRouter()
+        broken, healthy = FakeProvider("openrouter_fast", fail=True), FakeProvider("mini")
+        chain_routes = routes(broken, healthy)
+        for _ in range(router_module.CIRCUIT_CONSECUTIVE_FAILURES):
+            await router.invoke("reminder_setting", chain_routes, [])
+        self.assertEqual("open", router.health["openrouter_fast"].state)
+
+        await router.invoke("reminder_setting", chain_routes, [])
+        self.assertEqual(router_module.CIRCUIT_CONSECUTIVE_FAILURES, broken.calls)     # skipped while open
+
+        broken.fail = False
+        with patch.object(router_module, "CIRCUIT_COOLDOWN", 0):
+            _, route = await router.invoke("reminder_setting", chain_routes, [])
+        self.assertEqual("openrouter_fast", route["provider"])
+        self.assertEqual("closed", router.health["openrouter_fast"].state)
+
+    async def test_invalid_answers_dont_open_the_circuit(self):
+        router = LLMRouter()
+        invalid, healthy = FakeProvider("openrouter_fast", fail=True, error=ValueError), FakeProvider("mini")
+        chain_routes = routes(invalid, healthy)
+        for _ in range(router_module.CIRCUIT_CONSECUTIVE_FAILURES + 1):
+            _, route = await router.invoke("reminder_setting", chain_routes, [])
+            self.assertEqual("mini", route["provider"])       # still falls back
+        self.assertEqual("closed", router.health["openrouter_fast"].state)
+        self.assertEqual(router_module.CIRCUIT_CONSECUTIVE_FAILURES + 1, invalid.calls)
+
+    def test_is_provider_error(self):
+        request = httpx.Request("POST", "https://api.example.com/v1/chat/completions")
+
+        def status_error(error_type, status_code):
+            return error_type("", response=httpx.Response(status_code, request=request), body=None)
+
+        self.assertTrue(is_provider_error(TimeoutError()))
+        self.assertTrue(is_provider_error(openai.APITimeoutError(request)))
+        self.assertTrue(is_provider_error(status_error(openai.RateLimitError, 429)))
+        self.assertTrue(is_provider_error(status_error(openai.InternalServerError, 503)))
+        self.assertFalse(is_provider_error(status_error(openai.BadRequestError, 400)))
+        self.assertFalse(is_provider_error(ValueError("not valid JSON for the schema")))
+
+    async def test_each_route_gets_its_own_config(self):
+        router = LLMRouter()
+        primary, secondary = FakeProvider("openrouter_fast", fail=True), FakeProvider("mini")
+        await router.invoke("initial_classification", routes(primary, secondary), [],
+                            config=lambda route: {"callbacks": [route["provider"]]})
+        self.assertEqual([{"callbacks": ["openrouter_fast"]}], primary.configs)
+        self.assertEqual([{"callbacks": ["mini"]}], secondary.configs)
+
+    async def test_latency_budget(self):
+        router = LLMRouter()
+        with self.assertRaises(asyncio.TimeoutError):
+            await router.invoke("translation", routes(FakeProvider("smart", delay=5)), [], latency_budget=0.05)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import unittest
+import uuid
+
+import asyncpg
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+from LLMs.telemetry import LLMTelemetry, UsageCallback
+from utils.db import Database
+from utils.migrations import run_migrations
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+
+class UsageCallbackTest(unittest.TestCase):
+
+    def test_collects_token_usage(self):
+        message = AIMessage(content="", usage_metadata={"input_tokens": 120, "output_tokens": 30, "total_tokens": 150})
+        usage = UsageCallback()
+        usage.on_llm_end(LLMResult(generations=[[ChatGeneration(message=message)]]))
+        self.assertEqual((120, 30), (usage.prompt_tokens, usage.completion_tokens))
+
+    def test_no_usage_reported(self):
+        usage = UsageCallback()
+        usage.on_llm_end(LLMResult(generations=[[ChatGeneration(message=AIMessage(content="hi"))]]))
+        self.assertEqual((None, None), (usage.prompt_tokens, usage.completion_tokens))
+
+
+@unittest.skipUnless(TEST_DATABASE_URL, "TEST_DATABASE_URL not set (needs a disposable PostgreSQL database)")
+class LLMTelemetryTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.schema = f"test_llmcalls_{uuid.uuid4().hex[:8]}"
+        self.admin = await asyncpg.connect(TEST_DATABASE_URL)
+        await self.admin.execute(f"CREATE SCHEMA {self.schema}")
+
+        async def init(conn):
+            # Text-format timestamptz, as Database.initialize() sets up
+            await conn.set_type_codec('timestamptz', encoder=lambda value: value, decoder=lambda value: value, schema='pg_catalog')
+
+        self.pool = await asyncpg.create_pool(TEST_DATABASE_URL, min_size=1, max_size=2, init=init, server_settings={'search_path': self.schema})
+        self.original_pool, Database._pool = Database._pool, self.pool
+        async with self.pool.acquire() as conn:
+            await run_migrations(conn)
+
+    async def asyncTearDown(self):
+        Database._pool = self.original_pool
+        await self.pool.close()
+        await self.admin.execute(f"DROP SCHEMA {self.schema} CASCADE")
+        await self.admin.close()
+
+    async def test_batched_write_and_report(self):
+        telemetry = LLMTelemetry()
+        for latency in range(100, 1100, 100):
+            telemetry.record("initial_classification", "gpt-5-mini", None, latency_ms=latency,
+                             prompt_tokens=500, completion_tokens=20)
+        telemetry.record("initial_classification", "gpt-5-mini", latency_ms=0, cache_hit=True)
+        telemetry.record("goal_classification", "gpt-5-mini", latency_ms=2000, error=RuntimeError("rate limited"))
+
+        self.assertEqual(12, await telemetry.flush())
+        self.assertEqual(0, await telemetry.flush())
+
+        report = await telemetry.report(hours=1)
+        self.assertIn("initial_classification (gpt-5-mini): 11 calls, p50 0.6 s, p95 1.0 s, 5,000 in / 200 out tokens, 1 cached", report)
+        self.assertIn("goal_classification (gpt-5-mini): 1 calls, p50 2.0 s, p95 2.0 s, 0 in / 0 out tokens, 1 errors", report)
+
+    async def test_records_stay_buffered_while_database_is_down(self):
+        telemetry = LLMTelemetry()
+        telemetry.record("diary_header", "gpt-5.2", latency_ms=800)
+        Database._pool = None
+        self.assertEqual(0, await telemetry.flush())
+        Database._pool = self.pool
+        self.assertEqual(1, await telemetry.flush())
+
+
+if __name__ == "__main__":
+    unittest.main()
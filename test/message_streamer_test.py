@@ -0,0 +1,162 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from langchain_core.messages import AIMessageChunk, ToolMessage
+from langchain_core.tools import tool
+from telegram.error import RetryAfter, TimedOut
+
+import features.agent.loop as agent_loop
+import telegram_helpers.message_streamer as streamer_module
+from telegram_helpers.message_streamer import CURSOR, TG_MAX, TelegramMessageStreamer
+
+
+class FakeMessage:
+    def __init__(self, chat, message_id, text):
+        self.chat = chat
+        self.chat_id = chat.chat_id
+        self.message_id = message_id
+        self.text = text
+        self.deleted = False
+
+    async def reply_text(self, text, **kwargs):
+        return self.chat.send(text)
+
+    async def edit_text(self, text, parse_mode=None):
+        if self.chat.failures:
+            raise self.chat.failures.pop(0)
+        self.chat.edits += 1
+        self.text = text
+
+    async def delete(self):
+        self.deleted = True
+
+
+class FakeChat:
+    def __init__(self, chat_id=1):
+        self.chat_id = chat_id
+        self.sent = []
+        self.edits = 0
+        self.failures = []      # raised by the next edits, in order
+
+    def send(self, text):
+        message = FakeMessage(self, len(self.sent) + 100, text)
+        self.sent.append(message)
+        return message
+
+
+@tool
+async def get_goals() -> str:
+    """Active goals."""
+    return "3 active goals"
+
+
+class StreamingLLM:
+    """First turn streams a tool call, the second streams the answer token by token."""
+
+    def __init__(self, answer):
+        self.answer = answer
+
+    def bind_tools(self, tools):
+        return self
+
+    async def astream(self, messages):
+        if not any(isinstance(message, ToolMessage) for message in messages):
+            yield AIMessageChunk(content="Let me check", tool_call_chunks=[])
+            yield AIMessageChunk(content="", tool_call_chunks=[
+                {"name": "get_goals", "args": "{}", "id": "call_0", "index": 0}
+            ])
+            return
+        for word in self.answer.split(" "):
+            await asyncio.sleep(0.001)
+            yield AIMessageChunk(content=word + " ")
+
+
+class MessageStreamerTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_edits_are_throttled(self):
+        chat = FakeChat()
+        streamer = TelegramMessageStreamer(chat.send("question"), edit_interval=0.05)
+        await streamer.start()
+        for _ in range(200):
+            streamer.push("token ")
+            await asyncio.sleep(0.001)
+        await streamer.finish("token " * 200)
+
+        self.assertEqual(len(streamer.messages), 1)
+        self.assertLess(chat.edits, 20)     # ~0.2 s of streaming at one edit per 0.05 s, instead of 200 edits
+        self.assertIsNotNone(streamer.first_token_at)
+        self.assertGreaterEqual(streamer.first_visible_at, streamer.first_token_at)
+
+    async def test_rolls_over_into_new_messages(self):
+        chat = FakeChat()
+        streamer = TelegramMessageStreamer(chat.send("question"), edit_interval=0.01)
+        await streamer.start()
+        paragraph = "x" * 1500 + "\n\n"
+        for _ in range(6):
+            streamer.push(paragraph)
+            await asyncio.sleep(0.02)
+        self.assertGreater(len(streamer.messages), 1)
+
+        await streamer.finish(paragraph * 6)
+        self.assertEqual(len(streamer.messages), 3)
+        self.assertTrue(all(len(message.text) <= TG_MAX for message in streamer.messages))
+        self.assertEqual("".join("".join(message.text.split()) for message in streamer.messages), "x" * 9000)
+
+    async def test_final_render_is_retried_after_throttling(self):
+        chat = FakeChat()
+        streamer = TelegramMessageStreamer(chat.send("question"), edit_interval=0.01)
+        await streamer.start()
+        streamer.push("partial answer")
+        await asyncio.sleep(0.03)
+        self.assertEqual("partial answer" + CURSOR, streamer.messages[0].text)
+
+        chat.failures = [RetryAfter(0), TimedOut()]
+        with patch.object(streamer_module, "NETWORK_RETRY_DELAY", 0):
+            await streamer.finish("partial answer, and the rest")
+        self.assertEqual("partial answer, and the rest", streamer.messages[0].text)
+
+    async def test_network_errors_dont_stop_streaming(self):
+        chat = FakeChat()
+        streamer = TelegramMessageStreamer(chat.send("question"), edit_interval=0.01)
+        await streamer.start()
+        chat.failures = [TimedOut()]
+        streamer.push("first")
+        await asyncio.sleep(0.03)
+        self.assertFalse(streamer._flusher.done())
+        self.assertEqual("first" + CURSOR, streamer.messages[0].text)    # shown by the next edit
+
+        await streamer.finish("final")
+        self.assertEqual("final", streamer.messages[0].text)
+
+    async def test_final_text_is_shown_even_if_the_flusher_died(self):
+        chat = FakeChat()
+        streamer = TelegramMessageStreamer(chat.send("question"), edit_interval=0.01)
+        await streamer.start()
+        streamer._flusher.cancel()
+
+        async def died():
+            raise TimedOut()
+
+        streamer._flusher = asyncio.create_task(died())
+        await asyncio.sleep(0)
+        await streamer.finish("final")
+        self.assertEqual("final", streamer.messages[0].text)
+
+    async def test_agent_loop_streams_only_the_final_turn(self):
+        chat = FakeChat()
+        streamer = TelegramMessageStreamer(chat.send("question"), edit_interval=0.01)
+        await streamer.start()
+        answer = "You have three active goals, keep going"
+        with patch.object(agent_loop, "create_agent_tools", lambda user_id, chat_id: [get_goals]), \
+                patch.dict(agent_loop.llms, {"openrouter_smart": StreamingLLM(answer)}):
+            final_text = await agent_loop.run_agent_loop("How am I doing?", 1, 2, "Josefientje", stream=streamer)
+        await streamer.finish(final_text)
+
+        self.assertEqual(final_text.strip(), answer)
+        self.assertEqual(streamer.messages[-1].text.strip(), answer)
+        self.assertNotIn("Let me check", streamer.messages[-1].text)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import unittest
+import uuid
+
+import asyncpg
+
+from utils.migrations import LATEST_VERSION, MANAGED_INDEXES, MIGRATIONS, get_schema_version, run_migrations
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+
+@unittest.skipUnless(TEST_DATABASE_URL, "TEST_DATABASE_URL not set (needs a disposable PostgreSQL database)")
+class MigrationsTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.schema = f"test_mig_{uuid.uuid4().hex[:8]}"
+        self.conn = await asyncpg.connect(TEST_DATABASE_URL)
+        await self.conn.execute(f"CREATE SCHEMA {self.schema}")
+        await self.conn.execute(f"SET search_path TO {self.schema}")
+        self.ddl = []
+
+        def log_ddl(record):
+            if record.query.lstrip().upper().startswith(("CREATE", "ALTER", "DROP")):
+                self.ddl.append(record.query)
+        self.conn.add_query_logger(log_ddl)
+
+    async def asyncTearDown(self):
+        await self.conn.execute(f"DROP SCHEMA {self.schema} CASCADE")
+        await self.conn.close()
+
+    async def test_fresh_database_is_migrated_once(self):
+        applied = await run_migrations(self.conn)
+        self.assertEqual([version for version, _, _ in MIGRATIONS], applied)
+        self.assertEqual(LATEST_VERSION, await get_schema_version(self.conn))
+
+        self.ddl.clear()
+        self.assertEqual([], await run_migrations(self.conn))
+        self.assertEqual([], self.ddl)     # a current database gets no DDL at all
+
+    async def test_existing_unversioned_database_is_adopted(self):
+        # A database from before schema_version existed: tables present, some later columns and all indexes missing
+        await self.conn.execute("CREATE TABLE manon_users (user_id BIGINT, chat_id BIGINT, PRIMARY KEY (user_id, chat_id))")
+        await self.conn.execute("""
+            CREATE TABLE manon_goals (
+                goal_id SERIAL PRIMARY KEY, user_id BIGINT NOT NULL, chat_id BIGINT NOT NULL,
+                status TEXT DEFAULT 'limbo', deadline TIMESTAMPTZ, group_id BIGINT, set_time TIMESTAMPTZ,
+                reminder_time TIMESTAMPTZ, reminder_scheduled BOOLEAN DEFAULT False, completion_time TIMESTAMPTZ
+            )
+        """)
+        await self.conn.execute("INSERT INTO manon_users VALUES (1, 2)")
+        await self.conn.execute("INSERT INTO manon_goals (user_id, chat_id) VALUES (1, 2)")
+
+        await run_migrations(self.conn)
+
+        goal = await self.conn.fetchrow("SELECT attempt, final_iteration FROM manon_goals")
+        self.assertEqual((1, "not applicable"), tuple(goal))
+        indexes = {row["indexname"] for row in await self.conn.fetch(
+            "SELECT indexname FROM pg_indexes WHERE schemaname = $1", self.schema
+        )}
+        self.assertLessEqual(set(MANAGED_INDEXES), indexes)
+
+
+if __name__ == "__main__":
+    unittest.main()
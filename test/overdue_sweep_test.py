@@ -0,0 +1,157 @@
+import os
+import unittest
+import uuid
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import asyncpg
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+import utils.scheduler as scheduler_module
+from utils.db import Database, setup_database
+from utils.helpers import BERLIN_TZ
+from utils.job_store import PostgresJobStore
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+# (user_id, chat_id)
+ANNA, BEN, CARLA = (1, 10), (2, 10), (3, 20)
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+
+
+@unittest.skipUnless(TEST_DATABASE_URL, "TEST_DATABASE_URL not set (needs a disposable PostgreSQL database)")
+class OverdueSweepTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.schema = f"test_overdue_{uuid.uuid4().hex[:8]}"
+        self.queries = []
+        self.admin = await asyncpg.connect(TEST_DATABASE_URL)
+        await self.admin.execute(f"CREATE SCHEMA {self.schema}")
+
+        async def init(conn):
+            # Text-format timestamptz, as Database.initialize() sets up
+            await conn.set_type_codec('timestamptz', encoder=lambda value: value, schema='pg_catalog',
+                                      decoder=lambda value: datetime.fromisoformat(value).astimezone(BERLIN_TZ))
+            conn.add_query_logger(lambda record: self.queries.append(record.query))
+
+        self.pool = await asyncpg.create_pool(TEST_DATABASE_URL, min_size=1, max_size=2, init=init,
+                                              server_settings={'timezone': 'Europe/Berlin', 'search_path': self.schema})
+        self.original_pool, Database._pool = Database._pool, self.pool
+        await setup_database()
+
+        now = datetime.now(tz=BERLIN_TZ)
+        self.goals = {}
+        async with self.pool.acquire() as conn:
+            for user_id, chat_id in (ANNA, BEN, CARLA):
+                await conn.execute("INSERT INTO manon_users (user_id, chat_id, first_name, pending_goals) VALUES ($1, $2, $3, 3)",
+                                   user_id, chat_id, f"user{user_id}")
+            for name, owner, deadline in [
+                ("anna_old", ANNA, now - timedelta(days=3)), ("anna_older", ANNA, now - timedelta(days=5)),
+                ("anna_recent", ANNA, now - timedelta(hours=2)), ("ben_future", BEN, now + timedelta(days=1)),
+                ("carla_old", CARLA, now - timedelta(days=2)),
+            ]:
+                self.goals[name] = await conn.fetchval("""
+                    INSERT INTO manon_goals (user_id, chat_id, status, goal_description, deadline, goal_value, penalty)
+                    VALUES ($1, $2, 'pending', $3, $4, 2, 3) RETURNING goal_id
+                """, *owner, name, deadline.isoformat())
+
+        self.durable = PostgresJobStore()
+        self.scheduler = AsyncIOScheduler(timezone=BERLIN_TZ, jobstores={
+            "default": MemoryJobStore(), scheduler_module.DURABLE_JOBSTORE: self.durable,
+        })
+        self.scheduler.start(paused=True)
+        await self.durable.load()
+        for target, replacement in [("scheduler", self.scheduler), ("durable_jobstore", self.durable),
+                                    ("asyncio", SimpleNamespace(sleep=AsyncMock()))]:
+            patcher = patch.object(scheduler_module, target, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.bot = FakeBot()
+        self.queries.clear()
+
+    async def asyncTearDown(self):
+        await self.durable.close()
+        self.scheduler.shutdown(wait=False)
+        Database._pool = self.original_pool
+        await self.pool.close()
+        await self.admin.execute(f"DROP SCHEMA {self.schema} CASCADE")
+        await self.admin.close()
+
+    def bot_queries(self):
+        """Captured statements on the bot's tables (not asyncpg's type introspection and connection resets)"""
+        return [query for query in self.queries if "manon_" in query]
+
+    async def test_daily_warning_is_one_query_and_one_archival_job(self):
+        await scheduler_module.fail_goals_warning(self.bot)
+
+        self.assertEqual(1, len(self.bot_queries()))
+        jobs = self.scheduler.get_jobs(jobstore=scheduler_module.DURABLE_JOBSTORE)
+        self.assertEqual(1, len(jobs))
+        self.assertEqual(sorted([self.goals["anna_older"], self.goals["anna_old"], self.goals["carla_old"]]), sorted(jobs[0].args[0]))
+        self.assertEqual({10, 20}, {chat_id for chat_id, _ in self.bot.sent})
+        # emoji + greeting + one message per goal
+        self.assertEqual(4, sum(chat_id == 10 for chat_id, _ in self.bot.sent))
+
+    async def test_archival_fails_the_goals_that_are_still_pending(self):
+        await scheduler_module.fail_goals_warning(self.bot)
+        job = self.scheduler.get_jobs(jobstore=scheduler_module.DURABLE_JOBSTORE)[0]
+        async with self.pool.acquire() as conn:     # Anna reports one of them before the ultimatum
+            await conn.execute("UPDATE manon_goals SET status = 'archived_done' WHERE goal_id = $1", self.goals["anna_old"])
+        self.bot.sent.clear()
+        self.queries.clear()
+
+        await scheduler_module.scheduled_goal_archival(self.bot, *job.args)
+
+        self.assertEqual(1, len(self.bot_queries()))
+        async with self.pool.acquire() as conn:
+            statuses = dict(await conn.fetch("SELECT goal_description, status FROM manon_goals"))
+            users = {row["user_id"]: row for row in await conn.fetch("SELECT * FROM manon_users")}
+        self.assertEqual("archived_failed", statuses["anna_older"])
+        self.assertEqual("archived_failed", statuses["carla_old"])
+        self.assertEqual("archived_done", statuses["anna_old"])
+        self.assertEqual("pending", statuses["anna_recent"])
+        self.assertEqual((1, 2, -3, 3), (users[1]["failed_goals"], users[1]["pending_goals"], users[1]["score"], users[1]["penalties_accrued"]))
+        self.assertEqual(0, users[2]["failed_goals"])
+        self.assertEqual(2, len(self.bot.sent))
+
+    async def test_triggered_warning_covers_the_chat_including_users_without_overdue_goals(self):
+        await scheduler_module.fail_goals_warning(self.bot, chat_id=10)
+
+        self.assertEqual(1, len(self.bot_queries()))
+        self.assertIn((10, "You have no overdue goals to resolve " + scheduler_module.PA), self.bot.sent)
+        job = self.scheduler.get_jobs(jobstore=scheduler_module.DURABLE_JOBSTORE)[0]
+        self.assertEqual(sorted([self.goals["anna_older"], self.goals["anna_old"], self.goals["anna_recent"]]), sorted(job.args[0]))
+        self.assertTrue(job.args[2])
+
+    async def test_warnings_with_the_same_ultimatum_share_the_job_on_an_instance_that_isnt_leading(self):
+        ultimatum_time = (datetime.now(tz=BERLIN_TZ) + timedelta(hours=2)).replace(second=0, microsecond=0)
+        await scheduler_module.schedule_goal_archival([1, 2], ultimatum_time, True)
+        await self.durable.flush()      # written by the leader ...
+
+        follower_store = PostgresJobStore()
+        follower = AsyncIOScheduler(timezone=BERLIN_TZ, jobstores={scheduler_module.DURABLE_JOBSTORE: follower_store})
+        follower.start(paused=True)     # ... and never loaded here
+        self.addAsyncCleanup(follower_store.close)
+        self.addCleanup(follower.shutdown, wait=False)
+        with patch.object(scheduler_module, "scheduler", follower), patch.object(scheduler_module, "durable_jobstore", follower_store):
+            await scheduler_module.schedule_goal_archival([3], ultimatum_time, True)
+            await scheduler_module.schedule_goal_archival([4], ultimatum_time, True)    # not written yet either
+            await follower_store.flush()
+
+        await self.durable.unload()
+        await self.durable.load()
+        jobs = self.scheduler.get_jobs(jobstore=scheduler_module.DURABLE_JOBSTORE)
+        self.assertEqual([[1, 2, 3, 4]], [list(job.args[0]) for job in jobs])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import LLMs.preclassifier as preclassifier_module
+from LLMs.preclassifier import MIN_TRAINING_EXAMPLES, NaiveBayes, PreClassifier
+from LLMs.structured_output_schemas import InitialClassification
+
+
+def examples(n):
+    pool = [
+        ("schedule a dentist appointment before friday", "English", "Goals"),
+        ("water the plants every sunday", "English", "Goals"),
+        ("what is the capital of peru", "English", "Other"),
+        ("tell me a joke about cats", "English", "Other"),
+        ("wat is het weer in berlijn", "Dutch", "Other"),
+    ]
+    return [{"text": text, "user_message_language": language, "classification": label}
+            for text, language, label in (pool * (n // len(pool) + 1))[:n]]
+
+
+class PreClassifierTest(unittest.TestCase):
+
+    def test_rules_return_an_initial_classification(self):
+        prediction = PreClassifier().classify("Remind me at 9 to call Bob")
+        self.assertIsInstance(prediction.result, InitialClassification)
+        self.assertEqual(("English", "Reminders"), (prediction.result.user_message_language, prediction.result.classification))
+        self.assertEqual("rule:remind_en", prediction.source)
+        self.assertEqual("Goals", PreClassifier().classify("klaar met de afwas").result.classification)
+
+    def test_unknown_message_defers_without_a_model(self):
+        self.assertIsNone(PreClassifier().classify("Who was the last president of Argentina?"))
+        self.assertIsNone(PreClassifier().train(examples(MIN_TRAINING_EXAMPLES - 1)).classification_model)
+
+    def test_model_learns_from_logged_classifications(self):
+        classifier = PreClassifier().train(examples(MIN_TRAINING_EXAMPLES))
+        prediction = classifier.classify("what is the capital of chile")
+        self.assertEqual(("English", "Other"), (prediction.result.user_message_language, prediction.result.classification))
+        self.assertEqual("model", prediction.source)
+        self.assertGreater(prediction.confidence, 0.5)
+
+    def test_naive_bayes_probabilities_sum_to_one(self):
+        model = NaiveBayes().fit(["run daily", "who is bob"], ["Goals", "Other"])
+        self.assertAlmostEqual(1.0, sum(model.predict_proba("run to bob").values()))
+
+    def test_learning_in_steps_is_the_same_as_training_at_once(self):
+        batch = examples(MIN_TRAINING_EXAMPLES)
+        stepwise = PreClassifier().learn(batch[:10])
+        self.assertIsNone(stepwise.classification_model)
+        for example in batch[10:]:
+            stepwise.learn([example])
+        at_once = PreClassifier().train(batch)
+        text = "water the cactus every friday"
+        self.assertEqual(at_once.classification_model.predict_proba(text), stepwise.classification_model.predict_proba(text))
+
+
+class SharedPreClassifierTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.log_path = os.path.join(tempfile.mkdtemp(), "log_files", "initial_classifications.jsonl")
+        os.makedirs(os.path.dirname(self.log_path))
+        with open(self.log_path, "w", encoding="utf-8") as log_file:
+            log_file.writelines(json.dumps(example) + "\n" for example in examples(MIN_TRAINING_EXAMPLES))
+        for name, value in [("PRECLASSIFIER_LOG_PATH", self.log_path), ("_preclassifier", None), ("_loading", None)]:
+            patcher = patch.object(preclassifier_module, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_log_is_read_in_the_background_and_new_examples_appended(self):
+        first = preclassifier_module.get_preclassifier()
+        self.assertIsNone(first.classification_model)       # rules only until the log has been read
+        await preclassifier_module._loading
+        trained = preclassifier_module.get_preclassifier()
+        self.assertEqual(MIN_TRAINING_EXAMPLES, trained.trained_on)
+
+        preclassifier_module.record_example("feed the cat at noon", InitialClassification(user_message_language="English", classification="Goals"))
+        self.assertEqual(MIN_TRAINING_EXAMPLES + 1, trained.trained_on)
+        await preclassifier_module._writer
+        with open(self.log_path, encoding="utf-8") as log_file:
+            self.assertEqual("feed the cat at noon", json.loads(log_file.readlines()[-1])["text"])
+
+    async def test_only_the_tail_of_the_log_is_loaded(self):
+        loaded = await asyncio.to_thread(preclassifier_module.load_examples, self.log_path, 50)
+        self.assertEqual(examples(MIN_TRAINING_EXAMPLES)[-50:], loaded)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import asyncio
+import time
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import LLMs.orchestration as orchestration
+
+
+class FakeMessage:
+    def __init__(self, chat, message_id, text):
+        self.chat = chat
+        self.chat_id = chat.id
+        self.message_id = message_id
+        self.text = text
+        self.reply_to_message = None
+
+    async def reply_text(self, text, **kwargs):
+        return self.chat.send(text)
+
+    async def edit_text(self, text, parse_mode=None):
+        self.text = text
+
+    async def delete(self):
+        pass
+
+
+class FakeChat:
+    def __init__(self):
+        self.id = 1
+        self.sent = []
+
+    def send(self, text):
+        message = FakeMessage(self, len(self.sent) + 100, text)
+        self.sent.append(message)
+        return message
+
+
+class SlowProStream:
+    """Emulates a responses.create(stream=True) call: a slow model that streams its answer."""
+
+    def __init__(self, words, delay):
+        self.words = words
+        self.delay = delay
+
+    async def create(self, **kwargs):
+        return self._events()
+
+    async def _events(self):
+        for word in self.words:
+            await asyncio.sleep(self.delay)
+            yield SimpleNamespace(type="response.output_text.delta", delta=word + " ")
+        yield SimpleNamespace(type="response.completed",
+                              response=SimpleNamespace(output_text=" ".join(self.words)))
+
+
+class ProMessageTest(unittest.IsolatedAsyncioTestCase):
+
+    async def run_pro(self, stream):
+        chat = FakeChat()
+        update = SimpleNamespace(message=chat.send("/pro what's the meaning of life?"), effective_chat=chat)
+        context = SimpleNamespace(bot=AsyncMock(), user_data={})
+        with patch.object(orchestration, "client_EC", SimpleNamespace(responses=stream)):
+            await orchestration.other_message_pro(update, context)
+        return chat
+
+    async def test_event_loop_keeps_running_during_pro_request(self):
+        ticks = []
+
+        async def heartbeat():
+            while True:
+                ticks.append(time.perf_counter())
+                await asyncio.sleep(0.01)
+
+        heartbeat_task = asyncio.create_task(heartbeat())
+        try:
+            chat = await self.run_pro(SlowProStream(["Forty", "two", "🍌"], delay=0.1))
+        finally:
+            heartbeat_task.cancel()
+
+        self.assertGreater(len(ticks), 15)
+        self.assertLess(max(b - a for a, b in zip(ticks, ticks[1:])), 0.08)
+        self.assertEqual(chat.sent[1].text, "Forty two 🍌")
+
+    async def test_timeout(self):
+        with patch.object(orchestration, "PRO_TIMEOUT_SECONDS", 0.05):
+            chat = await self.run_pro(SlowProStream(["never"], delay=5))
+        self.assertIn("didn't answer", chat.sent[1].text)
+
+
+if __name__ == "__main__":
+    unittest.main()
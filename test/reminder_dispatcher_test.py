@@ -0,0 +1,209 @@
+import asyncio
+import os
+import unittest
+import uuid
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import asyncpg
+
+import features.reminders.dispatcher as dispatcher_module
+from features.reminders.dispatcher import CATCH_UP, WINDOW, ReminderDispatcher
+from utils.db import Database, setup_database
+from utils.helpers import BERLIN_TZ
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+USER_ID, CHAT_ID = 1001, 2002
+
+
+class FakeReminders:
+    """Stands in for fetch_due_reminders and mark_reminders_sent: a 'table' of standalone reminders."""
+
+    def __init__(self):
+        self.rows = {}
+        self.queries = []
+
+    def set(self, reminder_id, due):
+        self.rows[reminder_id] = {"reminder_id": reminder_id, "user_id": USER_ID, "chat_id": CHAT_ID,
+                                  "reminder_text": f"reminder {reminder_id}", "time": due, "sent_for": None}
+
+    async def fetch(self, after, until):
+        self.queries.append((after, until))
+        return [dict(row) for row in sorted(self.rows.values(), key=lambda row: row["time"])
+                if after < row["time"] <= until and row["sent_for"] != row["time"]]
+
+    async def mark_sent(self, sent):
+        for (_, reminder_id), due in sent.items():
+            self.rows[reminder_id]["sent_for"] = due
+
+
+class ReminderDispatcherWindowTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.now = datetime.now(tz=BERLIN_TZ).replace(microsecond=0)
+        self.table = FakeReminders()
+        for name, fake in [("fetch_due_reminders", self.table.fetch), ("mark_reminders_sent", self.table.mark_sent)]:
+            patcher = patch.object(dispatcher_module, name, fake)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.dispatcher = ReminderDispatcher()
+
+    async def test_only_the_window_is_loaded(self):
+        for i in range(1000):
+            self.table.set(i, self.now + timedelta(minutes=1 + i))     # over 16 hours
+        await self.dispatcher.refill(self.now)
+        self.assertEqual(15, self.dispatcher.loaded)
+        self.assertEqual([(self.now - CATCH_UP, self.now + WINDOW)], self.table.queries)
+
+        dispatched = 0
+        for minute in range(1, 600):        # 10 hours of refills, a minute apart
+            clock = self.now + timedelta(minutes=minute)
+            dispatched += len(self.dispatcher.pop_due(clock))
+            await self.dispatcher._mark_sent()
+            await self.dispatcher.refill(clock)
+        self.assertEqual(599, dispatched)
+        self.assertEqual(15, self.dispatcher.stats.peak_loaded)
+
+    async def test_edits_are_picked_up_by_the_next_refill(self):
+        for i in range(3):
+            self.table.set(i, self.now + timedelta(minutes=5 + i))
+        await self.dispatcher.refill(self.now)
+
+        self.table.set(0, self.now + timedelta(minutes=10))     # moved later
+        self.table.set(1, self.now + timedelta(minutes=2))      # moved earlier
+        del self.table.rows[2]                                   # deleted
+        self.table.set(3, self.now + timedelta(minutes=1))      # new
+        await self.dispatcher.refill(self.now)
+
+        due = self.dispatcher.pop_due(self.now + WINDOW)
+        self.assertEqual([3, 1, 0], [reminder["reminder_id"] for _, reminder in due])
+        self.assertEqual(0, self.dispatcher.loaded)
+
+    async def test_reminder_added_for_a_time_already_dispatched_is_still_sent(self):
+        due = self.now + timedelta(minutes=5)
+        self.table.set(1, due)
+        await self.dispatcher.refill(self.now)
+        self.assertEqual([1], [reminder["reminder_id"] for _, reminder in self.dispatcher.pop_due(due)])
+
+        self.table.set(2, due)                                   # same minute, saved after the first went out
+        self.table.set(3, due - timedelta(minutes=1))            # earlier still
+        await self.dispatcher.refill(due)       # before the first one's sent mark is written
+        self.assertEqual([3, 2], [reminder["reminder_id"] for _, reminder in self.dispatcher.pop_due(due)])
+
+        await self.dispatcher._mark_sent()
+        await self.dispatcher.refill(due)
+        self.assertEqual([], self.dispatcher.pop_due(due))      # each sent once
+        self.assertEqual({}, self.dispatcher._sent)
+
+    async def test_due_reminders_are_sent_and_lag_is_measured(self):
+        sent = []
+
+        async def send(reminder_data):
+            sent.append(reminder_data["reminder_id"])
+
+        dispatcher = ReminderDispatcher(send=send)
+        self.table.set(1, datetime.now(tz=BERLIN_TZ) + timedelta(seconds=0.1))
+        with patch.object(ReminderDispatcher, "_mark_sent", return_value=None) as save:
+            await dispatcher.refill()
+            task = asyncio.create_task(dispatcher._run())
+            try:
+                for _ in range(50):
+                    if sent:
+                        break
+                    await asyncio.sleep(0.02)
+            finally:
+                task.cancel()
+        self.assertEqual([1], sent)
+        save.assert_called_once()
+        self.assertEqual(1, dispatcher.stats.dispatched)
+        self.assertLess(dispatcher.stats.lags[0], 0.5)
+        self.assertIn("Dispatch lag", dispatcher.stats.summary())
+
+
+@unittest.skipUnless(TEST_DATABASE_URL, "TEST_DATABASE_URL not set (needs a disposable PostgreSQL database)")
+class ReminderDispatcherRestartTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.schema = f"test_dispatch_{uuid.uuid4().hex[:8]}"
+        self.admin = await asyncpg.connect(TEST_DATABASE_URL)
+        await self.admin.execute(f"CREATE SCHEMA {self.schema}")
+
+        async def init(conn):
+            # Text-format timestamptz, as Database.initialize() sets up
+            await conn.set_type_codec('timestamptz', encoder=lambda value: value, schema='pg_catalog',
+                                      decoder=lambda value: datetime.fromisoformat(value).astimezone(BERLIN_TZ))
+
+        self.pool = await asyncpg.create_pool(TEST_DATABASE_URL, min_size=1, max_size=2, init=init,
+                                              server_settings={'timezone': 'Europe/Berlin', 'search_path': self.schema})
+        self.original_pool, Database._pool = Database._pool, self.pool
+        await setup_database()
+        self.sent = []
+
+    async def asyncTearDown(self):
+        Database._pool = self.original_pool
+        await self.pool.close()
+        await self.admin.execute(f"DROP SCHEMA {self.schema} CASCADE")
+        await self.admin.close()
+
+    async def send(self, reminder_data):
+        self.sent.append(reminder_data["reminder_id"])
+
+    async def add_reminder(self, conn, due):
+        return await conn.fetchval("""
+            INSERT INTO manon_reminders (user_id, chat_id, reminder_text, time) VALUES ($1, $2, 'test', $3)
+            RETURNING reminder_id
+        """, USER_ID, CHAT_ID, due.isoformat())
+
+    async def test_missed_reminders_are_sent_once_after_a_restart(self):
+        now = datetime.now(tz=BERLIN_TZ)
+        async with self.pool.acquire() as conn:
+            await conn.execute("INSERT INTO manon_users (user_id, chat_id) VALUES ($1, $2)", USER_ID, CHAT_ID)
+            already_sent = await self.add_reminder(conn, now - timedelta(minutes=40))
+            await conn.execute("UPDATE manon_reminders SET sent_for = time WHERE reminder_id = $1", already_sent)
+            missed = await self.add_reminder(conn, now - timedelta(minutes=10))
+            too_old = await self.add_reminder(conn, now - timedelta(hours=3))
+
+        dispatcher = ReminderDispatcher(send=self.send)
+        await dispatcher.start()
+        for _ in range(50):
+            if self.sent:
+                break
+            await asyncio.sleep(0.02)
+        await dispatcher.stop()
+        self.assertEqual([missed], self.sent)
+        self.assertNotIn(already_sent, self.sent)
+        self.assertNotIn(too_old, self.sent)
+
+        restarted = ReminderDispatcher(send=self.send)
+        await restarted.start()
+        await asyncio.sleep(0.1)
+        await restarted.stop()
+        self.assertEqual([missed], self.sent)
+
+    async def test_goal_and_standalone_reminders_are_marked_sent_for_their_time(self):
+        now = datetime.now(tz=BERLIN_TZ).replace(microsecond=0)
+        async with self.pool.acquire() as conn:
+            await conn.execute("INSERT INTO manon_users (user_id, chat_id) VALUES ($1, $2)", USER_ID, CHAT_ID)
+            goal_id = await conn.fetchval("""
+                INSERT INTO manon_goals (user_id, chat_id, status, goal_description, reminder_scheduled, reminder_time)
+                VALUES ($1, $2, 'pending', 'test', TRUE, $3) RETURNING goal_id
+            """, USER_ID, CHAT_ID, (now - timedelta(minutes=1)).isoformat())
+            reminder_id = await self.add_reminder(conn, now - timedelta(minutes=1))
+
+        dispatcher = ReminderDispatcher(send=self.send)
+        await dispatcher.refill(now)
+        self.assertEqual(2, len(dispatcher.pop_due(now)))
+        await dispatcher._mark_sent()
+        self.assertEqual([], await dispatcher_module.fetch_due_reminders(now - CATCH_UP, now + WINDOW))
+
+        async with self.pool.acquire() as conn:      # moved after it was sent: it goes out again
+            await conn.execute("UPDATE manon_reminders SET time = $1 WHERE reminder_id = $2",
+                               (now + timedelta(minutes=5)).isoformat(), reminder_id)
+        rows = await dispatcher_module.fetch_due_reminders(now - CATCH_UP, now + WINDOW)
+        self.assertEqual([reminder_id], [row.get("reminder_id") for row in rows])
+        self.assertNotIn(goal_id, [row.get("goal_id") for row in rows])
+
+
+if __name__ == "__main__":
+    unittest.main()
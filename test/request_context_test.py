@@ -0,0 +1,69 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import LLMs.request_context as request_context_module
+from LLMs.request_context import get_request_context
+
+
+def fake_update(update_id, text="Run 5k tomorrow", reply_to=None):
+    return SimpleNamespace(
+        update_id=update_id,
+        effective_user=SimpleNamespace(id=1, first_name="Josefientje"),
+        effective_chat=SimpleNamespace(id=2),
+        message=SimpleNamespace(text=text, reply_to_message=SimpleNamespace(text=reply_to) if reply_to else None),
+        get_bot=lambda: SimpleNamespace(username="manon_bot"),
+    )
+
+
+class RequestContextTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.lookups = 0
+
+        async def slow_long_term_goals(chat_id, user_id):
+            self.lookups += 1
+            await asyncio.sleep(0.01)
+            return "Be kind"
+
+        patcher = patch.object(request_context_module, "fetch_long_term_goals", slow_long_term_goals)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.context = SimpleNamespace(user_data={})
+
+    async def test_pipeline_steps_share_one_computation(self):
+        update = fake_update(100, reply_to="Did you run today?")
+        results = await asyncio.gather(*(
+            get_request_context(update, self.context).input_variables() for _ in range(3)
+        ))
+        later = await get_request_context(update, self.context).input_variables()
+
+        self.assertEqual(1, self.lookups)
+        self.assertEqual(results[0]["now"], later["now"])
+        self.assertEqual("Run 5k tomorrow\n\n(As a reply to message: Did you run today?)", later["user_message"])
+        self.assertEqual("Be kind", later["long_term_goals"])
+
+    async def test_per_call_arguments_do_not_leak(self):
+        update = fake_update(101)
+        request_context = get_request_context(update, self.context)
+        translated = await request_context.input_variables(source_text="Hallo", target_language="German", goal_data={"a": 1})
+        translated["active_goals"] = "mutated by a caller"
+        plain = await request_context.input_variables()
+
+        self.assertEqual("Hallo", translated["user_message"])
+        self.assertEqual("Run 5k tomorrow", plain["user_message"])
+        self.assertEqual("English", plain["target_language"])
+        self.assertEqual("No goal_data passed as argument", plain["goal_data"])
+        self.assertNotIn("active_goals", plain)
+
+    async def test_next_update_gets_a_fresh_context(self):
+        await get_request_context(fake_update(102), self.context).input_variables()
+        next_variables = await get_request_context(fake_update(103, text="Read a book"), self.context).input_variables()
+
+        self.assertEqual(2, self.lookups)
+        self.assertEqual("Read a book", next_variables["user_message"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import asyncio
+import unittest
+
+import LLMs.speculation as speculation_module
+from LLMs.speculation import Speculation, SpeculationStats
+
+
+async def chain(result, seconds):
+    await asyncio.sleep(seconds)
+    return result
+
+
+class SpeculationTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.original_stats = speculation_module.speculation_stats
+        speculation_module.speculation_stats = SpeculationStats()
+        self.addCleanup(setattr, speculation_module, "speculation_stats", self.original_stats)
+
+    async def test_used_result_saves_the_overlap(self):
+        speculation = Speculation()
+        speculation.start("goal_classification", chain("Set", 0.05))
+        await asyncio.sleep(0.05)       # initial_classification running meanwhile
+
+        self.assertEqual("Set", await speculation.take("goal_classification"))
+        stats = speculation_module.speculation_stats
+        self.assertEqual((1, 1, 1, 0), (stats.messages, stats.paid_off, stats.used, stats.wasted))
+        self.assertGreater(stats.saved_seconds[0], 0.04)
+
+    async def test_losers_are_cancelled(self):
+        speculation = Speculation()
+        speculation.start("goal_classification", chain("Set", 10))
+        speculation.start("goal_setting_analysis", chain("analysis", 10))
+        task = speculation._tasks["goal_setting_analysis"][0]
+
+        speculation.cancel_remaining()
+        await asyncio.sleep(0)
+
+        self.assertTrue(task.cancelled())
+        stats = speculation_module.speculation_stats
+        self.assertEqual((1, 0, 2), (stats.messages, stats.paid_off, stats.wasted))
+
+    async def test_failed_speculation_falls_back(self):
+        async def broken():
+            raise RuntimeError("rate limited")
+
+        speculation = Speculation()
+        speculation.start("goal_classification", broken())
+        self.assertIsNone(await speculation.take("goal_classification"))
+        self.assertIsNone(await speculation.take("goal_classification"))    # not speculated (anymore)
+        self.assertEqual(1, speculation_module.speculation_stats.failed)
+
+
+if __name__ == "__main__":
+    unittest.main()
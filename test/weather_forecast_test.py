@@ -0,0 +1,93 @@
+import json
+import threading
+import unittest
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import features.weather.monitoring as weather
+from utils.helpers import BERLIN_TZ
+from utils.http_client import close_http_client
+
+
+class OpenMeteoStandIn(BaseHTTPRequestHandler):
+    """Local stand-in for api.open-meteo.com: yesterday 10°C, today 15°C, then +1°C a day (min = max - 8)."""
+    requests_seen = []
+
+    def do_GET(self):
+        OpenMeteoStandIn.requests_seen.append(parse_qs(urlparse(self.path).query))
+        today = datetime.now(BERLIN_TZ).date()
+        dates = [(today + timedelta(days=offset)).isoformat() for offset in range(-1, 5)]
+        maxs = [10.0, 15.0, 16.0, 17.0, 18.0, 19.0]
+        body = json.dumps({
+            "daily": {
+                "time": dates,
+                "temperature_2m_max": maxs,
+                "temperature_2m_min": [hi - 8 for hi in maxs],
+            }
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class WeatherForecastTest(unittest.IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), OpenMeteoStandIn)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.original_url = weather.OPEN_METEO_URL
+        weather.OPEN_METEO_URL = f"http://127.0.0.1:{cls.server.server_port}/v1/forecast"
+
+    @classmethod
+    def tearDownClass(cls):
+        weather.OPEN_METEO_URL = cls.original_url
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        OpenMeteoStandIn.requests_seen.clear()
+        weather._forecast_cache.invalidate()
+
+    async def asyncTearDown(self):
+        await close_http_client()
+
+    async def test_one_request_serves_both_messages(self):
+        summary = await weather.get_weather_summary()
+        change_message = await weather.get_weather_change_message()
+        summary_again = await weather.get_weather_summary()
+
+        self.assertEqual(1, len(OpenMeteoStandIn.requests_seen))
+        params = OpenMeteoStandIn.requests_seen[0]
+        self.assertEqual(["1"], params["past_days"])
+        self.assertEqual(["5"], params["forecast_days"])
+        self.assertEqual(["temperature_2m_max,temperature_2m_min"], params["daily"])
+
+        self.assertEqual(summary, summary_again)
+        self.assertIn("Today: 7°C – 15°C", summary)
+        self.assertEqual(6, len(summary.splitlines()))  # header + today + 4 days, yesterday left out
+        self.assertIn("Today is 5°C warmer than yesterday (10°C → 15°C)", change_message)
+
+    async def test_concurrent_callers_share_one_fetch(self):
+        import asyncio
+        results = await asyncio.gather(*(weather.get_weather_change_message() for _ in range(20)))
+
+        self.assertEqual(1, len(OpenMeteoStandIn.requests_seen))
+        self.assertEqual(1, len(set(results)))
+
+    async def test_expired_forecast_is_refetched(self):
+        await weather.get_weather_summary()
+        today = datetime.now(BERLIN_TZ).date().isoformat()
+        weather._forecast_cache.put(today, weather._forecast_cache.peek(today), ttl=-1)   # as if the hour rolled over
+        await weather.get_weather_summary()
+
+        self.assertEqual(2, len(OpenMeteoStandIn.requests_seen))
+
+
+if __name__ == "__main__":
+    unittest.main()
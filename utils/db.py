@@ -4,9 +4,12 @@ import socket
 from utils.environment_vars import ENV_VARS
 from utils.helpers import BERLIN_TZ, parse_reminder_times
 from features.goals.helpers import add_user_context_to_goals
+from features.stats.cache import invalidate_user_stats
+from utils.migrations import run_migrations, LATEST_VERSION
 from logger.logger import logger
 from utils.session_avatar import PA
 import logging, asyncpg, re, pytz
+import time as time_module
 from datetime import time, datetime, timedelta
 
 # Legacy check from Heroku times, leaving it here to remember that ssl settings matter for that
@@ -98,206 +101,18 @@ class Database:
             cls._pool = None
 
 
-
-
-# Function to add missing columns
-async def add_missing_columns(conn, table_name: str, desired_columns: dict):
-    """Add missing columns to the specified table"""
-    try:
-        # Get existing columns
-        existing_columns = await conn.fetch('''
-            SELECT column_name, data_type 
-            FROM information_schema.columns 
-            WHERE table_name = $1
-        ''', table_name)
-        
-        existing_column_names = {col['column_name'] for col in existing_columns}
-
-        # Add missing columns
-        for col_name, col_type in desired_columns.items():
-            if col_name not in existing_column_names:
-                await conn.execute(f'''
-                    ALTER TABLE {table_name} 
-                    ADD COLUMN {col_name} {col_type}
-                ''')
-                logger.warning(f"Added column {col_name} to {table_name}")
-
-    except Exception as e:
-        logger.error(f"Error adding columns to {table_name}: {e}")
-        raise
-
-
 # called in main.py: initialize_environment(app)
 async def setup_database():
-    """Create and/or update database tables on boot"""
-    try:    
+    """Bring the database schema up to date on boot (see utils/migrations.py)"""
+    start = time_module.perf_counter()
+    try:
         async with Database.acquire() as conn:
-
-        #1 manon_users table
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS manon_users (
-                    user_id BIGINT,
-                    chat_id BIGINT,
-                    first_name TEXT DEFAULT 'Josefientje',
-                    pending_goals INT DEFAULT 0,
-                    finished_goals INT DEFAULT 0,
-                    failed_goals INT DEFAULT 0,       
-                    score FLOAT DEFAULT 0,
-                    penalties_accrued FLOAT DEFAULT 0,          
-                    inventory JSONB DEFAULT '{"boosts": 1, "challenges": 1, "links": 1}',
-                    any_reminder_scheduled BOOLEAN DEFAULT False,
-                    long_term_goals TEXT DEFAULT NULL,       
-                    PRIMARY KEY (user_id, chat_id)
-                )
-            ''')
-            # Desired columns with definitions
-            desired_columns_manon_users = {
-                'user_id': 'BIGINT',
-                'chat_id': 'BIGINT',
-            }
-            await add_missing_columns(conn, 'manon_users', desired_columns_manon_users)
-
-    
-            #2 manon_goals table
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS manon_goals (
-                    goal_id SERIAL PRIMARY KEY,
-                    group_id BIGINT DEFAULT NULL,           -- Group ID for recurring goals       
-                    user_id BIGINT NOT NULL,                -- Foreign key to identify the user
-                    chat_id BIGINT NOT NULL,                -- Foreign key to identify the chat 
-                    status TEXT DEFAULT 'limbo' CHECK (status IN (
-                        'limbo', 'prepared', 'pending', 'paused', 'archived_done', 'archived_failed', 'archived_canceled'
-                    )),
-		            recurrence_type TEXT DEFAULT NULL,
-                    timeframe TEXT DEFAULT NULL,       
-                    goal_value FLOAT DEFAULT NULL,   
-                    total_goal_value FLOAT DEFAULT NULL,       
-                    goal_description TEXT DEFAULT NULL,
-                    set_time TIMESTAMPTZ DEFAULT NOW(),       -- Time when the (limbo first, then other status again) goal was set
-                    deadline TIMESTAMPTZ,
-                    deadlines TEXT[] DEFAULT NULL,              -- To use for the goal_proposal template, storing future and past deadlines of the entire group_id as well 
-                    interval TEXT DEFAULT NULL,
-                    reminder_time TIMESTAMPTZ DEFAULT NULL,
-                    reminders_times TEXT[] DEFAULT NULL,       -- To use for the goal_proposal template, storing future and past reminders of the entire group_id as well
-                    reminder_scheduled BOOLEAN DEFAULT False,   
-                    time_investment_value FLOAT DEFAULT NULL,    
-		            difficulty_multiplier FLOAT DEFAULT NULL,
-		            impact_multiplier FLOAT DEFAULT NULL,
-                    penalty FLOAT DEFAULT NULL,
-                    total_penalty FLOAT DEFAULT NULL,
-                    attempt INTEGER DEFAULT 1,                      -- N+1, for tracking attempts (retries)
-                    iteration INTEGER DEFAULT NULL,                 -- N+1 iteration of instances of individual (sub)goals that belong to the same group of one recurring goal
-                    final_iteration TEXT DEFAULT 'not applicable',  -- The last in the series of this group_id: final iteration of this recurring goal. Can be used to prompt evaluation of extension ('not applicable', 'yes', 'not yet')
-                    goal_category TEXT[] DEFAULT NULL,            -- eg work, productivity, chores, relationships, hobbies, self-development, money, impact, health, fun, other       
-                    completion_time TIMESTAMPTZ DEFAULT NULL,                           -- Time when the goal was completed
-                    FOREIGN KEY (user_id, chat_id) REFERENCES manon_users (user_id, chat_id)
-                )
-            ''')
-            desired_columns_manon_goals = {
-                'goal_id': 'SERIAL PRIMARY KEY',
-                'attempt': 'INTEGER DEFAULT 1',
-                'iteration': 'INTEGER DEFAULT NULL',
-                'final_iteration': 'TEXT DEFAULT "not applicable"' 
-            }
-            await add_missing_columns(conn, 'manon_goals', desired_columns_manon_goals)
-            
-            #3 manon_reminders table
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS manon_reminders (
-                    reminder_id SERIAL PRIMARY KEY, 
-                    user_id BIGINT NOT NULL,                -- Foreign key to identify the user
-                    chat_id BIGINT NOT NULL,                -- Foreign key to identify the chat       
-                    reminder_text TEXT DEFAULT NULL,
-                    reminder_category TEXT[] DEFAULT NULL,       
-                    set_time TIMESTAMPTZ DEFAULT NOW(),       -- Time when the reminder was set/requested
-                    time TIMESTAMPTZ DEFAULT NULL,
-                    FOREIGN KEY (user_id, chat_id) REFERENCES manon_users (user_id, chat_id)
-                )
-            ''')
-            desired_columns_manon_reminders = {
-                'reminder_id': 'SERIAL PRIMARY KEY',
-                'user_id': 'BIGINT NOT NULL'
-            }
-            await add_missing_columns(conn, 'manon_reminders', desired_columns_manon_reminders)
-
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS day_snapshots (
-                    snapshot_id SERIAL PRIMARY KEY,
-                    user_id BIGINT NOT NULL,
-                    chat_id BIGINT NOT NULL,
-                    snapshot_date DATE NOT NULL,
-                    score FLOAT DEFAULT 0,
-                    pending_goals INT DEFAULT 0,
-                    finished_goals INT DEFAULT 0,
-                    failed_goals INT DEFAULT 0,
-                    goals_set INT DEFAULT 0,
-                    goals_finished INT DEFAULT 0,
-                    goals_failed INT DEFAULT 0,
-                    score_gained FLOAT DEFAULT 0,
-                    penalties_incurred FLOAT DEFAULT 0,
-                    completion_rate FLOAT DEFAULT NULL,
-                    UNIQUE (user_id, chat_id, snapshot_date)
-                )
-            ''')
-
-            #4 manon_stats_snapshots table
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS manon_stats_snapshots (
-                    snapshot_id SERIAL PRIMARY KEY,
-                    user_id BIGINT NOT NULL,                -- Foreign key to identify the user
-                    chat_id BIGINT NOT NULL,                -- Foreign key to identify the chat
-                    date DATE NOT NULL,                     -- Date of the snapshot (without time)
-
-                    -- Totals snapshot
-                    score FLOAT DEFAULT NULL,                  -- Snapshot of the user's score
-                    pending_goals INT DEFAULT NULL,            -- Snapshot of pending goals
-                    finished_goals INT DEFAULT NULL,           -- Snapshot of finished goals
-                    failed_goals INT DEFAULT NULL,             -- Snapshot of failed goals           
-        
-                    -- Daily counts
-                    goals_set INTEGER DEFAULT 0,            -- Number of goals set on this date
-                    goals_finished INTEGER DEFAULT 0,       -- Number of goals completed on this date
-                    goals_failed INTEGER DEFAULT 0,         -- Number of goals failed on this date
-                    goals_pending INTEGER DEFAULT 0,        -- Number of goals still pending at snapshot time
-        
-                    -- Value metrics
-                    score_gained FLOAT DEFAULT 0,           -- Score earned on this date
-                    penalties_incurred FLOAT DEFAULT 0,     -- Penalties accrued on this date
-                    completion_rate FLOAT DEFAULT NULL,     -- Daily completion rate (percentage)
-        
-                    -- Time-based metrics
-                    avg_completion_time INTERVAL DEFAULT NULL,  -- Average time to complete goals on this date
-                    total_time_invested INTERVAL DEFAULT NULL,  -- Total time invested in goals on this date
-        
-                    -- Categories snapshot (optional, for future use)
-                    category_distribution JSONB DEFAULT NULL,   -- Distribution of goals across categories
-        
-                    -- Metadata
-                    snapshot_time TIMESTAMPTZ DEFAULT NOW(),   -- Exact time when snapshot was taken
-        
-                    FOREIGN KEY (user_id, chat_id) REFERENCES manon_users (user_id, chat_id),
-                    UNIQUE (user_id, chat_id, date)           -- Ensure one snapshot per user per day
-                )
-            ''')
-            desired_columns_manon_stats_snapshots = {
-                'snapshot_id': 'SERIAL PRIMARY KEY',
-                'user_id': 'BIGINT NOT NULL',
-                'chat_id': 'BIGINT NOT NULL',
-                'date': 'DATE NOT NULL',
-                'score': 'FLOAT DEFAULT NULL',
-                'pending_goals': 'INT DEFAULT NULL',          
-                'finished_goals': 'INT DEFAULT NULL',          
-                'failed_goals': 'INT DEFAULT NULL'            
-            }
-            await add_missing_columns(conn, 'manon_stats_snapshots', desired_columns_manon_stats_snapshots)
-
-            # Create index for faster queries
-            await conn.execute('''
-                CREATE INDEX IF NOT EXISTS idx_manon_stats_snapshots_user_date 
-                ON manon_stats_snapshots (user_id, chat_id, date);
-            ''')
-
-        logger.info("Database tables initialized successfully")
+            applied = await run_migrations(conn)
+        elapsed_ms = (time_module.perf_counter() - start) * 1000
+        if applied:
+            logger.warning(f"Database schema migrated to version {LATEST_VERSION} (applied {applied}) in {elapsed_ms:.0f} ms")
+        else:
+            logger.info(f"Database schema up to date (version {LATEST_VERSION}), checked in {elapsed_ms:.0f} ms")
 
     except Exception as e:
         logger.error(f"Error updating database schema: {e}")
@@ -353,13 +168,16 @@ async def update_goal_data(goal_id, initial_update=False, **kwargs):
             UPDATE manon_goals
             SET {updates}
             WHERE goal_id = $1
+            RETURNING user_id, chat_id
         '''
         
         logging.debug(f"Query: {query}")
         logging.debug(f"Values: {values}")
         
         async with Database.acquire() as conn:
-            await conn.execute(query, *values)
+            owner = await conn.fetchrow(query, *values)
+        if owner and ("status" in kwargs or "deadline" in kwargs):
+            invalidate_user_stats(owner["user_id"], owner["chat_id"])
         
     except Exception as e:
         logger.error(f'Error updating goal data for goal_id {goal_id}: {e}')
@@ -424,7 +242,117 @@ async def update_user_data(user_id, chat_id, **kwargs):
         logger.error(f"Values: {values}")
         raise
 
-        
+
+POSTPONE_MULTIPLIER = 0.65      # share of the penalty charged for pushing a goal to the next day
+
+# Per transition: (SET clause for manon_goals, SET clause for manon_users). In the users clause, g is the updated goal row
+GOAL_TRANSITIONS = {
+    "done": (
+        "status = 'archived_done', completion_time = NOW()",
+        "score = u.score + COALESCE(g.goal_value, 0), finished_goals = u.finished_goals + 1, pending_goals = u.pending_goals - 1",
+    ),
+    "failed": (
+        "status = 'archived_failed', completion_time = NOW()",
+        "score = u.score - COALESCE(g.penalty, 0), penalties_accrued = u.penalties_accrued + COALESCE(g.penalty, 0), "
+        "failed_goals = u.failed_goals + 1, pending_goals = u.pending_goals - 1",
+    ),
+    "postpone": (
+        # first same-time-of-day after now (day arithmetic in the Europe/Berlin session timezone, so DST keeps the wall-clock time)
+        """deadline = deadline + make_interval(days => (
+            SELECT MIN(n) FROM generate_series(1, GREATEST(1, CEIL(EXTRACT(EPOCH FROM NOW() - deadline) / 86400)::INT + 1)) AS n
+            WHERE manon_goals.deadline + make_interval(days => n) > NOW()
+        )), attempt = attempt + 1""",
+        f"score = u.score - COALESCE(g.penalty, 0) * {POSTPONE_MULTIPLIER} * {POSTPONE_MULTIPLIER}, "
+        f"penalties_accrued = u.penalties_accrued + COALESCE(g.penalty, 0) * {POSTPONE_MULTIPLIER}",
+    ),
+}
+
+
+async def transition_goal(goal_id, transition, user_id=None, chat_id=None):
+    """
+    Moves a pending goal to its next state and settles the user's counters in one statement (one round-trip, one transaction).
+
+    Args:
+        goal_id (int): The goal to transition.
+        transition (str): One of GOAL_TRANSITIONS: 'done', 'failed' or 'postpone'.
+        user_id (int, optional): User to credit/charge. Defaults to the goal's owner.
+        chat_id (int, optional): Chat of that user. Defaults to the goal's chat.
+
+    Returns:
+        Record with goal_id, user_id, chat_id, goal_value, penalty, goal_description and (new) deadline,
+        or None if the goal doesn't exist or is no longer pending (e.g. a double tap).
+    """
+    goal_updates, user_updates = GOAL_TRANSITIONS[transition]
+    query = f'''
+        WITH g AS (
+            UPDATE manon_goals
+            SET {goal_updates}
+            WHERE goal_id = $1 AND status = 'pending'
+            RETURNING goal_id, user_id, chat_id, goal_value, penalty, goal_description, deadline
+        ), usr AS (
+            UPDATE manon_users u
+            SET {user_updates}
+            FROM g
+            WHERE u.user_id = COALESCE($2::BIGINT, g.user_id) AND u.chat_id = COALESCE($3::BIGINT, g.chat_id)
+            RETURNING u.user_id
+        )
+        SELECT g.*, (SELECT COUNT(*) FROM usr) AS users_updated
+        FROM g
+    '''
+    try:
+        async with Database.acquire() as conn:
+            row = await conn.fetchrow(query, goal_id, user_id, chat_id)
+        if row is not None:
+            invalidate_user_stats(row["user_id"], row["chat_id"])
+        if row is None:
+            logger.warning(f"{PA} Goal #{goal_id} not transitioned to '{transition}': not found or no longer pending")
+        elif row["users_updated"] == 0:
+            logger.error(f"Goal #{goal_id} transitioned to '{transition}' but no manon_users row matched user {user_id}/chat {chat_id}")
+        return row
+    except Exception as e:
+        logger.error(f"Error in transition_goal() for goal_id {goal_id} ({transition}): {e}")
+        raise
+
+
+async def fail_pending_goals(goal_ids):
+    """
+    transition_goal(goal_id, 'failed') for many goals at once: fails the ones that are still pending and charges their
+    owners, in one statement (one round-trip, one transaction).
+
+    Returns:
+        Records with goal_id, user_id, chat_id, goal_value, penalty, goal_description and deadline of the goals that
+        were failed, by chat; goals that were reported in the meantime are left out.
+    """
+    query = '''
+        WITH g AS (
+            UPDATE manon_goals
+            SET status = 'archived_failed', completion_time = NOW()
+            WHERE goal_id = ANY($1::int[]) AND status = 'pending'
+            RETURNING goal_id, user_id, chat_id, goal_value, penalty, goal_description, deadline
+        ), totals AS (
+            SELECT user_id, chat_id, SUM(COALESCE(penalty, 0)) AS penalty, COUNT(*) AS goals
+            FROM g
+            GROUP BY user_id, chat_id
+        ), usr AS (
+            UPDATE manon_users u
+            SET score = u.score - t.penalty, penalties_accrued = u.penalties_accrued + t.penalty,
+                failed_goals = u.failed_goals + t.goals, pending_goals = u.pending_goals - t.goals
+            FROM totals t
+            WHERE u.user_id = t.user_id AND u.chat_id = t.chat_id
+            RETURNING u.user_id
+        )
+        SELECT g.*, (SELECT COUNT(*) FROM usr) AS users_updated
+        FROM g
+        ORDER BY g.chat_id, g.goal_id
+    '''
+    async with Database.acquire() as conn:
+        rows = await conn.fetch(query, list(goal_ids))
+    for user_id, chat_id in {(row["user_id"], row["chat_id"]) for row in rows}:
+        invalidate_user_stats(user_id, chat_id)
+    logger.info(f"Failed {len(rows)} of {len(goal_ids)} goals, the others were no longer pending")
+    return rows
+
+
         
 async def create_limbo_goal(update, context):
     chat_id=update.effective_chat.id
@@ -478,6 +406,59 @@ async def create_recurring_goal_instance(**kwargs):
         logger.error(f"Unexpected error in create_recurring_goal_instance: {e}")
         return None
 
+
+async def create_recurring_goal_instances(goal_id, user_id, chat_id):
+    """
+    Materializes all follow-up instances of a recurring (mother) goal in one statement.
+
+    Every deadline after the first becomes its own pending goal (iteration 2..N, the mother goal itself is iteration 1),
+    and the user's pending_goals counter is raised once by the full deadline count (mother included).
+
+    Args:
+        goal_id (int): The mother goal, whose deadlines array drives the instances. Also used as group_id.
+        user_id (int): Owner of the new instances.
+        chat_id (int): Chat of the new instances.
+
+    Returns:
+        List[int]: The goal_ids of the inserted instances, in iteration order.
+    """
+    try:
+        async with Database.acquire() as conn:
+            new_goal_ids = await conn.fetchval('''
+                WITH mother AS (
+                    SELECT goal_value, penalty, interval, deadlines, goal_description, goal_category, total_goal_value
+                    FROM manon_goals
+                    WHERE goal_id = $1
+                ), inserted AS (
+                    INSERT INTO manon_goals (
+                        user_id, chat_id, group_id, goal_value, penalty, interval, deadline, goal_description,
+                        goal_category, total_goal_value, set_time, final_iteration, status, timeframe, recurrence_type, iteration
+                    )
+                    SELECT
+                        $2, $3, $1, m.goal_value, m.penalty, m.interval, d.deadline::TIMESTAMPTZ, m.goal_description,
+                        m.goal_category, m.total_goal_value, NOW(),
+                        CASE WHEN d.iteration = cardinality(m.deadlines) THEN 'yes' ELSE 'not yet' END,
+                        'pending', 'by_date', 'recurring', d.iteration
+                    FROM mother m, unnest(m.deadlines) WITH ORDINALITY AS d(deadline, iteration)
+                    WHERE d.iteration > 1
+                    ORDER BY d.iteration
+                    RETURNING goal_id, iteration
+                ), counters AS (
+                    UPDATE manon_users
+                    SET pending_goals = pending_goals + (SELECT COALESCE(cardinality(deadlines), 0) FROM mother)
+                    WHERE user_id = $2 AND chat_id = $3
+                )
+                SELECT COALESCE(array_agg(goal_id ORDER BY iteration), '{}') FROM inserted
+            ''', goal_id, user_id, chat_id)
+
+        invalidate_user_stats(user_id, chat_id)
+        logger.info(f"Created {len(new_goal_ids)} recurring instances for goal #{goal_id}")
+        return list(new_goal_ids)
+
+    except Exception as e:
+        logger.error(f"Error in create_recurring_goal_instances() for goal_id {goal_id}: {e}")
+        raise
+
         
 
 async def complete_limbo_goal(update, context, goal_id, initial_update=True):
@@ -560,6 +541,9 @@ async def complete_limbo_goal(update, context, goal_id, initial_update=True):
 
         # Update the goal data in the database
         await update_goal_data(goal_id, initial_update, **kwargs)
+        if kwargs.get("reminder_time"):
+            from features.reminders.dispatcher import reminder_dispatcher
+            reminder_dispatcher.refresh()
         
         # Validate goal constraints
         if initial_update:      # don't know how to make this work for adjustments yet (would have to update the function I think and account for initial_update value inside it)
@@ -1086,7 +1070,6 @@ async def record_reminder(update, context, output):
             return None
 
         created: list[tuple[int, datetime]] = []
-        now = datetime.now(tz=BERLIN_TZ)
 
         async with Database.acquire() as conn:
             query = """
@@ -1108,29 +1091,9 @@ async def record_reminder(update, context, output):
                 reminder_id = result["reminder_id"]
                 created.append((reminder_id, reminder_time))
 
-                if reminder_time <= now + timedelta(days=1):
-                    reminder_data = {
-                        "reminder_id": reminder_id,
-                        "user_id": user_id,
-                        "chat_id": chat_id,
-                        "reminder_text": output.reminder_text,
-                        "time": reminder_time,
-                    }
-                    from utils.scheduler import scheduler
-                    from features.reminders.reminders import send_reminder
-
-                    formatted_time = reminder_time.strftime("%A, %B %d, %Y at %H:%M")
-                    scheduler.add_job(
-                        send_reminder,
-                        "date",
-                        run_date=reminder_time,
-                        args=[context.bot, reminder_data],
-                        id=f"regularreminder_{reminder_id}",
-                        replace_existing=True,
-                    )
-                    logger.info(
-                        f"Scheduled immediate reminder #{reminder_id} for {formatted_time}"
-                    )
+        # The dispatcher's next refill would find them too, but a reminder due within a minute shouldn't wait for it
+        from features.reminders.dispatcher import reminder_dispatcher
+        reminder_dispatcher.refresh()
 
         if len(created) == 1:
             reminder_id, reminder_time = created[0]
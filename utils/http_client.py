@@ -0,0 +1,30 @@
+# utils/http_client.py
+import logging
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# One connection pool for all outgoing (non-Telegram, non-LLM) HTTP calls: price feeds, weather, ...
+_client: httpx.AsyncClient | None = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Returns the shared async HTTP client, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(10.0),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            headers={"User-Agent": "Manon-PA-bot"},
+        )
+    return _client
+
+
+async def close_http_client():
+    """Closes the shared client (called on application shutdown)."""
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+        logger.info("Shared HTTP client closed")
+    _client = None
@@ -0,0 +1,208 @@
+# utils/job_metrics.py
+"""
+Instrumentation for every APScheduler job: how late each run started compared to its scheduled time, how long it
+took, and whether it failed, misfired (skipped for being too late), was skipped because the previous run was still
+going, or absorbed coalesced runs (several missed fire times run once).
+
+It works from the scheduler's events, so no job needs to be wrapped. A run counts as started when it's submitted to the
+executor. The last RING_SIZE runs are kept in memory for the Jobs trigger (summary()), and every run is also written to
+manon_job_runs in batches, like LLMTelemetry does for LLM calls, for looking at drift over longer periods.
+"""
+import asyncio
+import logging
+import statistics
+from collections import deque, namedtuple
+from datetime import datetime, timedelta
+
+from apscheduler.events import (
+    EVENT_JOB_ADDED, EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED,
+    EVENT_JOB_MODIFIED, EVENT_JOB_REMOVED, EVENT_JOB_SUBMITTED,
+)
+from apscheduler.triggers.date import DateTrigger
+
+from utils.db import Database
+from utils.helpers import BERLIN_TZ
+
+logger = logging.getLogger(__name__)
+
+RING_SIZE = 1000            # runs kept in memory for summary()
+FLUSH_INTERVAL = 30         # seconds
+MAX_BUFFERED = 10_000       # when the database is unreachable, the oldest runs are dropped beyond this
+LAG_WARNING = 5             # seconds; log when a job starts later than this
+MAX_COALESCED_COUNT = 1000
+
+COLUMNS = ("created_at", "job_id", "job_name", "scheduled_time", "start_lag_ms", "duration_ms", "outcome",
+           "coalesced", "error")
+# Timestamps as epoch seconds, as in LLMTelemetry (COPY can't use the text timestamptz codec)
+INSERT_QUERY = f"""
+    INSERT INTO manon_job_runs ({", ".join(COLUMNS)})
+    VALUES (to_timestamp($1), $2, $3, to_timestamp($4), {", ".join(f"${i}" for i in range(5, len(COLUMNS) + 1))})
+"""
+
+JobRun = namedtuple("JobRun", "job_id job_name scheduled_time started lag duration outcome coalesced error")
+
+
+def coalesced_fire_times(trigger, expected, first_run_time) -> int:
+    """How many fire times of `trigger` from `expected` up to (not including) `first_run_time` were never run"""
+    count, fire_time = 0, expected
+    while fire_time is not None and fire_time < first_run_time and count < MAX_COALESCED_COUNT:
+        count += 1
+        fire_time = trigger.get_next_fire_time(fire_time, fire_time + timedelta(microseconds=1))
+    return count
+
+
+class JobMetrics:
+
+    def __init__(self, size: int = RING_SIZE):
+        self.runs = deque(maxlen=size)
+        self._started = {}          # (job_id, scheduled run time) -> (started, job name, coalesced, due) of runs in progress
+        self._expected_next = {}    # job_id -> next fire time, as of its last submission
+        self._one_off_names = {}    # job_id -> name of date-triggered jobs, which are removed before their run is submitted
+        self._buffer = deque(maxlen=MAX_BUFFERED)
+        self._flusher = None
+        self._scheduler = None
+        self.dropped = 0
+
+    def attach(self, scheduler):
+        self._scheduler = scheduler
+        scheduler.add_listener(
+            self._on_event,
+            EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES
+            | EVENT_JOB_ADDED | EVENT_JOB_MODIFIED | EVENT_JOB_REMOVED,
+        )
+
+    # Scheduler events --------------------------------------------------------------------------------------------
+
+    def _on_event(self, event):
+        try:
+            now = datetime.now(tz=BERLIN_TZ)
+            if event.code == EVENT_JOB_SUBMITTED:
+                self._on_submitted(event, now)
+            elif event.code in (EVENT_JOB_EXECUTED, EVENT_JOB_ERROR, EVENT_JOB_MISSED):
+                started, name, coalesced, due = self._started.pop((event.job_id, event.scheduled_run_time), (None, None, 0, None))
+                if event.code == EVENT_JOB_MISSED:
+                    self._record(event.job_id, name, event.scheduled_run_time, None, now, "missed", coalesced, due=due)
+                else:
+                    outcome = "error" if event.code == EVENT_JOB_ERROR else "ok"
+                    self._record(event.job_id, name, event.scheduled_run_time, started or now, now, outcome, coalesced,
+                                 event.exception, due=due)
+            elif event.code == EVENT_JOB_MAX_INSTANCES:
+                for run_time in event.scheduled_run_times:
+                    self._record(event.job_id, self._job_name(event), run_time, None, now, "skipped", 0)
+            else:
+                # Added, modified or removed: fire times from before don't predict the next run anymore
+                self._expected_next.pop(event.job_id, None)
+                if event.code == EVENT_JOB_ADDED:
+                    job = self._scheduler.get_job(event.job_id, event.jobstore)
+                    if job is not None and isinstance(job.trigger, DateTrigger):
+                        self._one_off_names[event.job_id] = job.name
+        except Exception as e:
+            logger.error(f"Couldn't record scheduler event {event.code} for job {getattr(event, 'job_id', '?')}: {e}")
+
+    def _job_name(self, event):
+        job = self._scheduler.get_job(event.job_id, event.jobstore) if self._scheduler else None
+        return job.name if job else self._one_off_names.get(event.job_id, event.job_id)
+
+    def _on_submitted(self, event, now):
+        # By now the scheduler has moved the job on to its next run time (or removed it, if this was the last one)
+        job = self._scheduler.get_job(event.job_id, event.jobstore) if self._scheduler else None
+        name = job.name if job else self._one_off_names.pop(event.job_id, event.job_id)
+        coalesced, due = 0, None
+        expected = self._expected_next.get(event.job_id)
+        first_run_time = event.scheduled_run_times[0]
+        if job is not None and expected is not None and first_run_time > expected:
+            coalesced = coalesced_fire_times(job.trigger, expected, first_run_time)
+            due = expected if coalesced else None   # the run stands in for fire times since then
+        for run_time in event.scheduled_run_times:
+            self._started[(event.job_id, run_time)] = (now, name, coalesced, due)
+            coalesced, due = 0, None
+        if job is not None and job.next_run_time is not None:
+            self._expected_next[event.job_id] = job.next_run_time
+        else:
+            self._expected_next.pop(event.job_id, None)
+
+    def _record(self, job_id, job_name, scheduled_time, started, finished, outcome, coalesced, error=None, due=None):
+        """`due` is when the run was first due, if that's before scheduled_time (coalesced runs): lag counts from there"""
+        lag = ((started or finished) - (due or scheduled_time)).total_seconds()
+        duration = (finished - started).total_seconds() if started else None
+        run = JobRun(job_id, job_name or job_id, scheduled_time, started, lag, duration, outcome, coalesced,
+                     None if error is None else repr(error)[:500])
+        self.runs.append(run)
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+        self._buffer.append((
+            finished.timestamp(), run.job_id, run.job_name, scheduled_time.timestamp(), round(lag * 1000, 1),
+            None if duration is None else round(duration * 1000, 1), outcome, coalesced, run.error,
+        ))
+        if lag > LAG_WARNING or outcome in ("missed", "skipped") or coalesced:
+            logger.warning(f"⏱️ Job '{run.job_name}' ({outcome}) scheduled for {scheduled_time:%H:%M:%S} started "
+                           f"{lag:.1f} s late" + (f", {coalesced} runs coalesced" if coalesced else ""))
+
+    # Reporting ---------------------------------------------------------------------------------------------------
+
+    def summary(self, limit: int = 10) -> str:
+        """Per job, over the runs in memory: lag, duration and everything that didn't go to plan"""
+        if not self.runs:
+            return "No job runs recorded since the bot started"
+        by_job = {}
+        for run in self.runs:
+            by_job.setdefault(run.job_name, []).append(run)
+
+        lines = [f"⏱️ Job runs since start (last {len(self.runs)})"]
+        for name, runs in sorted(by_job.items(), key=lambda item: item[1][-1].scheduled_time, reverse=True)[:limit]:
+            lags = sorted(run.lag for run in runs if run.outcome in ("ok", "error"))
+            durations = [run.duration for run in runs if run.duration is not None]
+            counts = {outcome: sum(run.outcome == outcome for run in runs) for outcome in ("error", "missed", "skipped")}
+            coalesced = sum(run.coalesced for run in runs)
+            line = f"• {name}: {len(runs)} runs"
+            if lags:
+                line += (f", lag p50 {statistics.median(lags):.2f} s / max {lags[-1]:.2f} s"
+                         f" (last {runs[-1].lag:.2f} s)")
+            if durations:
+                line += f", took avg {statistics.mean(durations):.2f} s / max {max(durations):.2f} s"
+            line += "".join(f", {count} {outcome}" for outcome, count in counts.items() if count)
+            if coalesced:
+                line += f", {coalesced} coalesced"
+            lines.append(line)
+        if self.dropped:
+            lines.append(f"⚠️ {self.dropped} runs not exported while the database was unreachable")
+        return "\n".join(lines)
+
+    # Export ------------------------------------------------------------------------------------------------------
+
+    def start(self):
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._flusher:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            await self.flush()
+
+    async def flush(self) -> int:
+        """Write the recorded runs in one batch. Returns how many were written; on failure they stay buffered."""
+        if not self._buffer or Database._pool is None:
+            return 0
+        records = list(self._buffer)
+        try:
+            async with Database.acquire() as conn:
+                await conn.executemany(INSERT_QUERY, records)
+        except Exception as e:
+            logger.error(f"Couldn't write {len(records)} job run records: {e}")
+            return 0
+        for _ in records:
+            self._buffer.popleft()
+        return len(records)
+
+
+job_metrics = JobMetrics()
@@ -0,0 +1,255 @@
+# utils/job_store.py
+"""
+APScheduler job store that keeps its jobs in the bot's Postgres database, so jobs like goal archivals survive a
+restart.
+
+APScheduler's job store interface is synchronous and is called from inside the event loop, so this store works from
+memory (it is a MemoryJobStore) and persists changes write-behind: every add/update/remove is queued and a background
+task writes the queue in one transaction shortly after. At startup, load() reads all persisted jobs back into memory
+before they're due.
+
+Only the instance that runs the jobs (the leader, see utils/leader.py) loads them. Until then, and again after
+unload(), the store holds nothing in memory and jobs added to it are only written to the table, where the leader picks
+them up within REFRESH_INTERVAL (refresh()).
+
+Jobs are pickled the same way APScheduler's own SQLAlchemyJobStore does it, so their function must be importable by
+reference and their arguments picklable (no bot instances or asyncpg Records: use telegram_helpers.bot_registry and
+dicts).
+"""
+import asyncio
+import logging
+import pickle
+import time
+from collections import OrderedDict
+
+from apscheduler.job import Job
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.util import datetime_to_utc_timestamp
+
+from utils.db import Database
+
+logger = logging.getLogger(__name__)
+
+FLUSH_DELAY = 0.5       # seconds to gather changes into one write
+RETRY_DELAY = 30        # seconds before retrying when the database is unreachable
+REFRESH_INTERVAL = 60   # seconds between checks for jobs that other instances added to the table
+
+
+class PostgresJobStore(MemoryJobStore):
+
+    def __init__(self, table: str = "manon_scheduler_jobs", pickle_protocol: int = pickle.HIGHEST_PROTOCOL):
+        super().__init__()
+        self.table = table
+        self.pickle_protocol = pickle_protocol
+        self._pending = OrderedDict()       # job id -> (next_run_timestamp, job_state) to upsert, or None to delete
+        self._delete_all = False
+        self._wake = asyncio.Event()
+        self._writer = None
+        self._db_lock = asyncio.Lock()      # a flush and a read of the table never interleave
+        self._refreshed_at = time.monotonic()
+        self.loaded = False                 # jobs are held (and run) here; otherwise they're only written to the table
+
+    # Job store interface (synchronous, in memory) ----------------------------------------------------------------
+
+    def _serialize(self, job):
+        return datetime_to_utc_timestamp(job.next_run_time), pickle.dumps(job.__getstate__(), self.pickle_protocol)
+
+    def start(self, scheduler, alias):
+        super().start(scheduler, alias)
+        self.start_writer()
+
+    def add_job(self, job):
+        row = self._serialize(job)      # fail before the job is accepted when it can't be persisted
+        if self.loaded:
+            super().add_job(job)
+        self._queue(job.id, row)
+
+    def update_job(self, job):
+        row = self._serialize(job)
+        if self.loaded:
+            super().update_job(job)
+        self._queue(job.id, row)
+
+    def remove_job(self, job_id):
+        if self.loaded:
+            super().remove_job(job_id)
+        self._queue(job_id, None)
+
+    def remove_all_jobs(self):
+        super().remove_all_jobs()
+        self._pending.clear()
+        self._delete_all = True
+        self._wake.set()
+
+    def shutdown(self):
+        if self._writer:
+            self._writer.cancel()
+        super().shutdown()
+
+    def _queue(self, job_id, row):
+        self._pending[job_id] = row
+        self._pending.move_to_end(job_id)
+        self._wake.set()
+
+    # Persistence (async) -----------------------------------------------------------------------------------------
+
+    def _reconstitute(self, job_state):
+        state = pickle.loads(job_state)
+        state["jobstore"] = self
+        job = Job.__new__(Job)
+        job.__setstate__(state)
+        job._scheduler = self._scheduler
+        job._jobstore_alias = self._alias
+        return job
+
+    async def fetch_job(self, job_id):
+        """
+        The job as it is or will be persisted, also while not loaded (then it's read from the table), or None. For
+        read-modify-write of a job on any instance: add it back before awaiting anything else.
+        """
+        job_state = None
+        if not self.loaded and job_id not in self._pending:
+            async with Database.acquire() as conn:
+                job_state = await conn.fetchval(f"SELECT job_state FROM {self.table} WHERE id = $1", job_id)
+        if job_id in self._pending:         # queued meanwhile, or before: newer than the table
+            row = self._pending[job_id]
+            return None if row is None else self._reconstitute(row[1])
+        if self.loaded:
+            return self.lookup_job(job_id)
+        return None if job_state is None else self._reconstitute(job_state)
+
+    async def load(self) -> int:
+        """
+        Read the persisted jobs into memory, from now on this instance runs them. Call once the scheduler has started
+        and the database is set up. Returns the number of jobs restored.
+        """
+        started = time.perf_counter()
+        async with self._db_lock:
+            await self._flush()         # what was only written so far is part of what's read back
+            async with Database.acquire() as conn:
+                rows = await conn.fetch(f"SELECT id, job_state FROM {self.table} ORDER BY next_run_time NULLS LAST")
+            restored = await self._restore(rows)
+            self.loaded = True
+            self._refreshed_at = time.monotonic()
+
+        self.start_writer()
+        logger.info(f"⏱️ Restored {restored} scheduled jobs from {self.table} in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return restored
+
+    async def refresh(self) -> int:
+        """Pick up jobs that other instances added to the table (see the module docstring). Returns how many."""
+        self._refreshed_at = time.monotonic()
+        async with self._db_lock:
+            if not self.loaded:
+                return 0
+            try:
+                async with Database.acquire() as conn:
+                    rows = await conn.fetch(f"""
+                        SELECT id, job_state FROM {self.table}
+                        WHERE NOT (id = ANY($1::text[]))
+                        ORDER BY next_run_time NULLS LAST
+                    """, list(self._jobs_index))
+                restored = await self._restore(rows)
+            except Exception as e:
+                logger.error(f"Couldn't check {self.table} for new jobs: {e}")
+                return 0
+        if restored:
+            logger.info(f"⏱️ Picked up {restored} scheduled jobs added by another instance")
+        return restored
+
+    async def _restore(self, rows) -> int:
+        """Add the persisted `rows` to memory, except jobs it already has or that have changes queued"""
+        restored, broken = 0, []
+        for row in rows:
+            if row["id"] in self._jobs_index or row["id"] in self._pending:
+                continue    # already here, or changed again and not written yet: the newer version wins
+            try:
+                job = self._reconstitute(row["job_state"])
+            except Exception as e:
+                logger.error(f"Couldn't restore scheduled job '{row['id']}', dropping it: {e}")
+                broken.append(row["id"])
+                continue
+            MemoryJobStore.add_job(self, job)
+            restored += 1
+        if broken:
+            async with Database.acquire() as conn:
+                await conn.execute(f"DELETE FROM {self.table} WHERE id = ANY($1::text[])", broken)
+        if restored and self._scheduler is not None and self._scheduler.running:
+            self._scheduler.wakeup()    # some of them may be due (or missed while the bot was down)
+        return restored
+
+    def start_writer(self):
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_loop())
+
+    async def _write_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=REFRESH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            if self._wake.is_set():
+                await asyncio.sleep(FLUSH_DELAY)
+                self._wake.clear()
+                if not await self.flush() and (self._pending or self._delete_all):
+                    await asyncio.sleep(RETRY_DELAY)
+                    self._wake.set()
+            if self.loaded and time.monotonic() - self._refreshed_at >= REFRESH_INTERVAL:
+                await self.refresh()
+
+    async def flush(self) -> int:
+        """Write the queued changes in one transaction. Returns how many; on failure they stay queued."""
+        async with self._db_lock:
+            return await self._flush()
+
+    async def _flush(self) -> int:
+        if not (self._pending or self._delete_all) or Database._pool is None:
+            return 0
+        delete_all = self._delete_all
+        pending = list(self._pending.items())
+        upserts = [(job_id, row[0], row[1]) for job_id, row in pending if row is not None]
+        deletes = [job_id for job_id, row in pending if row is None]
+        try:
+            async with Database.acquire() as conn:
+                async with conn.transaction():
+                    if delete_all:
+                        await conn.execute(f"DELETE FROM {self.table}")
+                    if deletes:
+                        await conn.execute(f"DELETE FROM {self.table} WHERE id = ANY($1::text[])", deletes)
+                    if upserts:
+                        await conn.executemany(f"""
+                            INSERT INTO {self.table} (id, next_run_time, job_state) VALUES ($1, $2, $3)
+                            ON CONFLICT (id) DO UPDATE SET next_run_time = EXCLUDED.next_run_time, job_state = EXCLUDED.job_state
+                        """, upserts)
+        except Exception as e:
+            logger.error(f"Couldn't persist {len(pending)} scheduled job changes: {e}")
+            return 0
+
+        self._delete_all = self._delete_all and not delete_all
+        for job_id, row in pending:
+            if self._pending.get(job_id, ...) is row:      # not changed again while writing
+                del self._pending[job_id]
+        return len(pending) + delete_all
+
+    async def close(self):
+        """Stop the writer after a last flush (on shutdown)."""
+        if self._writer:
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+            self._writer = None
+        await self.flush()
+
+    async def unload(self):
+        """
+        Write what's queued and forget the jobs in memory, when this instance stops running them (no longer the leader,
+        see utils/leader.py). Jobs added after this are only written to the table, and the next load() reads them back
+        as the current leader left them.
+        """
+        async with self._db_lock:
+            self.loaded = False
+            self._jobs.clear()
+            self._jobs_index.clear()
+            await self._flush()
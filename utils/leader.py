@@ -0,0 +1,142 @@
+# utils/leader.py
+"""
+Leader election between bot instances that share a database, so that only one of them runs the scheduled jobs, the
+reminder dispatcher and the monitors (two of them would send every morning message and archival penalty twice). This
+happens when a deploy starts the new container before the old one has exited, or when dev runs against the prod
+database.
+
+The leader is whoever holds a session-level Postgres advisory lock. It's held on a dedicated connection rather than
+one from the pool, since pooled connections are reset (pg_advisory_unlock_all) when they're released. The lock goes
+away with that session, so:
+- when the leader exits or crashes, its session closes and a follower takes over on its next attempt, within
+  RETRY_INTERVAL;
+- when the leader's host or network goes away, the server notices through TCP keepalives (KEEPALIVE_SETTINGS, about
+  25 s) and then a follower takes over, within RETRY_INTERVAL after that;
+- a leader checks its connection every HEARTBEAT_INTERVAL and steps down when it's lost, which is before the server
+  gives the lock to someone else (HEARTBEAT_INTERVAL + HEARTBEAT_TIMEOUT is less than the keepalive timeout).
+"""
+import asyncio
+import logging
+import time
+
+import asyncpg
+
+from utils.db import is_running_on_heroku
+from utils.environment_vars import ENV_VARS
+
+logger = logging.getLogger(__name__)
+
+LEADER_LOCK_ID = 8146202            # pg_try_advisory_lock key, arbitrary but fixed (next to MIGRATION_LOCK_ID)
+RETRY_INTERVAL = 10                 # seconds between a follower's attempts to take the lock
+HEARTBEAT_INTERVAL = 10             # seconds between the leader's checks that its session (and lock) is still there
+HEARTBEAT_TIMEOUT = 5
+# Server side: drop the session of a client that stopped answering after 10 + 3 * 5 s, releasing its lock
+KEEPALIVE_SETTINGS = {"tcp_keepalives_idle": "10", "tcp_keepalives_interval": "5", "tcp_keepalives_count": "3"}
+
+
+class LeaderElection:
+
+    def __init__(self, lock_id: int = LEADER_LOCK_ID, retry_interval: float = RETRY_INTERVAL,
+                 heartbeat_interval: float = HEARTBEAT_INTERVAL, dsn: str = None):
+        self.lock_id = lock_id
+        self.retry_interval = retry_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.dsn = dsn
+        self.is_leader = False
+        self.elected_at = None      # time.monotonic() of the current term
+        self.terms = 0              # how often this instance was elected since it started
+        self._conn = None
+        self._task = None
+        self._on_elected = None
+        self._on_demoted = None
+
+    def start(self, on_elected, on_demoted=None):
+        """
+        Campaign in the background. `on_elected` (async) starts the leader's work when this instance gets the lock and
+        `on_demoted` (async) stops it again when the lock is lost or released. If on_elected raises, the instance steps
+        down and tries again later.
+        """
+        self._on_elected, self._on_demoted = on_elected, on_demoted
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the leader's work and release the lock (on shutdown), so a follower can take over right away"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.is_leader:
+            await self._step_down()
+        await self._disconnect()
+
+    def status(self) -> str:
+        if self.is_leader:
+            return f"👑 Leader for {(time.monotonic() - self.elected_at) / 60:.0f} min (term {self.terms}), runs the scheduled jobs"
+        return "🪑 Follower: another instance runs the scheduled jobs"
+
+    # Campaign ----------------------------------------------------------------------------------------------------
+
+    async def _run(self):
+        while True:
+            try:
+                if not self.is_leader:
+                    if await self._try_lock():
+                        await self._become_leader()
+                        continue
+                    await asyncio.sleep(self.retry_interval)
+                else:
+                    await asyncio.sleep(self.heartbeat_interval)
+                    await self._conn.fetchval("SELECT 1", timeout=HEARTBEAT_TIMEOUT)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"👑 Leader election: {type(e).__name__}: {e}" + (", stepping down" if self.is_leader else ""))
+                if self.is_leader:
+                    await self._step_down()
+                await self._disconnect()        # the lock goes with the session, if the server still has it
+                await asyncio.sleep(self.retry_interval)
+
+    async def _connect(self):
+        return await asyncpg.connect(
+            self.dsn or ENV_VARS.DATABASE_URL,
+            ssl='require' if is_running_on_heroku else None,
+            server_settings=KEEPALIVE_SETTINGS,
+        )
+
+    async def _try_lock(self) -> bool:
+        if self._conn is None or self._conn.is_closed():
+            self._conn = await self._connect()
+        return await self._conn.fetchval("SELECT pg_try_advisory_lock($1)", self.lock_id)
+
+    async def _become_leader(self):
+        self.is_leader = True
+        self.elected_at = time.monotonic()
+        self.terms += 1
+        logger.info(f"👑 Elected leader (term {self.terms}): starting the scheduled jobs and monitors")
+        if self._on_elected:
+            await self._on_elected()
+
+    async def _step_down(self):
+        self.is_leader = False
+        logger.warning("👑 No longer the leader: stopping the scheduled jobs and monitors")
+        if self._on_demoted:
+            try:
+                await self._on_demoted()
+            except Exception as e:
+                logger.error(f"Error while stepping down as leader: {e}")
+
+    async def _disconnect(self):
+        conn, self._conn = self._conn, None
+        if conn is None or conn.is_closed():
+            return
+        try:
+            await conn.close(timeout=HEARTBEAT_TIMEOUT)
+        except Exception:
+            conn.terminate()
+
+
+leader_election = LeaderElection()
@@ -0,0 +1,380 @@
+# utils/migrations.py
+"""
+Numbered, forward-only schema migrations.
+
+The applied versions are recorded in `schema_version`. On boot, run_migrations() reads the current version and,
+when the database is up to date, returns without running any DDL. Pending migrations are applied in order, each in
+its own transaction, while holding an advisory lock (so two instances booting at once don't race each other).
+
+To change the schema: append a migration with the next version number. Never edit or renumber one that has shipped.
+"""
+import logging
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_LOCK_ID = 8146201      # pg_advisory_lock key, arbitrary but fixed
+
+
+# Indexes of the bot's hot queries. Keep the predicates of the partial indexes in sync with the queries they serve:
+# a partial index is only used when the query repeats its WHERE clause literally (e.g. status = 'pending').
+# Adding (or changing) an index here also needs a new migration that (drops and) calls ensure_indexes().
+MANAGED_INDEXES = {
+    # Overviews (/today, /overdue, /upcoming, morning/evening messages, agent tools): pending goals of one user, by deadline
+    "idx_manon_goals_pending_user_deadline": """
+        ON manon_goals (user_id, chat_id, deadline) WHERE status = 'pending'
+    """,
+    # Other per-user status lookups (active goals, /wassup's prepared goals, goals due today)
+    "idx_manon_goals_user_status_deadline": """
+        ON manon_goals (user_id, chat_id, status, deadline)
+    """,
+    # Reminder dispatcher: unsent scheduled reminders of pending goals due in its look-ahead window
+    "idx_manon_goals_pending_reminder_time": """
+        ON manon_goals (reminder_time)
+        WHERE reminder_scheduled = TRUE AND status = 'pending' AND reminder_sent_for IS DISTINCT FROM reminder_time
+    """,
+    # Recurring goal instances share the mother goal's group_id
+    "idx_manon_goals_group_id": """
+        ON manon_goals (group_id) WHERE group_id IS NOT NULL
+    """,
+    # Daily stats: goals set / completed within a date window
+    "idx_manon_goals_set_time": """
+        ON manon_goals (set_time)
+    """,
+    "idx_manon_goals_completion_time": """
+        ON manon_goals (completion_time) WHERE completion_time IS NOT NULL
+    """,
+    # Reminder dispatcher: unsent standalone reminders due in its look-ahead window
+    "idx_manon_reminders_time": """
+        ON manon_reminders (time) WHERE sent_for IS DISTINCT FROM time
+    """,
+    "idx_manon_stats_snapshots_user_date": """
+        ON manon_stats_snapshots (user_id, chat_id, date)
+    """,
+}
+
+
+async def ensure_indexes(conn):
+    """
+    Create any index from MANAGED_INDEXES that doesn't exist yet. One on a column that a later migration adds is left
+    to that migration (on a new database, the earlier ones run with today's MANAGED_INDEXES).
+    """
+    existing = {row["indexname"] for row in await conn.fetch(
+        "SELECT indexname FROM pg_indexes WHERE schemaname = current_schema()"
+    )}
+    for index_name, definition in MANAGED_INDEXES.items():
+        if index_name not in existing:
+            try:
+                async with conn.transaction():      # a savepoint, so the migration's transaction survives a skip
+                    await conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} {definition}")
+            except asyncpg.UndefinedColumnError:
+                logger.info(f"Index {index_name} is created by a later migration")
+                continue
+            logger.warning(f"Created index {index_name}")
+
+
+async def _001_baseline_tables(conn):
+    """The tables as setup_database() used to create them, plus the columns it used to add to older databases."""
+    #1 manon_users table
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS manon_users (
+            user_id BIGINT,
+            chat_id BIGINT,
+            first_name TEXT DEFAULT 'Josefientje',
+            pending_goals INT DEFAULT 0,
+            finished_goals INT DEFAULT 0,
+            failed_goals INT DEFAULT 0,
+            score FLOAT DEFAULT 0,
+            penalties_accrued FLOAT DEFAULT 0,
+            inventory JSONB DEFAULT '{"boosts": 1, "challenges": 1, "links": 1}',
+            any_reminder_scheduled BOOLEAN DEFAULT False,
+            long_term_goals TEXT DEFAULT NULL,
+            PRIMARY KEY (user_id, chat_id)
+        )
+    ''')
+
+    #2 manon_goals table
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS manon_goals (
+            goal_id SERIAL PRIMARY KEY,
+            group_id BIGINT DEFAULT NULL,           -- Group ID for recurring goals
+            user_id BIGINT NOT NULL,                -- Foreign key to identify the user
+            chat_id BIGINT NOT NULL,                -- Foreign key to identify the chat
+            status TEXT DEFAULT 'limbo' CHECK (status IN (
+                'limbo', 'prepared', 'pending', 'paused', 'archived_done', 'archived_failed', 'archived_canceled'
+            )),
+            recurrence_type TEXT DEFAULT NULL,
+            timeframe TEXT DEFAULT NULL,
+            goal_value FLOAT DEFAULT NULL,
+            total_goal_value FLOAT DEFAULT NULL,
+            goal_description TEXT DEFAULT NULL,
+            set_time TIMESTAMPTZ DEFAULT NOW(),       -- Time when the (limbo first, then other status again) goal was set
+            deadline TIMESTAMPTZ,
+            deadlines TEXT[] DEFAULT NULL,              -- To use for the goal_proposal template, storing future and past deadlines of the entire group_id as well
+            interval TEXT DEFAULT NULL,
+            reminder_time TIMESTAMPTZ DEFAULT NULL,
+            reminders_times TEXT[] DEFAULT NULL,       -- To use for the goal_proposal template, storing future and past reminders of the entire group_id as well
+            reminder_scheduled BOOLEAN DEFAULT False,
+            time_investment_value FLOAT DEFAULT NULL,
+            difficulty_multiplier FLOAT DEFAULT NULL,
+            impact_multiplier FLOAT DEFAULT NULL,
+            penalty FLOAT DEFAULT NULL,
+            total_penalty FLOAT DEFAULT NULL,
+            attempt INTEGER DEFAULT 1,                      -- N+1, for tracking attempts (retries)
+            iteration INTEGER DEFAULT NULL,                 -- N+1 iteration of instances of individual (sub)goals that belong to the same group of one recurring goal
+            final_iteration TEXT DEFAULT 'not applicable',  -- The last in the series of this group_id: final iteration of this recurring goal. Can be used to prompt evaluation of extension ('not applicable', 'yes', 'not yet')
+            goal_category TEXT[] DEFAULT NULL,            -- eg work, productivity, chores, relationships, hobbies, self-development, money, impact, health, fun, other
+            completion_time TIMESTAMPTZ DEFAULT NULL,                           -- Time when the goal was completed
+            FOREIGN KEY (user_id, chat_id) REFERENCES manon_users (user_id, chat_id)
+        )
+    ''')
+
+    #3 manon_reminders table
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS manon_reminders (
+            reminder_id SERIAL PRIMARY KEY,
+            user_id BIGINT NOT NULL,                -- Foreign key to identify the user
+            chat_id BIGINT NOT NULL,                -- Foreign key to identify the chat
+            reminder_text TEXT DEFAULT NULL,
+            reminder_category TEXT[] DEFAULT NULL,
+            set_time TIMESTAMPTZ DEFAULT NOW(),       -- Time when the reminder was set/requested
+            time TIMESTAMPTZ DEFAULT NULL,
+            FOREIGN KEY (user_id, chat_id) REFERENCES manon_users (user_id, chat_id)
+        )
+    ''')
+
+    #  day_snapshots table (legacy, superseded by manon_stats_snapshots)
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS day_snapshots (
+            snapshot_id SERIAL PRIMARY KEY,
+            user_id BIGINT NOT NULL,
+            chat_id BIGINT NOT NULL,
+            snapshot_date DATE NOT NULL,
+            score FLOAT DEFAULT 0,
+            pending_goals INT DEFAULT 0,
+            finished_goals INT DEFAULT 0,
+            failed_goals INT DEFAULT 0,
+            goals_set INT DEFAULT 0,
+            goals_finished INT DEFAULT 0,
+            goals_failed INT DEFAULT 0,
+            score_gained FLOAT DEFAULT 0,
+            penalties_incurred FLOAT DEFAULT 0,
+            completion_rate FLOAT DEFAULT NULL,
+            UNIQUE (user_id, chat_id, snapshot_date)
+        )
+    ''')
+
+    #4 manon_stats_snapshots table
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS manon_stats_snapshots (
+            snapshot_id SERIAL PRIMARY KEY,
+            user_id BIGINT NOT NULL,                -- Foreign key to identify the user
+            chat_id BIGINT NOT NULL,                -- Foreign key to identify the chat
+            date DATE NOT NULL,                     -- Date of the snapshot (without time)
+
+            -- Totals snapshot
+            score FLOAT DEFAULT NULL,                  -- Snapshot of the user's score
+            pending_goals INT DEFAULT NULL,            -- Snapshot of pending goals
+            finished_goals INT DEFAULT NULL,           -- Snapshot of finished goals
+            failed_goals INT DEFAULT NULL,             -- Snapshot of failed goals
+
+            -- Daily counts
+            goals_set INTEGER DEFAULT 0,            -- Number of goals set on this date
+            goals_finished INTEGER DEFAULT 0,       -- Number of goals completed on this date
+            goals_failed INTEGER DEFAULT 0,         -- Number of goals failed on this date
+            goals_pending INTEGER DEFAULT 0,        -- Number of goals still pending at snapshot time
+
+            -- Value metrics
+            score_gained FLOAT DEFAULT 0,           -- Score earned on this date
+            penalties_incurred FLOAT DEFAULT 0,     -- Penalties accrued on this date
+            completion_rate FLOAT DEFAULT NULL,     -- Daily completion rate (percentage)
+
+            -- Time-based metrics
+            avg_completion_time INTERVAL DEFAULT NULL,  -- Average time to complete goals on this date
+            total_time_invested INTERVAL DEFAULT NULL,  -- Total time invested in goals on this date
+
+            -- Categories snapshot (optional, for future use)
+            category_distribution JSONB DEFAULT NULL,   -- Distribution of goals across categories
+
+            -- Metadata
+            snapshot_time TIMESTAMPTZ DEFAULT NOW(),   -- Exact time when snapshot was taken
+
+            FOREIGN KEY (user_id, chat_id) REFERENCES manon_users (user_id, chat_id),
+            UNIQUE (user_id, chat_id, date)           -- Ensure one snapshot per user per day
+        )
+    ''')
+
+    # Columns that add_missing_columns() used to bolt onto databases created before they existed
+    await conn.execute('''
+        ALTER TABLE manon_goals
+            ADD COLUMN IF NOT EXISTS attempt INTEGER DEFAULT 1,
+            ADD COLUMN IF NOT EXISTS iteration INTEGER DEFAULT NULL,
+            ADD COLUMN IF NOT EXISTS final_iteration TEXT DEFAULT 'not applicable'
+    ''')
+    await conn.execute('''
+        ALTER TABLE manon_stats_snapshots
+            ADD COLUMN IF NOT EXISTS score FLOAT DEFAULT NULL,
+            ADD COLUMN IF NOT EXISTS pending_goals INT DEFAULT NULL,
+            ADD COLUMN IF NOT EXISTS finished_goals INT DEFAULT NULL,
+            ADD COLUMN IF NOT EXISTS failed_goals INT DEFAULT NULL
+    ''')
+
+
+async def _002_managed_indexes(conn):
+    await ensure_indexes(conn)
+
+
+async def _003_final_iteration_default(conn):
+    # The old add_missing_columns() entry had an invalid default ("not applicable" is an identifier, not a string)
+    await conn.execute("ALTER TABLE manon_goals ALTER COLUMN final_iteration SET DEFAULT 'not applicable'")
+
+
+async def _004_llm_response_cache(conn):
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS manon_llm_cache (
+            cache_key TEXT PRIMARY KEY,             -- sha256 of chain, model, formatted messages and schema
+            chain_name TEXT NOT NULL,
+            response JSONB NOT NULL,                -- the structured output, as model_dump()
+            created_at TIMESTAMPTZ DEFAULT NOW(),
+            expires_at TIMESTAMPTZ NOT NULL
+        )
+    ''')
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_manon_llm_cache_expires_at ON manon_llm_cache (expires_at)")
+
+
+async def _005_llm_call_telemetry(conn):
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS manon_llm_calls (
+            id BIGSERIAL PRIMARY KEY,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            chain_name TEXT NOT NULL,               -- chain_configs key, or "agent" for agent loop turns
+            model TEXT,
+            base_url TEXT,
+            prompt_tokens INTEGER,
+            completion_tokens INTEGER,
+            latency_ms REAL,
+            retries INTEGER DEFAULT 0,
+            cache_hit BOOLEAN DEFAULT FALSE,
+            error TEXT
+        )
+    ''')
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_manon_llm_calls_created_at ON manon_llm_calls (created_at)")
+
+
+async def _006_scheduler_jobs(conn):
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS manon_scheduler_jobs (
+            id TEXT PRIMARY KEY,                    -- APScheduler job id
+            next_run_time DOUBLE PRECISION,         -- UTC timestamp, NULL when paused
+            job_state BYTEA NOT NULL                -- pickled Job.__getstate__(), as in APScheduler's SQLAlchemyJobStore
+        )
+    ''')
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_manon_scheduler_jobs_next_run_time ON manon_scheduler_jobs (next_run_time)")
+
+
+async def _007_reminder_dispatch(conn):
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS manon_reminder_dispatch (
+            id INTEGER PRIMARY KEY CHECK (id = 1),  -- single row
+            dispatched_until TIMESTAMPTZ NOT NULL   -- every reminder due up to here has been sent
+        )
+    ''')
+    # Reminders are sent by the dispatcher now instead of one scheduler job each (and the daily sweep that added them)
+    await conn.execute(r"""
+        DELETE FROM manon_scheduler_jobs
+        WHERE id LIKE 'goalreminder\_%' OR id LIKE 'regularreminder\_%' OR id = 'reminder_sweep'
+    """)
+
+
+async def _008_job_runs(conn):
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS manon_job_runs (
+            id BIGSERIAL PRIMARY KEY,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),     -- when the run finished (or was given up)
+            job_id TEXT NOT NULL,
+            job_name TEXT,
+            scheduled_time TIMESTAMPTZ NOT NULL,
+            start_lag_ms REAL,                      -- started (or given up) this long after scheduled_time
+            duration_ms REAL,                       -- NULL for runs that didn't happen
+            outcome TEXT NOT NULL,                  -- ok, error, missed (misfire grace time passed) or skipped (still running)
+            coalesced INTEGER DEFAULT 0,            -- earlier fire times folded into this run
+            error TEXT
+        )
+    ''')
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_manon_job_runs_created_at ON manon_job_runs (created_at)")
+
+
+async def _009_reminder_sent_marks(conn):
+    # The reminder dispatcher marks what it sent instead of keeping a watermark, which skipped reminders that were
+    # added for a time it had already passed
+    await conn.execute("ALTER TABLE manon_goals ADD COLUMN IF NOT EXISTS reminder_sent_for TIMESTAMPTZ DEFAULT NULL")
+    await conn.execute("ALTER TABLE manon_reminders ADD COLUMN IF NOT EXISTS sent_for TIMESTAMPTZ DEFAULT NULL")
+    sent_until = "COALESCE((SELECT dispatched_until FROM manon_reminder_dispatch WHERE id = 1), NOW())"
+    await conn.execute(f"""
+        UPDATE manon_goals SET reminder_sent_for = reminder_time
+        WHERE reminder_scheduled = TRUE AND reminder_time <= {sent_until}
+    """)
+    await conn.execute(f"UPDATE manon_reminders SET sent_for = time WHERE time <= {sent_until}")
+    await conn.execute("DROP TABLE manon_reminder_dispatch")
+    # The dispatcher's indexes only hold unsent reminders now
+    await conn.execute("DROP INDEX IF EXISTS idx_manon_goals_pending_reminder_time")
+    await conn.execute("DROP INDEX IF EXISTS idx_manon_reminders_time")
+    await ensure_indexes(conn)
+
+
+MIGRATIONS = [
+    (1, "baseline tables", _001_baseline_tables),
+    (2, "indexes for pending-goal and reminder queries", _002_managed_indexes),
+    (3, "valid default for manon_goals.final_iteration", _003_final_iteration_default),
+    (4, "LLM response cache", _004_llm_response_cache),
+    (5, "LLM call telemetry", _005_llm_call_telemetry),
+    (6, "durable scheduler jobs", _006_scheduler_jobs),
+    (7, "reminder dispatch progress", _007_reminder_dispatch),
+    (8, "scheduler job run metrics", _008_job_runs),
+    (9, "reminders marked as sent", _009_reminder_sent_marks),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+async def get_schema_version(conn) -> int:
+    """Highest applied migration, 0 for a database that has never been migrated."""
+    if await conn.fetchval("SELECT to_regclass('schema_version')") is None:
+        return 0
+    return await conn.fetchval("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+
+
+async def run_migrations(conn) -> list:
+    """
+    Apply all pending migrations.
+
+    Returns:
+        list: The versions that were applied by this call (empty when the schema was already current).
+    """
+    if await get_schema_version(conn) >= LATEST_VERSION:
+        return []
+
+    await conn.execute("SELECT pg_advisory_lock($1)", MIGRATION_LOCK_ID)
+    try:
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TIMESTAMPTZ DEFAULT NOW()
+            )
+        ''')
+        current = await get_schema_version(conn)     # another instance may have migrated while we waited for the lock
+        applied = []
+        for version, description, migrate in MIGRATIONS:
+            if version <= current:
+                continue
+            async with conn.transaction():
+                await migrate(conn)
+                await conn.execute(
+                    "INSERT INTO schema_version (version, description) VALUES ($1, $2)", version, description
+                )
+            logger.warning(f"Applied migration {version:03d}: {description}")
+            applied.append(version)
+        return applied
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_ID)
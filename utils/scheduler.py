@@ -1,5 +1,6 @@
 ﻿# utils/scheduler.py
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.jobstores.memory import MemoryJobStore
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.date import DateTrigger
 
@@ -7,13 +8,22 @@ from utils.helpers import BERLIN_TZ
 from utils.session_avatar import PA
 from datetime import datetime, timedelta
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
-from features.goals.goals import handle_goal_failure
-from utils.db import Database, fetch_goal_data, get_first_name, fetch_upcoming_goals
+from features.goals.goals import archived_goal_text
+from utils.db import Database, fail_pending_goals, get_first_name, fetch_upcoming_goals
+from utils.job_store import PostgresJobStore
+from utils.job_metrics import job_metrics
+from utils.leader import leader_election
+from telegram_helpers.bot_registry import get_bot
 import asyncio, random, logging
 
 logger = logging.getLogger(__name__)
 
-scheduler = AsyncIOScheduler(timezone=BERLIN_TZ)
+# Jobs that are re-created at every boot (morning/evening messages, daily sweeps) live in memory. One-off jobs for
+# specific goals go to the durable store (jobstore=DURABLE_JOBSTORE) so they survive restarts.
+DURABLE_JOBSTORE = "durable"
+durable_jobstore = PostgresJobStore()
+scheduler = AsyncIOScheduler(timezone=BERLIN_TZ, jobstores={"default": MemoryJobStore(), DURABLE_JOBSTORE: durable_jobstore})
+job_metrics.attach(scheduler)   # lag, duration and misfires of every job run (Jobs trigger, manon_job_runs)
 
 
 async def send_goals_today(update, context, chat_id, user_id, timeframe):
@@ -60,6 +70,69 @@ async def send_goals_today(update, context, chat_id, user_id, timeframe):
 
 
 
+def format_overdue_goal(row, now):
+    """One pending goal as a message with buttons for reporting progress: {"goal_id", "text", "buttons", ...}"""
+    logger.info(f"Goal ID {row['goal_id']}: deadline = {row['deadline']}")
+    today = datetime.now().date()
+    yesterday = (datetime.now() - timedelta(days=1)).date()
+    goal_id = row ["goal_id"]
+    description = row["goal_description"] or "No description found... 👻"
+    deadline_dt = row["deadline"]
+    logging.critical(f"😴 Deadline for goal_id {goal_id}: {deadline_dt}, tzinfo: {deadline_dt.tzinfo}")
+
+    deadline_date = deadline_dt.date()
+    postpone_to_day = "mañana"
+    # Determine if the goal should be postponed to today or tomorrow
+    if deadline_dt.date() < now.date():
+        # Overdue from a previous day
+        if deadline_dt.time() < now.time():
+            # Deadline earlier in the day than the current time 
+            postpone_to_day = "tomorrow"
+        else:
+            # Deadline later in the day
+            postpone_to_day = "today"
+    elif deadline_dt.date() == now.date():
+        # Due today: always only give the option to postpone to tomorrow (cause if you wanna still do it today because deadline is in the future, then you can just report Done and don't need to postpone)
+        postpone_to_day = "tomorrow"
+
+
+    # Format the deadline
+    if deadline_date == today:
+        deadline = f"{deadline_dt.strftime('%H:%M')} today"
+    elif deadline_date == yesterday:
+        deadline = f"{deadline_dt.strftime('%H:%M')} yesterday"
+    else:
+        deadline = f"{deadline_dt.strftime('%a, %d %B')}"
+
+    goal_value = f"{row['goal_value']:.1f}" if row["goal_value"] is not None else "N/A"
+    penalty = float(f"{row['penalty']:.1f}") if row["penalty"] is not None else 0  # Use 0.0 as a default
+    reminder = "⏰" if row["reminder_scheduled"] else ""
+    final_iteration = " (❗Last in series❗)" if row["final_iteration"] == "yes" else ""
+
+    # Message text for the goal
+    pending_goal_text = (
+        f"*{description}* {final_iteration}\n"
+        f"📅 Deadline: {deadline} {reminder}\n"
+        f"⚡ {goal_value} | 🌚 {penalty}\n"
+        f"#{goal_id}"
+    )
+
+    cost_to_postpone = round(penalty * 0.65, 1)
+    
+    # Inline keyboard buttons for each goal
+    buttons = InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton("✅ Done", callback_data=f"finished_{goal_id}"),
+            InlineKeyboardButton("❌ Failed", callback_data=f"failed_{goal_id}")
+        ],
+        [
+            InlineKeyboardButton(f"⏭️ {postpone_to_day.capitalize()}..! (-{cost_to_postpone})", callback_data=f"postpone_{goal_id}_{postpone_to_day}")
+        ]
+    ])
+    logger.info(f"adding overdue goal:\n{pending_goal_text}")
+    return {"goal_id": goal_id, "text": pending_goal_text, "buttons": buttons, "goal_value": goal_value, "penalty": penalty}
+
+
 async def fetch_overdue_goals(chat_id, user_id, timeframe="today"):
     """
     1. fetches (overdue) pending goals over the given timeframe
@@ -86,7 +159,7 @@ async def fetch_overdue_goals(chat_id, user_id, timeframe="today"):
             # Dynamic time condition logic
             if timeframe == "today":            # all pending goals today (4AM this morning - 4AM later tonight) > for the final evening message
                 time_condition = """
-                AND deadline AT TIME ZONE 'Europe/London' >= DATE_TRUNC('day', NOW()) + INTERVAL '4 hours'
+                AND deadline >= DATE_TRUNC('day', NOW()) + INTERVAL '4 hours'
                 AND deadline <= DATE_TRUNC('day', NOW()) + INTERVAL '28 hours'
                 """
             elif timeframe == "overdue":        # all pending goals with deadlines in the past > for /overdue
@@ -137,75 +210,16 @@ async def fetch_overdue_goals(chat_id, user_id, timeframe="today"):
         pending_goals = []
         total_goal_value = 0
         total_penalty = 0 
-        today = datetime.now().date()
-        yesterday = (datetime.now() - timedelta(days=1)).date()
         goals_count = 0
         now = datetime.now(tz=BERLIN_TZ)
 
         logger.info(f"Using timeframe '{timeframe}' for user_id {user_id} in chat {chat_id}: Fetched {len(rows)} rows")
         for row in rows:
-            logger.info(f"Goal ID {row['goal_id']}: deadline = {row['deadline']}")
             goals_count += 1
-            goal_id = row ["goal_id"]
-            description = row["goal_description"] or "No description found... 👻"
-            deadline_dt = row["deadline"]
-            logging.critical(f"😴 Deadline for goal_id {goal_id}: {deadline_dt}, tzinfo: {deadline_dt.tzinfo}")
-
-            deadline_date = deadline_dt.date()
-            postpone_to_day = "mañana"
-            # Determine if the goal should be postponed to today or tomorrow
-            if deadline_dt.date() < now.date():
-                # Overdue from a previous day
-                if deadline_dt.time() < now.time():
-                    # Deadline earlier in the day than the current time 
-                    postpone_to_day = "tomorrow"
-                else:
-                    # Deadline later in the day
-                    postpone_to_day = "today"
-            elif deadline_dt.date() == now.date():
-                # Due today: always only give the option to postpone to tomorrow (cause if you wanna still do it today because deadline is in the future, then you can just report Done and don't need to postpone)
-                postpone_to_day = "tomorrow"
-
-
-            # Format the deadline
-            if deadline_date == today:
-                deadline = f"{deadline_dt.strftime('%H:%M')} today"
-            elif deadline_date == yesterday:
-                deadline = f"{deadline_dt.strftime('%H:%M')} yesterday"
-            else:
-                deadline = f"{deadline_dt.strftime('%a, %d %B')}"
-
-            goal_value = f"{row['goal_value']:.1f}" if row["goal_value"] is not None else "N/A"
-            penalty = float(f"{row['penalty']:.1f}") if row["penalty"] is not None else 0  # Use 0.0 as a default
-            reminder = "⏰" if row["reminder_scheduled"] else ""
-            final_iteration = " (❗Last in series❗)" if row["final_iteration"] == "yes" else ""
-            
-            total_goal_value += float(goal_value)
-            total_penalty += float(penalty) 
-
-            # Message text for the goal
-            pending_goal_text = (
-                f"*{description}* {final_iteration}\n"
-                f"📅 Deadline: {deadline} {reminder}\n"
-                f"⚡ {goal_value} | 🌚 {penalty}\n"
-                f"#{goal_id}"
-            )
-
-            cost_to_postpone = round(penalty * 0.65, 1)
-            
-            # Inline keyboard buttons for each goal
-            buttons = InlineKeyboardMarkup([
-                [
-                    InlineKeyboardButton("✅ Done", callback_data=f"finished_{goal_id}"),
-                    InlineKeyboardButton("❌ Failed", callback_data=f"failed_{goal_id}")
-                ],
-                [
-                    InlineKeyboardButton(f"⏭️ {postpone_to_day.capitalize()}..! (-{cost_to_postpone})", callback_data=f"postpone_{goal_id}_{postpone_to_day}")
-                ]
-            ])
-            # Append each goal as a dictionary with text and buttons
-            pending_goals.append({"text": pending_goal_text, "buttons": buttons})
-            logger.info(f"adding overdue goal:\n{pending_goal_text}")
+            goal = format_overdue_goal(row, now)
+            total_goal_value += float(goal["goal_value"])
+            total_penalty += float(goal["penalty"]) 
+            pending_goals.append(goal)
 
         return pending_goals, round(total_goal_value, 1), round(total_penalty, 1), goals_count
     except Exception as e:
@@ -213,16 +227,55 @@ async def fetch_overdue_goals(chat_id, user_id, timeframe="today"):
         return "An error occurred while fetching your overdue goals. Please try again later.", None, None, None
         
 
+# Which overdue goals the warning is about: for the daily warning, goals more than 24 hours overdue; when triggered in a
+# chat, all overdue ones
+OVERDUE_CUTOFFS = {
+    "older": "NOW() - INTERVAL '1 day'",
+    "overdue": "NOW()",
+}
+
+
+async def fetch_overdue_goals_by_user(timeframe="older", chat_id=None):
+    """
+    The overdue pending goals of every user (or of every user in one chat) in one query, instead of a
+    fetch_overdue_goals() per user.
+
+    Returns:
+        list: One dict per user with user_id, chat_id, first_name and their goal rows ("goals"), ordered by chat. With a
+        chat_id, users without overdue goals are included too (with no goals).
+    """
+    query = f'''
+        SELECT
+            u.user_id, u.chat_id, u.first_name,
+            g.goal_id, g.goal_description, g.deadline, g.goal_value, g.penalty, g.reminder_scheduled, g.final_iteration
+        FROM manon_users u
+        {"LEFT JOIN" if chat_id else "JOIN"} manon_goals g
+            ON g.user_id = u.user_id
+            AND g.chat_id = u.chat_id
+            AND g.status = 'pending'
+            AND g.deadline <= {OVERDUE_CUTOFFS[timeframe]}
+        {"WHERE u.chat_id = $1" if chat_id else ""}
+        ORDER BY u.chat_id, u.user_id, g.deadline ASC
+    '''
+    async with Database.acquire() as conn:
+        rows = await conn.fetch(query, *([chat_id] if chat_id else []))
+
+    users = {}
+    for row in rows:
+        user = users.setdefault((row["chat_id"], row["user_id"]), {
+            "user_id": row["user_id"], "chat_id": row["chat_id"], "first_name": row["first_name"], "goals": [],
+        })
+        if row["goal_id"] is not None:
+            user["goals"].append(row)
+    logger.info(f"Fetched {sum(len(user['goals']) for user in users.values())} overdue goals ({timeframe}) of {len(users)} users")
+    return list(users.values())
+
+
 async def fail_goals_warning(bot, chat_id=None):
-    delete_all_expired_goals = False
+    delete_all_expired_goals = bool(chat_id)
     try:
-        async with Database.acquire() as conn:
-            # Fetch all unique user_id/chat_id pairs
-            if not chat_id:
-                users = await conn.fetch("SELECT user_id, chat_id, first_name FROM manon_users")
-            else: 
-                delete_all_expired_goals = True
-                users = await conn.fetch(f"SELECT user_id, first_name FROM manon_users WHERE chat_id = {chat_id}")  # Like this, with the unparameterized SQL query, the code could be susceptible to SQL injection attacks #security. Could be fun to try to hack myself
+        # 1. All users' overdue goals: >24hs old ones (or all overdue goals of the chat, if trigger-word-triggered)
+        users = await fetch_overdue_goals_by_user(timeframe="overdue" if chat_id else "older", chat_id=chat_id)
         warning_emojis = ["⚠️", "👮‍♀️"]
         random_emoji = random.choice(warning_emojis)
         if random.random() < 0.02:
@@ -236,18 +289,15 @@ async def fail_goals_warning(bot, chat_id=None):
         day_reference = "tomorrow" if ultimatum_time.date() > now.date() else "today"
         logger.info(f'ultimatum time for automatic goal_archival set for {ultimatum_time}')
         formatted_ultimatum_time = ultimatum_time.strftime('%H:%M')
+        warned_goal_ids = []
 
-        # 2. Loop through each user row and send a personalized message
+        # 2. Loop through each user and send a personalized message
         for user in users:
             user_id = user["user_id"]
-            user_chat_id = chat_id if chat_id else user["chat_id"]
-            if chat_id:
-                overdue_goals, _, _, goals_count = await fetch_overdue_goals(user_chat_id, user_id, timeframe="overdue")   # all overdue goals
-            elif not chat_id:
-                user_chat_id = user["chat_id"]
-                overdue_goals, _, _, goals_count = await fetch_overdue_goals(user_chat_id, user_id, timeframe="older")   # overdue for more than 24 hours
+            user_chat_id = user["chat_id"]
+            overdue_goals = [format_overdue_goal(row, now) for row in user["goals"]]
+            goals_count = len(overdue_goals)
             first_name = user["first_name"] or "Katja"  # Fallback if first_name is NULL or empt
-            # 3. Check any >24hs old overdue goals (or all overdue goals, if trigger-word-triggered)
              
             logging.debug(f"overdue goals for user_id {user_id}: {overdue_goals}")
             if not overdue_goals and delete_all_expired_goals:
@@ -261,17 +311,13 @@ async def fail_goals_warning(bot, chat_id=None):
                 )     
                 if delete_all_expired_goals:
                     greeting.replace("older ", "")
-                # 4. send messages
+                # 3. send messages
                 if random.random() < 0.0273972603:  # once per year if triggered every 10 days
                     greeting += "\n_Oh yeah, and also: mindfulness could be a great option right now. \n\nSame goes for right now, by the way"
                 try:
                     await bot.send_message(user_chat_id, random_emoji)
                     await bot.send_message(user_chat_id, greeting, parse_mode="Markdown")
                     for goal in overdue_goals:
-                        logger.warning(f"Overdue goals for user_id {user_id}: {overdue_goals}")
-
-                        if not isinstance(goal, dict) or "text" not in goal or "buttons" not in goal:
-                            continue
                         await asyncio.sleep(1)
                         await bot.send_message(
                             chat_id=user_chat_id,
@@ -279,54 +325,80 @@ async def fail_goals_warning(bot, chat_id=None):
                             reply_markup=goal["buttons"],
                             parse_mode="Markdown" 
                         )
-                        
-                        # Extract goal_id from the callback_data of the first button
-                        try:
-                            first_button = goal["buttons"].inline_keyboard[0][0]  # First row, first button
-                            callback_data = first_button.callback_data
-                            goal_id = int(callback_data.split('_')[-1])  # Assuming goal_id is after the last '_'
-                        except (AttributeError, IndexError, ValueError) as e:
-                            logger.error(f"Failed to extract 'goal_id' from goal: {goal}, error: {e}")
-                            continue
-                        
-                        # Extract hour and minute for the CronTrigger, then schedule archiving/penalizing job
-                        ultimatum_hour = ultimatum_time.hour
-                        ultimatum_minute = ultimatum_time.minute
-                        scheduler.add_job(
-                            scheduled_goal_archival, 
-                            DateTrigger(run_date=ultimatum_time),
-                            args=[bot, goal_id, ultimatum_time, delete_all_expired_goals],
-                            misfire_grace_time=3600,
-                            coalesce=True
-                        )
+                        warned_goal_ids.append(goal["goal_id"])     # archived at the ultimatum, unless reported by then
                     if not chat_id:
                         logger.info(f"Daily older overdue goals warning message sent successfully in chat {user_chat_id} for {first_name}({user_id}).")
                     elif chat_id:
                         logger.info(f"Trigger-word-triggered older overdue goals warning message sent successfully in chat {chat_id} for {first_name}({user_id}).")
                 except Exception as e:
                     logger.error(f"Error sending overdue goals warning message to chat_id {chat_id}: {e}")
+
+        # 4. One archiving/penalizing job for all of them
+        if warned_goal_ids:
+            await schedule_goal_archival(warned_goal_ids, ultimatum_time, delete_all_expired_goals)
             
     except Exception as e:
         logger.error(f"Error sending overdue goals warning message: {e}")
 
 
-async def scheduled_goal_archival(bot, goal_id, ultimatum_time, delete_all_expired_goals):
+async def schedule_goal_archival(goal_ids, ultimatum_time, delete_all_expired_goals):
+    """
+    Schedule the archival of warned goals at their ultimatum: one job per ultimatum time, however many goals. Goals of
+    another warning with the same ultimatum (to the minute) are added to the existing job, also when that one was
+    persisted by another instance (this one may not be the leader, see utils/job_store.py).
+    """
+    job_id = f"goalarchival_{ultimatum_time:%Y%m%d_%H%M}{'_triggered' if delete_all_expired_goals else ''}"
+    existing = await durable_jobstore.fetch_job(job_id)
+    if existing:
+        goal_ids = sorted(set(existing.args[0]) | set(goal_ids))
+    scheduler.add_job(
+        scheduled_goal_archival_job,
+        DateTrigger(run_date=ultimatum_time),
+        args=[list(goal_ids), ultimatum_time, delete_all_expired_goals],
+        id=job_id,
+        name=f"Archive {len(goal_ids)} overdue goal{'s' if len(goal_ids) != 1 else ''}",
+        jobstore=DURABLE_JOBSTORE,
+        replace_existing=True,
+        misfire_grace_time=3600,
+        coalesce=True
+    )
+    logger.info(f"Scheduled archival of {len(goal_ids)} overdue goals at {ultimatum_time}")
+
+
+async def scheduled_goal_archival(bot, goal_ids, ultimatum_time, delete_all_expired_goals):
     try:
-        logger.info(f'Archiving goal {goal_id}')
-        status = await fetch_goal_data(goal_id, columns="status", single_value=True)
-        if status == "pending":     # only needs to be actually run if the user didn't report anything after the warning
-            update = 1.5 
-            await handle_goal_failure(update, goal_id, query=None, bot=bot, delete_all_expired_goals=delete_all_expired_goals)
-        else:
-            logger.info(f"Goal #{goal_id} was not archived at {ultimatum_time}, because it was not pending anymore (user processed it themselves)")
+        # Fails only the goals that are still pending: the user didn't report anything after the warning
+        archived = await fail_pending_goals(goal_ids)
+        logger.info(f"Archived {len(archived)} of {len(goal_ids)} warned goals at {ultimatum_time}, the others were processed by their users")
+        for goal in archived:
+            try:
+                await bot.send_message(
+                    goal["chat_id"],
+                    text=archived_goal_text(goal, delete_all_expired_goals),
+                    reply_markup=None,
+                    parse_mode="Markdown"
+                )
+            except Exception as e:
+                logger.error(f"Couldn't send archival message for goal #{goal['goal_id']}: {e}")
     except Exception as e:
-        logger.error(f"Error in schedule_goal_deletion(): {e}")
+        logger.error(f"Error in scheduled_goal_archival(): {e}")
+
+
+async def scheduled_goal_archival_job(goal_ids, ultimatum_time, delete_all_expired_goals):
+    """scheduled_goal_archival for the durable job store, which can't pickle the bot"""
+    if isinstance(goal_ids, int):   # a job from before archival jobs were per ultimatum time
+        goal_ids = [goal_ids]
+    await scheduled_goal_archival(get_bot(), goal_ids, ultimatum_time, delete_all_expired_goals)
 
 
 async def send_next_jobs(update, context, N=5):
     """
-    Function to send the next N jobs in chat (triggered by trigger text)
+    Function to send the next N jobs in chat, and how the jobs have been running (triggered by trigger text)
     """
+    if not leader_election.is_leader:   # the scheduler only runs in the leader instance
+        await update.message.reply_text(f"{leader_election.status()} {PA}")
+        return
+
     jobs = scheduler.get_jobs()  # Fetch all scheduled jobs
     jobs.sort(key=lambda job: job.next_run_time)  # Sort by next run time
 
@@ -344,3 +416,5 @@ async def send_next_jobs(update, context, N=5):
     # Send the job list as a message
     job_list_text = "\n".join(job_details)
     await update.message.reply_text(f"{PA} Here are the next scheduled jobs:\n\n{job_list_text}", parse_mode="Markdown")
+    # And how the jobs have been running
+    await update.message.reply_text(f"{leader_election.status()}\n\n{job_metrics.summary()}")
@@ -3,11 +3,17 @@ import re, logging
 from pprint import pformat
 
 from LLMs.config import shared_state
+from LLMs.speculation import speculation_stats
+from LLMs.response_cache import llm_response_cache
+from LLMs.router import llm_router
 from features.evening_message import send_evening_message
+from features.reminders.dispatcher import reminder_dispatcher
 from features.morning_message import send_morning_message
 from features.stats.stats_manager import StatsManager
 from telegram_helpers.delete_message import delete_message, add_delete_button
 from telegram_helpers.emoji_reactions import test_emojis_with_telegram
+from telegram_helpers.message_streamer import streaming_stats
+from telegram_helpers.update_processor import PerChatUpdateProcessor, format_update_processor_metrics
 from logger.logger import fetch_logs
 from features.stopwatch.command import emoji_stopwatch
 from utils.scheduler import fail_goals_warning, send_next_jobs
@@ -19,7 +25,7 @@ logger = logging.getLogger(__name__)
 
 triggers = ["SeintjeNatuurlijk", "OpenAICall", "Emoji", "Stopwatch", "usercontext", "clearcontext",
             "koffie", "coffee", "!test", "pomodoro", "tea", "gm", "gn", "resolve", "dailystats",
-            "logger", "logs100", "errorlogs", "transparant_on", "transparant_off", "Jobs"]
+            "logger", "logs100", "errorlogs", "transparant_on", "transparant_off", "Jobs", "Queues", "Speculation", "LLMCache", "Streaming", "Router", "Reminders"]
 
 
 async def handle_triggers(update, context, trigger_text):
@@ -78,6 +84,22 @@ async def handle_triggers(update, context, trigger_text):
         await update.message.reply_text(f"_transparant mode disabled 🔴_ {PA}\n_(no additional logger in chat  )_", parse_mode="Markdown")
     elif trigger_text == "Jobs":
         await send_next_jobs(update, context, 7)
+    elif trigger_text == "Queues":
+        processor = context.application.update_processor
+        if isinstance(processor, PerChatUpdateProcessor):
+            await update.message.reply_text(format_update_processor_metrics(processor.get_metrics()))
+        else:
+            await update.message.reply_text(f"Updates are processed sequentially, no queues to show {PA}")
+    elif trigger_text == "Speculation":
+        await update.message.reply_text(speculation_stats.summary())
+    elif trigger_text == "LLMCache":
+        await update.message.reply_text(llm_response_cache.summary())
+    elif trigger_text == "Streaming":
+        await update.message.reply_text(streaming_stats.summary())
+    elif trigger_text == "Router":
+        await update.message.reply_text(llm_router.summary())
+    elif trigger_text == "Reminders":
+        await update.message.reply_text(reminder_dispatcher.stats.summary())
 
 
 async def handle_preset_triggers(update, context, user_message):
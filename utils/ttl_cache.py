@@ -0,0 +1,73 @@
+# utils/ttl_cache.py
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """
+    Small in-memory cache for async fetches (price feeds, forecasts, ...).
+
+    - Values expire after a ttl (seconds) or at an explicit expires_at (time.time() timestamp).
+    - Request coalescing: concurrent callers that miss on the same key await one shared in-flight fetch.
+    - Failed fetches are not cached; the exception propagates to every waiting caller.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._values = {}       # key -> (value, expires_at)
+        self._in_flight = {}    # key -> asyncio.Task
+        self.hits = 0
+        self.misses = 0
+
+    def peek(self, key):
+        """Returns the cached value if still fresh, else None (never fetches)."""
+        entry = self._values.get(key)
+        if entry and entry[1] > time.time():
+            return entry[0]
+        return None
+
+    def put(self, key, value, ttl: float = None, expires_at: float = None):
+        """Publishes a value into the cache, e.g. from a background monitor that fetched it anyway."""
+        self._values[key] = (value, expires_at if expires_at is not None else time.time() + ttl)
+
+    def invalidate(self, key=None):
+        if key is None:
+            self._values.clear()
+        else:
+            self._values.pop(key, None)
+
+    async def get(self, key, fetch, ttl: float = None, expires_at=None, force_refresh=False):
+        """
+        Returns the cached value for key, or awaits fetch() (shared by all concurrent callers) and caches its result.
+
+        Args:
+            key: Cache key.
+            fetch: Zero-argument coroutine function producing the value.
+            ttl (float): Seconds the fetched value stays fresh.
+            expires_at: Alternatively a callable (value -> timestamp) deciding when the value goes stale.
+            force_refresh (bool): Skip the cached value (still joins a fetch that's already in flight).
+        """
+        if not force_refresh:
+            value = self.peek(key)
+            if value is not None:
+                self.hits += 1
+                return value
+
+        task = self._in_flight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.create_task(self._fetch_and_store(key, fetch, ttl, expires_at))
+            self._in_flight[key] = task
+        # shield: one impatient caller being cancelled mustn't cancel the fetch the others are waiting for
+        return await asyncio.shield(task)
+
+    async def _fetch_and_store(self, key, fetch, ttl, expires_at):
+        try:
+            value = await fetch()
+            self.put(key, value, ttl=ttl, expires_at=expires_at(value) if expires_at else None)
+            return value
+        finally:
+            self._in_flight.pop(key, None)